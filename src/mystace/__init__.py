@@ -14,17 +14,31 @@ Typical usage: ::
     'Hello my name is -> Anahit <-!'
 """
 
+from mystace.bytecode import BytecodeMustacheRenderer
+from mystace.compiler import CompiledMustacheRenderer
 from mystace.exceptions import (
     DelimiterError,
     MissingClosingTagError,
     MystaceError,
+    SerializationError,
     StrayClosingTagError,
+    TemplateNotFoundError,
 )
+from mystace.incremental import EditableTemplate
+from mystace.loader import Environment, FileSystemLoader
 from mystace.mustache_tree import (
+    CacheInfo,
+    Columns,
+    EscapeMemo,
     MustacheRenderer,
+    RendererCache,
+    TemplateInfo,
     create_mustache_tree,
     render_from_template,
+    renderer_cache,
 )
+from mystace.parallel import ParallelRenderer, render_parallel
+from mystace.session import RenderSession
 from mystace.tokenize import mustache_tokenizer
 
 try:
@@ -38,8 +52,24 @@ __all__ = [
     "DelimiterError",
     "MissingClosingTagError",
     "StrayClosingTagError",
+    "SerializationError",
+    "TemplateNotFoundError",
     "create_mustache_tree",
     "render_from_template",
+    "renderer_cache",
+    "RendererCache",
+    "CacheInfo",
     "MustacheRenderer",
+    "CompiledMustacheRenderer",
+    "BytecodeMustacheRenderer",
     "mustache_tokenizer",
+    "ParallelRenderer",
+    "render_parallel",
+    "Environment",
+    "FileSystemLoader",
+    "TemplateInfo",
+    "Columns",
+    "EscapeMemo",
+    "EditableTemplate",
+    "RenderSession",
 ]
@@ -0,0 +1,264 @@
+"""
+Bytecode render backend.
+
+Flattens a `MustacheTreeNode` tree into an array of instructions once, then
+renders with a single index-based loop. Sections become a jump over their
+body when falsy and a loop instruction at their end that moves on to the
+next item, so rendering allocates per section item rather than per node.
+"""
+
+from __future__ import annotations
+
+import typing as t
+
+from .mustache_tree import (
+    _ESCAPE_BATCH_SIZE,
+    _SECTION_LIST_TYPES,
+    ContextNode,
+    ContextObjT,
+    MustacheRenderer,
+    MustacheTreeNode,
+    TagType,
+)
+from .util import html_escape, html_escape_parts
+
+# Opcodes. Arguments live in a parallel array at the same index.
+OP_TEXT = 0  # Output the literal argument
+OP_VARIABLE = 1  # Output the escaped value of the resolver argument
+OP_VARIABLE_RAW = 2  # Output the value of the resolver argument
+OP_SECTION = 3  # (resolver, end) - jump to end if falsy, else start a loop
+OP_LOOP = 4  # Body start - continue with the next item, or end the loop
+OP_INVERTED = 5  # (resolver, end) - jump to end if truthy
+OP_PARTIAL = 6  # (name, offset) - run the partial's program
+
+ProgramT = t.Tuple[t.List[int], t.List[t.Any]]
+
+
+def compile_program(mustache_tree: MustacheTreeNode) -> ProgramT:
+    """Flatten a template tree into parallel opcode and argument arrays."""
+    ops: t.List[int] = []
+    args: t.List[t.Any] = []
+    ops_append = ops.append  # Cache method lookup
+    args_append = args.append  # Cache method lookup
+
+    assert mustache_tree.children is not None
+    # Items are (node, index of the section instruction to close, or -1)
+    work_stack: t.List[t.Tuple[MustacheTreeNode, int]] = [
+        (child, -1) for child in reversed(mustache_tree.children)
+    ]
+
+    while work_stack:
+        curr_node, section_start = work_stack.pop()
+        tag_type = curr_node.tag_type
+
+        if section_start != -1:
+            # Close the section now that its body has been emitted
+            if tag_type is TagType.SECTION:
+                ops_append(OP_LOOP)
+                args_append(section_start + 1)
+            args[section_start] = (curr_node.resolver, len(ops))
+
+        elif tag_type is TagType.LITERAL:
+            ops_append(OP_TEXT)
+            args_append(curr_node.data)
+
+        elif tag_type is TagType.VARIABLE:
+            ops_append(OP_VARIABLE)
+            args_append(curr_node.resolver)
+
+        elif tag_type is TagType.VARIABLE_RAW:
+            ops_append(OP_VARIABLE_RAW)
+            args_append(curr_node.resolver)
+
+        elif tag_type is TagType.SECTION or tag_type is TagType.INVERTED_SECTION:
+            assert curr_node.children is not None
+            work_stack.append((curr_node, len(ops)))
+            work_stack.extend((child, -1) for child in reversed(curr_node.children))
+            ops_append(OP_SECTION if tag_type is TagType.SECTION else OP_INVERTED)
+            # Patched with the end of the section once it's closed
+            args_append(None)
+
+        elif tag_type is TagType.PARTIAL:
+            ops_append(OP_PARTIAL)
+            args_append((curr_node.data, curr_node.offset))
+
+    return ops, args
+
+
+class BytecodeMustacheRenderer(MustacheRenderer):
+    """
+    A `MustacheRenderer` that flattens its template into an instruction
+    array on construction and renders with an index-based loop. Renders
+    produce the same output as the tree engine.
+    """
+
+    __slots__ = ("program", "_partial_programs")
+
+    program: ProgramT
+    # Programs of partials by name and indentation, compiled on first use
+    _partial_programs: t.Dict[t.Tuple[str, int], t.Optional[ProgramT]]
+
+    def __init__(
+        self,
+        mustache_tree: MustacheTreeNode,
+        partials_dict: t.Optional[t.Mapping[str, MustacheTreeNode]] = None,
+        source_hash: t.Optional[bytes] = None,
+    ) -> None:
+        super().__init__(mustache_tree, partials_dict, source_hash)
+
+        self.program = compile_program(self.mustache_tree)
+        self._partial_programs = {}
+
+    def _get_partial_program(self, name: str, offset: int) -> t.Optional[ProgramT]:
+        key = (name, offset)
+        partial_programs = self._partial_programs
+        if key in partial_programs:
+            return partial_programs[key]
+
+        partial_tree = self._get_partial(name, offset)
+        program = None if partial_tree is None else compile_program(partial_tree)
+        # Racing threads may both compile, which is harmless
+        partial_programs[key] = program
+        return program
+
+    def _render_chunks(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+        chunk_size: int,
+    ) -> t.Iterator[str]:
+        res_list: t.List[str] = []
+        res_list_append = res_list.append  # Cache method lookup
+        res_list_clear = res_list.clear  # Cache method lookup
+        get_partial_program = self._get_partial_program  # Cache method lookup
+        root_ops, root_args = self.program
+
+        # Escaped values are left raw until the built-in escaper runs over a
+        # batch of them at once, by chunk or by `_ESCAPE_BATCH_SIZE` values
+        batch_escape = html_escape_fn is html_escape
+        escape_positions: t.List[int] = []
+        escape_positions_append = escape_positions.append  # Cache method lookup
+        escape_positions_clear = escape_positions.clear  # Cache method lookup
+
+        # Open section loops as [items, index, context outside the section]
+        loops: t.List[t.List[t.Any]] = []
+        # Where to resume once a partial's program ends
+        returns: t.List[t.Tuple[t.List[int], t.List[t.Any], int]] = []
+
+        for data in datas:
+            res_len = 0  # Characters in res_list since the last chunk
+            context = ContextNode(data)
+            ops = root_ops
+            args = root_args
+            num_ops = len(ops)
+            pc = 0
+
+            while True:
+                if pc == num_ops:
+                    if not returns:
+                        break
+                    ops, args, pc = returns.pop()
+                    num_ops = len(ops)
+                    continue
+
+                op = ops[pc]
+
+                if op == OP_TEXT:
+                    literal_data = args[pc]
+                    res_list_append(literal_data)
+                    res_len += len(literal_data)
+                    pc += 1
+
+                    if res_len >= chunk_size:
+                        if escape_positions:
+                            html_escape_parts(res_list, escape_positions)
+                            escape_positions_clear()
+                        yield "".join(res_list)
+                        res_list_clear()
+                        res_len = 0
+
+                elif op == OP_VARIABLE or op == OP_VARIABLE_RAW:
+                    variable_content = args[pc](context)
+                    pc += 1
+                    if variable_content is None:
+                        continue
+
+                    str_content = stringify(variable_content)
+                    # Skip ahead if we get the empty string
+                    if not str_content:
+                        continue
+                    if op == OP_VARIABLE:
+                        if batch_escape:
+                            if len(escape_positions) == _ESCAPE_BATCH_SIZE:
+                                html_escape_parts(res_list, escape_positions)
+                                escape_positions_clear()
+                            escape_positions_append(len(res_list))
+                        else:
+                            str_content = html_escape_fn(str_content)
+
+                    res_list_append(str_content)
+                    res_len += len(str_content)
+
+                    if res_len >= chunk_size:
+                        if escape_positions:
+                            html_escape_parts(res_list, escape_positions)
+                            escape_positions_clear()
+                        yield "".join(res_list)
+                        res_list_clear()
+                        res_len = 0
+
+                elif op == OP_LOOP:
+                    loop = loops[-1]
+                    index = loop[1] + 1
+                    items = loop[0]
+
+                    if index < len(items):
+                        loop[1] = index
+                        context = ContextNode(items[index], loop[2])
+                        pc = args[pc]
+                    else:
+                        loops.pop()
+                        context = loop[2]
+                        pc += 1
+
+                elif op == OP_SECTION:
+                    resolver, section_end = args[pc]
+                    new_context = resolver(context)
+
+                    # If lookup is "falsy", no need to open the section
+                    if not new_context:
+                        pc = section_end
+                        continue
+
+                    items = (
+                        new_context
+                        if isinstance(new_context, _SECTION_LIST_TYPES)
+                        else (new_context,)
+                    )
+                    loops.append([items, 0, context])
+                    context = ContextNode(items[0], context)
+                    pc += 1
+
+                elif op == OP_INVERTED:
+                    resolver, section_end = args[pc]
+                    pc = section_end if resolver(context) else pc + 1
+
+                else:
+                    name, offset = args[pc]
+                    pc += 1
+                    program = get_partial_program(name, offset)
+
+                    if program is None:
+                        continue
+
+                    returns.append((ops, args, pc))
+                    ops, args = program
+                    num_ops = len(ops)
+                    pc = 0
+
+            if escape_positions:
+                html_escape_parts(res_list, escape_positions)
+                escape_positions_clear()
+            yield "".join(res_list)
+            res_list_clear()
@@ -0,0 +1,431 @@
+"""
+Code-generating render backend.
+
+Translates a `MustacheTreeNode` tree (and the trees of its partials) into
+Python source once, then renders by calling the generated function. Literals
+become constants, single-segment lookups get an inlined dict fast path and
+sections become real `for` loops, so none of the per-node dispatch of
+`MustacheRenderer.render` happens at render time.
+"""
+
+from __future__ import annotations
+
+import typing as t
+
+from .mustache_tree import (
+    _SECTION_LIST_TYPES,
+    ContextNode,
+    ContextObjT,
+    MustacheRenderer,
+    MustacheTreeNode,
+    ResolverT,
+    TagType,
+)
+from .util import html_escape
+
+RenderFnT = t.Callable[
+    [ContextNode, t.Callable[[str], None], t.Callable, t.Callable], None
+]
+# Returns the compiled function of a partial by name and indentation, or None
+# if there is no such partial
+GetPartialFnT = t.Callable[[str, int], t.Optional[t.Callable[..., t.Any]]]
+
+# Fragments the streaming variant collects before handing control back
+_STREAM_BATCH = 64
+
+# Python refuses more than 20 statically nested blocks in one function, so
+# sections nested deeper than this are spilled into helper functions.
+_MAX_INLINE_DEPTH = 8
+
+
+class _CodeGenerator:
+    """
+    Emits one Python function per template tree. Deeply nested sections get
+    their own functions, all sharing the signature
+    `(ctx, append, stringify, escape)`. Partials are compiled separately,
+    per name and indentation, when first reached.
+
+    In streaming mode the functions are generators taking the output list
+    instead of its append method, and yield whenever it holds at least
+    `_STREAM_BATCH` fragments. Calls between them use `yield from`.
+    """
+
+    __slots__ = (
+        "lines",
+        "func_counter",
+        "resolver_names",
+        "partial_vars",
+        "get_partial_fn",
+        "scope_vars",
+        "namespace",
+        "streaming",
+        "sink_var",
+        "call_prefix",
+    )
+
+    lines: t.List[str]
+    func_counter: int
+    resolver_names: t.Dict[ResolverT, str]
+    # Globals holding the function of each partial by name and indentation,
+    # bound when first reached
+    partial_vars: t.Dict[t.Tuple[str, int], str]
+    get_partial_fn: GetPartialFnT
+    # Variables holding the data of each scope open in the function being
+    # generated, innermost last
+    scope_vars: t.List[str]
+    # Objects the generated code refers to by name
+    namespace: t.Dict[str, t.Any]
+    streaming: bool
+    sink_var: str
+    call_prefix: str
+
+    def __init__(self, get_partial_fn: GetPartialFnT, streaming: bool) -> None:
+        self.lines = []
+        self.func_counter = 0
+        self.resolver_names = {}
+        self.partial_vars = {}
+        self.get_partial_fn = get_partial_fn
+        self.scope_vars = []
+        self.namespace = {
+            "ContextNode": ContextNode,
+            "_SECTION_LIST_TYPES": _SECTION_LIST_TYPES,
+        }
+        self.streaming = streaming
+        self.sink_var = "parts" if streaming else "append"
+        self.call_prefix = "yield from " if streaming else ""
+
+    def add_function(self, func_name: str, nodes: t.List[MustacheTreeNode]) -> None:
+        """Generate a whole function for the given nodes."""
+        body: t.List[str] = []
+        outer_scope_vars = self.scope_vars
+        self.scope_vars = ["data"]
+        self._emit_nodes(body, nodes, "ctx", "data", 1)
+        self.scope_vars = outer_scope_vars
+        self.lines.append(f"def {func_name}(ctx, {self.sink_var}, stringify, escape):")
+        if self.streaming:
+            self.lines.append("    append = parts.append")
+        self.lines.append("    data = ctx.context")
+        self.lines.extend(body)
+        if self.streaming:
+            # Also guarantees that every function is a generator
+            self._emit_yield_check(self.lines, "    ")
+        else:
+            self.lines.append("    pass")
+        self.lines.append("")
+
+    def _emit_yield_check(self, out: t.List[str], pad: str) -> None:
+        if self.streaming:
+            out.append(f"{pad}if len(parts) >= {_STREAM_BATCH}: yield")
+
+    def _resolver_name(self, node: MustacheTreeNode) -> str:
+        resolver = node.resolver
+        assert resolver is not None
+        resolver_name = self.resolver_names.get(resolver)
+        if resolver_name is None:
+            resolver_name = f"_resolve_{len(self.resolver_names)}"
+            self.resolver_names[resolver] = resolver_name
+            self.namespace[resolver_name] = resolver
+        return resolver_name
+
+    def _partial_var(self, node: MustacheTreeNode) -> str:
+        key = (node.data, node.offset)
+        partial_var = self.partial_vars.get(key)
+        if partial_var is not None:
+            return partial_var
+
+        partial_var = f"_partial_{len(self.partial_vars)}"
+        self.partial_vars[key] = partial_var
+        namespace = self.namespace
+        get_partial_fn = self.get_partial_fn
+        namespace[partial_var] = None
+
+        def load_partial() -> t.Optional[t.Callable[..., t.Any]]:
+            partial_fn = get_partial_fn(*key)
+            namespace[partial_var] = partial_fn
+            return partial_fn
+
+        namespace[f"_load{partial_var}"] = load_partial
+        return partial_var
+
+    def _emit_lookup(
+        self,
+        out: t.List[str],
+        pad: str,
+        node: MustacheTreeNode,
+        ctx_var: str,
+        data_var: str,
+    ) -> None:
+        name = node.data
+        if name == ".":
+            out.append(f"{pad}value = {data_var}")
+            return
+
+        resolver_name = self._resolver_name(node)
+        scope = node.scope
+        if "." in name:
+            out.append(f"{pad}value = {resolver_name}({ctx_var})")
+        elif 0 < scope < len(self.scope_vars):
+            # Index the scope the schema binds the name to, guarded in case
+            # the data doesn't match the schema, including by an inner scope
+            # shadowing the name
+            scope_var = self.scope_vars[-1 - scope]
+            guards = "".join(
+                f" and type({inner_var}) is dict and {name!r} not in {inner_var}"
+                for inner_var in self.scope_vars[-scope:]
+            )
+            out.append(
+                f"{pad}value = {scope_var}[{name!r}] if type({scope_var}) is dict "
+                f"and {name!r} in {scope_var}{guards} else {resolver_name}({ctx_var})"
+            )
+        else:
+            # Inline the common case of the name living in the innermost scope.
+            out.append(
+                f"{pad}value = {data_var}[{name!r}] if type({data_var}) is dict "
+                f"and {name!r} in {data_var} else {resolver_name}({ctx_var})"
+            )
+
+    def _emit_nodes(
+        self,
+        out: t.List[str],
+        nodes: t.List[MustacheTreeNode],
+        ctx_var: str,
+        data_var: str,
+        depth: int,
+    ) -> None:
+        pad = "    " * depth
+
+        for node in nodes:
+            tag_type = node.tag_type
+
+            if tag_type is TagType.LITERAL:
+                out.append(f"{pad}append({node.data!r})")
+                self._emit_yield_check(out, pad)
+
+            elif tag_type is TagType.VARIABLE or tag_type is TagType.VARIABLE_RAW:
+                self._emit_lookup(out, pad, node, ctx_var, data_var)
+                out.append(f"{pad}if value is not None:")
+                out.append(f"{pad}    value = stringify(value)")
+                out.append(f"{pad}    if value:")
+                if tag_type is TagType.VARIABLE:
+                    out.append(f"{pad}        append(escape(value))")
+                else:
+                    out.append(f"{pad}        append(value)")
+                self._emit_yield_check(out, pad + "        ")
+
+            elif tag_type is TagType.SECTION or tag_type is TagType.INVERTED_SECTION:
+                if depth >= _MAX_INLINE_DEPTH:
+                    self._emit_spilled_section(out, pad, node, ctx_var)
+                else:
+                    self._emit_section(out, pad, node, ctx_var, data_var, depth)
+
+            elif tag_type is TagType.PARTIAL:
+                # Partials are compiled with their indentation applied, as
+                # the tree engine renders them
+                partial_var = self._partial_var(node)
+                out.append(f"{pad}partial_fn = {partial_var} or _load{partial_var}()")
+                out.append(f"{pad}if partial_fn is not None:")
+                out.append(
+                    f"{pad}    {self.call_prefix}partial_fn({ctx_var}, "
+                    f"{self.sink_var}, stringify, escape)"
+                )
+
+    def _emit_section(
+        self,
+        out: t.List[str],
+        pad: str,
+        node: MustacheTreeNode,
+        ctx_var: str,
+        data_var: str,
+        depth: int,
+    ) -> None:
+        assert node.children is not None
+        self._emit_lookup(out, pad, node, ctx_var, data_var)
+
+        if node.tag_type is TagType.INVERTED_SECTION:
+            out.append(f"{pad}if not value:")
+            body_start = len(out)
+            self._emit_nodes(out, node.children, ctx_var, data_var, depth + 1)
+            if len(out) == body_start:
+                out.append(f"{pad}    pass")
+            return
+
+        item_var = f"data{depth}"
+        child_ctx_var = f"ctx{depth}"
+        out.append(f"{pad}if value:")
+        out.append(
+            f"{pad}    for {item_var} in "
+            "(value if isinstance(value, _SECTION_LIST_TYPES) else (value,)):"
+        )
+        out.append(f"{pad}        {child_ctx_var} = ContextNode({item_var}, {ctx_var})")
+        self.scope_vars.append(item_var)
+        self._emit_nodes(out, node.children, child_ctx_var, item_var, depth + 2)
+        self.scope_vars.pop()
+
+    def _emit_spilled_section(
+        self,
+        out: t.List[str],
+        pad: str,
+        node: MustacheTreeNode,
+        ctx_var: str,
+    ) -> None:
+        self.func_counter += 1
+        func_name = f"_section_{self.func_counter}"
+
+        self.add_function(func_name, [node])
+
+        out.append(
+            f"{pad}{self.call_prefix}{func_name}({ctx_var}, "
+            f"{self.sink_var}, stringify, escape)"
+        )
+
+
+def generate_source(
+    mustache_tree: MustacheTreeNode,
+    get_partial_fn: GetPartialFnT,
+    streaming: bool = False,
+) -> t.Tuple[str, t.Dict[str, t.Any]]:
+    """
+    Generate the Python source for a template tree, along with the namespace
+    it must be executed in. The entry point of the generated module is called
+    `_render_root`. Partial tags get their function from `get_partial_fn`,
+    by the partial's name and indentation, the first time they are reached.
+    """
+    generator = _CodeGenerator(get_partial_fn, streaming)
+
+    assert mustache_tree.children is not None
+    generator.add_function("_render_root", mustache_tree.children)
+
+    return "\n".join(generator.lines), generator.namespace
+
+
+def _exec_source(source: str, namespace: t.Dict[str, t.Any]) -> t.Any:
+    exec(compile(source, "<mystace-compiled>", "exec"), namespace)
+    return namespace["_render_root"]
+
+
+class CompiledMustacheRenderer(MustacheRenderer):
+    """
+    A `MustacheRenderer` that compiles its template into a Python function
+    on construction. Renders produce the same output as the tree engine
+    for all spec-compliant templates.
+    """
+
+    __slots__ = ("source", "_render_fn", "_stream_fn", "_partial_fns")
+
+    source: str
+    _render_fn: RenderFnT
+    # Generator variant used for streaming, compiled on first use
+    _stream_fn: t.Optional[t.Callable[..., t.Generator[None, None, None]]]
+    # Functions of partials by name, indentation and whether they stream,
+    # compiled on first use
+    _partial_fns: t.Dict[t.Tuple[str, int, bool], t.Optional[t.Callable[..., t.Any]]]
+
+    def __init__(
+        self,
+        mustache_tree: MustacheTreeNode,
+        partials_dict: t.Optional[t.Mapping[str, MustacheTreeNode]] = None,
+        source_hash: t.Optional[bytes] = None,
+    ) -> None:
+        super().__init__(mustache_tree, partials_dict, source_hash)
+
+        self._partial_fns = {}
+        self._stream_fn = None
+        self.source, namespace = generate_source(
+            self.mustache_tree, self._get_partial_fn
+        )
+        self._render_fn = _exec_source(self.source, namespace)
+
+    def _get_partial_fn(
+        self, name: str, offset: int
+    ) -> t.Optional[t.Callable[..., t.Any]]:
+        return self._compile_partial(name, offset, False)
+
+    def _get_partial_stream_fn(
+        self, name: str, offset: int
+    ) -> t.Optional[t.Callable[..., t.Any]]:
+        return self._compile_partial(name, offset, True)
+
+    def _compile_partial(
+        self, name: str, offset: int, streaming: bool
+    ) -> t.Optional[t.Callable[..., t.Any]]:
+        key = (name, offset, streaming)
+        partial_fns = self._partial_fns
+        if key in partial_fns:
+            return partial_fns[key]
+
+        partial_tree = self._get_partial(name, offset)
+        partial_fn = None
+        if partial_tree is not None:
+            partial_fn = _exec_source(
+                *generate_source(
+                    partial_tree,
+                    self._get_partial_stream_fn if streaming else self._get_partial_fn,
+                    streaming,
+                )
+            )
+
+        # Racing threads may both compile, which is harmless
+        partial_fns[key] = partial_fn
+        return partial_fn
+
+    def render(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> str:
+        res_list: t.List[str] = []
+        self._render_fn(ContextNode(data), res_list.append, stringify, html_escape_fn)
+        return "".join(res_list)
+
+    def _render_chunks(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+        chunk_size: int,
+    ) -> t.Iterator[str]:
+        if self._stream_fn is None:
+            stream_source, namespace = generate_source(
+                self.mustache_tree, self._get_partial_stream_fn, streaming=True
+            )
+            self._stream_fn = _exec_source(stream_source, namespace)
+
+        parts: t.List[str] = []
+        chunk_list: t.List[str] = []
+
+        for data in datas:
+            chunk_len = 0
+
+            for _ in self._stream_fn(
+                ContextNode(data), parts, stringify, html_escape_fn
+            ):
+                batch = "".join(parts)
+                parts.clear()
+                chunk_list.append(batch)
+                chunk_len += len(batch)
+
+                if chunk_len >= chunk_size:
+                    yield "".join(chunk_list)
+                    chunk_list.clear()
+                    chunk_len = 0
+
+            chunk_list.extend(parts)
+            parts.clear()
+            yield "".join(chunk_list)
+            chunk_list.clear()
+
+    def _render_outputs(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+    ) -> t.Iterator[str]:
+        res_list: t.List[str] = []
+        res_list_append = res_list.append
+        render_fn = self._render_fn
+
+        for data in datas:
+            render_fn(ContextNode(data), res_list_append, stringify, html_escape_fn)
+            yield "".join(res_list)
+            res_list.clear()
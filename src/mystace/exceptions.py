@@ -41,3 +41,20 @@ class StrayClosingTagError(MystaceError):
     """
 
     pass
+
+
+class SerializationError(MystaceError):
+    """
+    A serialized renderer can't be loaded, because it is stale, corrupt or
+    was written by an incompatible version.
+    """
+
+    pass
+
+
+class TemplateNotFoundError(MystaceError):
+    """
+    A template name can't be found by the loader.
+    """
+
+    pass
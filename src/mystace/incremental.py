@@ -0,0 +1,363 @@
+"""
+Incremental parsing of templates that are being edited.
+
+An `EditableTemplate` keeps the tree of a template in step with its source
+as text edits are applied. The source is split into blocks of whole lines
+that parse on their own, and an edit re-parses only the blocks it touches,
+splicing their new nodes into the tree in place. Large sections whose tags
+stand alone on their lines hold blocks of their own, so edits inside them
+stay local too.
+"""
+
+from __future__ import annotations
+
+import itertools
+import typing as t
+
+from .exceptions import DelimiterError, MystaceError
+from .mustache_tree import (
+    MustacheTreeNode,
+    TagType,
+    _build_mustache_tree,
+    create_mustache_tree,
+    process_raw_token_list,
+)
+from .tokenize import TokenTuple, TokenType, mustache_tokenizer
+
+# Lines a block is ended after, once every section opened in it is closed.
+# Standalone sections with longer bodies get blocks of their own.
+_BLOCK_LINES = 32
+# Most times a line is extended to find the end of a tag running past it
+_MAX_LINE_EXTENSIONS = 8
+
+# Source length and processed tokens of a line, or of several lines when a
+# tag spans them
+_LineT = t.Tuple[int, t.List[TokenTuple]]
+
+
+class _Block:
+    """Whole lines of the source, parsed on their own into `nodes`."""
+
+    __slots__ = ("length", "nodes")
+
+    length: int
+    nodes: t.List[MustacheTreeNode]
+
+    def __init__(self, length: int, nodes: t.List[MustacheTreeNode]) -> None:
+        self.length = length
+        self.nodes = nodes
+
+
+class _SectionBlock:
+    """
+    A section whose opening and closing tags stand alone on their lines,
+    with its body split into blocks of its own.
+    """
+
+    __slots__ = ("length", "nodes", "head_length", "tail_length", "blocks")
+
+    length: int
+    # Just the section node, for splicing like a `_Block`
+    nodes: t.List[MustacheTreeNode]
+    head_length: int
+    tail_length: int
+    blocks: t.List[_BlockT]
+
+    def __init__(
+        self,
+        node: MustacheTreeNode,
+        head_length: int,
+        tail_length: int,
+        blocks: t.List[_BlockT],
+    ) -> None:
+        self.nodes = [node]
+        self.head_length = head_length
+        self.tail_length = tail_length
+        self.blocks = blocks
+        self.length = head_length + sum(block.length for block in blocks) + tail_length
+
+
+_BlockT = t.Union[_Block, _SectionBlock]
+
+
+class EditableTemplate:
+    """
+    A template source and its tree, kept in step through text edits.
+
+    Each edit re-tokenizes only the lines around it and splices the new nodes
+    into `tree`, which is modified in place. Renderers made from the tree
+    with the tree engine render the latest source; others, such as compiled
+    renderers, have to be made again after an edit. Edits that unbalance the
+    sections around them are re-parsed along with the enclosing section, and
+    templates that change delimiters are parsed in full on every edit.
+    """
+
+    __slots__ = ("source", "tree", "_blocks")
+
+    source: str
+    tree: MustacheTreeNode
+    # None when the template is parsed in full on every edit
+    _blocks: t.Optional[t.List[_BlockT]]
+
+    def __init__(self, source: str) -> None:
+        self.tree = MustacheTreeNode(TagType.ROOT, source, 0)
+        self._parse(source)
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> None:
+        """
+        Replace the `deleted` characters of the source at `offset` with
+        `inserted`. Raises the same errors as `create_mustache_tree` if the
+        edited source isn't a valid template, leaving the template as it was.
+        """
+        source = self.source
+        if offset < 0 or deleted < 0 or offset + deleted > len(source):
+            raise ValueError("Edit is out of range of the source.")
+
+        new_source = source[:offset] + inserted + source[offset + deleted :]
+        if self._blocks is None or not self._edit_blocks(
+            new_source, offset, offset + deleted
+        ):
+            self._parse(new_source)
+
+    def _parse(self, source: str) -> None:
+        lines = _tokenize_lines(source)
+        blocks = None if lines is None else _build_blocks(lines)
+
+        if blocks is None:
+            # Raises the error if the source is invalid
+            children = create_mustache_tree(source).children
+            assert children is not None
+        else:
+            children = list(_block_nodes(blocks))
+
+        assert self.tree.children is not None
+        self.tree.children[:] = children
+        self.tree.data = source
+        self.source = source
+        self._blocks = blocks
+
+    def _edit_blocks(self, new_source: str, start: int, end: int) -> bool:
+        """
+        Re-parse the blocks holding the old source from `start` to `end`,
+        widening to enclosing sections until the new text is balanced.
+        Returns False if even the top level blocks can't be re-parsed.
+        """
+        assert self._blocks is not None
+        delta = len(new_source) - len(self.source)
+
+        # Each level down is the body of a section block holding the edit,
+        # as (container node, its blocks, first and last block touched, and
+        # where the first one starts)
+        levels: t.List[t.Tuple[MustacheTreeNode, t.List[_BlockT], int, int, int]] = []
+        container = self.tree
+        blocks = self._blocks
+        blocks_start = 0
+
+        while blocks:
+            first, last, first_start = _touched_blocks(blocks, blocks_start, start, end)
+            levels.append((container, blocks, first, last, first_start))
+
+            block = blocks[first]
+            if first != last or not isinstance(block, _SectionBlock):
+                break
+
+            body_start = first_start + block.head_length
+            body_end = first_start + block.length - block.tail_length
+            if not body_start <= start or not end < body_end:
+                break
+
+            container = block.nodes[0]
+            blocks = block.blocks
+            blocks_start = body_start
+
+        while levels:
+            container, blocks, first, last, first_start = levels.pop()
+            old_end = first_start + sum(
+                block.length for block in blocks[first : last + 1]
+            )
+
+            lines = _tokenize_lines(new_source[first_start : old_end + delta])
+            new_blocks = None if lines is None else _build_blocks(lines)
+            if new_blocks is None:
+                # Try again with the whole section holding these blocks
+                continue
+
+            node_index = sum(len(block.nodes) for block in blocks[:first])
+            num_nodes = sum(len(block.nodes) for block in blocks[first : last + 1])
+            assert container.children is not None
+            container.children[node_index : node_index + num_nodes] = _block_nodes(
+                new_blocks
+            )
+            blocks[first : last + 1] = new_blocks
+
+            for _, parent_blocks, parent_first, _, _ in levels:
+                parent_blocks[parent_first].length += delta
+
+            self.tree.data = new_source
+            self.source = new_source
+            return True
+
+        return False
+
+
+def _touched_blocks(
+    blocks: t.List[_BlockT], blocks_start: int, start: int, end: int
+) -> t.Tuple[int, int, int]:
+    """
+    First and last of `blocks` that hold the text from `start` to `end`, and
+    where the first one starts. The last block is the one holding the
+    character at `end`, so the line ending it is kept.
+    """
+    first = -1
+    first_start = block_start = blocks_start
+
+    for index, block in enumerate(blocks):
+        block_end = block_start + block.length
+        if first == -1 and start < block_end:
+            first = index
+            first_start = block_start
+        if end < block_end:
+            return first, index, first_start
+        block_start = block_end
+
+    # The edit reaches the end of the source
+    if first == -1:
+        first = len(blocks) - 1
+        first_start = block_start - blocks[-1].length
+    return first, len(blocks) - 1, first_start
+
+
+def _block_nodes(blocks: t.Iterable[_BlockT]) -> t.Iterator[MustacheTreeNode]:
+    return itertools.chain.from_iterable(block.nodes for block in blocks)
+
+
+def _tokenize_lines(text: str) -> t.Optional[t.List[_LineT]]:
+    """
+    Tokenize each line of `text` on its own, or None if a tag isn't closed
+    or delimiters are changed. Every line starts with the tokenizer in the
+    same state and standalone tags are judged within their line, so the
+    tokens are the same as for the whole text at once.
+    """
+    lines: t.List[_LineT] = []
+    text_len = len(text)
+    line_start = 0
+
+    while line_start < text_len:
+        line_end = text.find("\n", line_start) + 1 or text_len
+
+        for _ in range(_MAX_LINE_EXTENSIONS):
+            try:
+                raw_token_list = mustache_tokenizer(text[line_start:line_end])
+                break
+            except DelimiterError:
+                return None
+            except MystaceError:
+                # A tag runs onto later lines, so take them up to its end
+                tag_end = text.find("}}", line_end)
+                if tag_end == -1:
+                    return None
+                line_end = text.find("\n", tag_end) + 1 or text_len
+        else:
+            return None
+
+        for token in raw_token_list:
+            if token.type is TokenType.DELIMITER:
+                return None
+
+        lines.append((line_end - line_start, process_raw_token_list(raw_token_list)))
+        line_start = line_end
+
+    return lines
+
+
+def _build_blocks(lines: t.List[_LineT]) -> t.Optional[t.List[_BlockT]]:
+    """Split lines into blocks, or None if their sections aren't balanced."""
+    # Closing line of each section whose tags stand alone on their lines
+    closing_lines: t.Dict[int, int] = {}
+    # Open sections as (name, opening line if the tag stands alone, or -1)
+    open_sections: t.List[t.Tuple[str, int]] = []
+
+    for line_index, (_, tokens) in enumerate(lines):
+        standalone = len(tokens) == 1
+        for token in tokens:
+            if (
+                token.type is TokenType.SECTION
+                or token.type is TokenType.INVERTED_SECTION
+            ):
+                open_sections.append((token.data, line_index if standalone else -1))
+            elif token.type is TokenType.END_SECTION:
+                if not open_sections:
+                    return None
+                name, opening_line = open_sections.pop()
+                if name != token.data:
+                    return None
+                if standalone and opening_line != -1:
+                    closing_lines[opening_line] = line_index
+
+    if open_sections:
+        return None
+
+    return _split_blocks(lines, 0, len(lines), closing_lines)
+
+
+def _split_blocks(
+    lines: t.List[_LineT], lo: int, hi: int, closing_lines: t.Dict[int, int]
+) -> t.List[_BlockT]:
+    blocks: t.List[_BlockT] = []
+    block_start = lo
+    depth = 0
+    line_index = lo
+
+    while line_index < hi:
+        closing_line = closing_lines.get(line_index, -1)
+        if depth == 0 and closing_line - line_index > _BLOCK_LINES:
+            if block_start < line_index:
+                blocks.append(_leaf_block(lines, block_start, line_index))
+
+            head_length, (token,) = lines[line_index]
+            node = MustacheTreeNode(
+                TagType.SECTION
+                if token.type is TokenType.SECTION
+                else TagType.INVERTED_SECTION,
+                token.data,
+                token.offset,
+            )
+            body_blocks = _split_blocks(
+                lines, line_index + 1, closing_line, closing_lines
+            )
+            assert node.children is not None
+            node.children.extend(_block_nodes(body_blocks))
+            blocks.append(
+                _SectionBlock(node, head_length, lines[closing_line][0], body_blocks)
+            )
+
+            line_index = block_start = closing_line + 1
+            continue
+
+        for token in lines[line_index][1]:
+            if (
+                token.type is TokenType.SECTION
+                or token.type is TokenType.INVERTED_SECTION
+            ):
+                depth += 1
+            elif token.type is TokenType.END_SECTION:
+                depth -= 1
+
+        line_index += 1
+        if depth == 0 and line_index - block_start >= _BLOCK_LINES:
+            blocks.append(_leaf_block(lines, block_start, line_index))
+            block_start = line_index
+
+    if block_start < hi:
+        blocks.append(_leaf_block(lines, block_start, hi))
+
+    return blocks
+
+
+def _leaf_block(lines: t.List[_LineT], lo: int, hi: int) -> _Block:
+    block_lines = lines[lo:hi]
+    tree = _build_mustache_tree(
+        "", itertools.chain.from_iterable(tokens for _, tokens in block_lines)
+    )
+    assert tree.children is not None
+    return _Block(sum(length for length, _ in block_lines), tree.children)
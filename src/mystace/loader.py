@@ -0,0 +1,357 @@
+"""
+Loading templates and partials by name from the filesystem.
+
+An `Environment` parses each template or partial file once, shares the parsed
+partial trees between every template that includes them, and revalidates
+files by their modification time. Parsed trees are kept in an LRU bounded by
+their total node count.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from .exceptions import TemplateNotFoundError
+from .mustache_tree import (
+    CacheInfo,
+    ContextObjT,
+    MustacheRenderer,
+    MustacheTreeNode,
+    TagType,
+    create_mustache_tree,
+)
+from .util import html_escape
+
+PathT = t.Union[str, "os.PathLike[str]"]
+
+
+class FileSystemLoader:
+    """
+    Finds templates in one or more directories, searched in order. The name
+    `"emails/welcome"` is looked up as `emails/welcome.mustache` by default.
+    """
+
+    __slots__ = ("search_path", "extension", "encoding")
+
+    search_path: t.List[str]
+    extension: str
+    encoding: str
+
+    def __init__(
+        self,
+        search_path: t.Union[PathT, t.Sequence[PathT]],
+        extension: str = ".mustache",
+        encoding: str = "utf-8",
+    ) -> None:
+        if isinstance(search_path, (str, os.PathLike)):
+            search_path = [search_path]
+
+        self.search_path = [os.fspath(directory) for directory in search_path]
+        self.extension = extension
+        self.encoding = encoding
+
+    def find(self, name: str) -> t.Optional[str]:
+        """Path of the file for a template name, or None if there is none."""
+        segments = name.replace("\\", "/").split("/")
+        # Don't let template names escape the search path
+        if any(segment in ("", ".", "..") for segment in segments):
+            return None
+
+        file_name = os.path.join(*segments) + self.extension
+        for directory in self.search_path:
+            path = os.path.join(directory, file_name)
+            if os.path.isfile(path):
+                return path
+
+        return None
+
+    def get_mtime(self, path: str) -> t.Optional[int]:
+        """Modification time of a file in nanoseconds, or None if it's gone."""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get_source(self, path: str) -> str:
+        with open(path, encoding=self.encoding) as template_file:
+            return template_file.read()
+
+
+class _TreeEntry:
+    """A parsed template or partial file, or a name with no file."""
+
+    __slots__ = (
+        "path",
+        "mtime",
+        "tree",
+        "partial_names",
+        "cost",
+        "checked_at",
+        "renderer",
+        "renderer_partials",
+        "renderer_checked_at",
+    )
+
+    path: t.Optional[str]
+    mtime: t.Optional[int]
+    tree: t.Optional[MustacheTreeNode]
+    partial_names: t.Tuple[str, ...]
+    cost: int
+    checked_at: float
+    # Renderer for this entry as a template, with the partial trees it was
+    # built from, so it can be rebuilt when any of them change, and when
+    # they were last checked
+    renderer: t.Optional[MustacheRenderer]
+    renderer_partials: t.Dict[str, MustacheTreeNode]
+    renderer_checked_at: float
+
+    def __init__(
+        self,
+        path: t.Optional[str],
+        mtime: t.Optional[int],
+        tree: t.Optional[MustacheTreeNode],
+        checked_at: float,
+    ) -> None:
+        self.path = path
+        self.mtime = mtime
+        self.tree = tree
+        self.checked_at = checked_at
+        self.renderer = None
+        self.renderer_partials = {}
+        self.renderer_checked_at = checked_at
+
+        partial_names: t.Dict[str, None] = {}
+        cost = 1
+        if tree is not None:
+            work_stack = [tree]
+            while work_stack:
+                curr_node = work_stack.pop()
+                cost += 1
+                if curr_node.tag_type is TagType.PARTIAL:
+                    partial_names[curr_node.data] = None
+                elif curr_node.children:
+                    work_stack.extend(curr_node.children)
+
+        self.partial_names = tuple(partial_names)
+        self.cost = cost
+
+
+class Environment:
+    """
+    Renders templates by name, resolving templates and partials through a
+    loader.
+
+    Files are parsed on first use and each partial is parsed once, no matter
+    how many templates include it. With `auto_reload_interval` set, a file is
+    checked for changes at most once per interval (0 checks on every use);
+    None never checks. Parsed trees are evicted least recently used first
+    once their total node count exceeds `max_cost`, except for the one just
+    loaded, which is kept even if it alone exceeds it.
+    """
+
+    __slots__ = (
+        "loader",
+        "renderer_cls",
+        "auto_reload_interval",
+        "_max_cost",
+        "_entries",
+        "_total_cost",
+        "_lock",
+        "_hits",
+        "_misses",
+    )
+
+    loader: FileSystemLoader
+    renderer_cls: t.Type[MustacheRenderer]
+    auto_reload_interval: t.Optional[float]
+    _max_cost: int
+    _entries: OrderedDict[str, _TreeEntry]
+    _total_cost: int
+    _lock: threading.Lock
+    _hits: int
+    _misses: int
+
+    def __init__(
+        self,
+        loader: FileSystemLoader,
+        renderer_cls: t.Type[MustacheRenderer] = MustacheRenderer,
+        auto_reload_interval: t.Optional[float] = 2.0,
+        max_cost: int = 1_000_000,
+    ) -> None:
+        if max_cost < 0:
+            raise ValueError("max_cost must be non-negative.")
+
+        self.loader = loader
+        self.renderer_cls = renderer_cls
+        self.auto_reload_interval = auto_reload_interval
+        self._max_cost = max_cost
+        self._entries = OrderedDict()
+        self._total_cost = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_cost(self) -> int:
+        return self._max_cost
+
+    @max_cost.setter
+    def max_cost(self, max_cost: int) -> None:
+        if max_cost < 0:
+            raise ValueError("max_cost must be non-negative.")
+
+        with self._lock:
+            self._max_cost = max_cost
+            self._evict()
+
+    def get_template(self, name: str) -> MustacheRenderer:
+        """
+        Renderer for the template `name` and every partial it can reach.
+        Raises `TemplateNotFoundError` if there is no such template.
+        """
+        now = time.monotonic()
+        entry = self._get_entry(name)
+        if entry.tree is None:
+            raise TemplateNotFoundError(f'Template "{name}" not found.')
+
+        # Partials are checked once per reload interval, like files, so a
+        # hit doesn't walk every partial the template can reach
+        with self._lock:
+            renderer = entry.renderer
+            interval = self.auto_reload_interval
+            if renderer is not None and (
+                interval is None or now - entry.renderer_checked_at < interval
+            ):
+                self._hits += 1
+                return renderer
+
+        partials_dict: t.Dict[str, MustacheTreeNode] = {}
+        seen_names = set(entry.partial_names)
+        work_stack = list(entry.partial_names)
+        while work_stack:
+            partial_name = work_stack.pop()
+            partial_entry = self._get_entry(partial_name)
+            if partial_entry.tree is None:
+                continue
+
+            partials_dict[partial_name] = partial_entry.tree
+            for child_name in partial_entry.partial_names:
+                if child_name not in seen_names:
+                    seen_names.add(child_name)
+                    work_stack.append(child_name)
+
+        with self._lock:
+            renderer = entry.renderer
+            if renderer is not None and _same_trees(
+                entry.renderer_partials, partials_dict
+            ):
+                entry.renderer_checked_at = now
+                self._hits += 1
+                return renderer
+            self._misses += 1
+
+        # Build outside the lock so a slow template doesn't block other
+        # threads. Racing threads may both build, which is harmless.
+        renderer = self.renderer_cls(entry.tree, partials_dict)
+
+        with self._lock:
+            entry.renderer = renderer
+            entry.renderer_partials = partials_dict
+            entry.renderer_checked_at = now
+        return renderer
+
+    def render(
+        self,
+        name: str,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> str:
+        return self.get_template(name).render(data, stringify, html_escape_fn)
+
+    def clear(self) -> None:
+        """Drop all parsed templates and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._total_cost = 0
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        """Renderer hits and misses, and the node count of parsed trees."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._max_cost, self._total_cost)
+
+    def _get_entry(self, name: str) -> _TreeEntry:
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                interval = self.auto_reload_interval
+                if interval is None or now - entry.checked_at < interval:
+                    return entry
+                # Other threads keep using the entry while it's checked
+                entry.checked_at = now
+
+        # Check, read and parse files outside the lock so a slow or large
+        # template doesn't block lookups in other threads
+        loader = self.loader
+        if entry is not None:
+            if entry.path is None:
+                if loader.find(name) is None:
+                    return entry
+            elif loader.get_mtime(entry.path) == entry.mtime:
+                return entry
+
+        path = loader.find(name)
+        if path is None:
+            new_entry = _TreeEntry(None, None, None, now)
+        else:
+            # Take the mtime first so a concurrent edit is picked up next time
+            mtime = loader.get_mtime(path)
+            tree = create_mustache_tree(loader.get_source(path))
+            new_entry = _TreeEntry(path, mtime, tree, now)
+
+        with self._lock:
+            entries = self._entries
+            old_entry = entries.get(name)
+            if old_entry is not None:
+                # Keep what another thread loaded from the same file meanwhile,
+                # along with any renderer built from it
+                if (
+                    old_entry is not entry
+                    and old_entry.path == new_entry.path
+                    and old_entry.mtime == new_entry.mtime
+                ):
+                    return old_entry
+                del entries[name]
+                self._total_cost -= old_entry.cost
+
+            entries[name] = new_entry
+            self._total_cost += new_entry.cost
+            # The new entry is about to be used, so evicting it would only
+            # parse the file again on the next call
+            self._evict(keep_newest=True)
+        return new_entry
+
+    def _evict(self, keep_newest: bool = False) -> None:
+        entries = self._entries
+        min_entries = 1 if keep_newest else 0
+        while self._total_cost > self._max_cost and len(entries) > min_entries:
+            _, entry = entries.popitem(last=False)
+            self._total_cost -= entry.cost
+
+
+def _same_trees(
+    old_partials: t.Dict[str, MustacheTreeNode],
+    new_partials: t.Dict[str, MustacheTreeNode],
+) -> bool:
+    return len(old_partials) == len(new_partials) and all(
+        new_partials.get(name) is tree for name, tree in old_partials.items()
+    )
@@ -1,8 +1,19 @@
 from __future__ import annotations
 
+import array
+import dataclasses
 import enum
+import functools
+import hashlib
+import inspect
+import itertools
+import marshal
+import os
+import struct
+import sys
+import threading
 import typing as t
-from collections import deque
+from collections import OrderedDict, abc, deque
 
 import typing_extensions as te
 
@@ -10,10 +21,14 @@ from .exceptions import (
     MissingClosingTagError,
     MystaceError,
     NodeHasNoChildren,
+    SerializationError,
     StrayClosingTagError,
 )
 from .tokenize import TokenTuple, TokenType, mustache_tokenizer
-from .util import html_escape
+from .util import html_escape, html_escape_parts
+
+if t.TYPE_CHECKING:
+    from .session import RenderSession
 
 # be returned
 ContextObjT = t.Any
@@ -32,6 +47,25 @@ _STANDALONE_TOKENS = (
 _SPACE_CACHE = [""] + [" " * i for i in range(1, 33)]  # Cache up to 32 spaces
 
 
+# Default size in characters of the chunks produced by streaming renders
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Most escaped values left raw before the built-in escaper runs over them
+_ESCAPE_BATCH_SIZE = 256
+
+
+def _write_all(fd: int, buffer: bytes) -> None:
+    """Write all of `buffer` to `fd`, retrying short writes."""
+    written = os.write(fd, buffer)
+    if written < len(buffer):
+        rest = memoryview(buffer)[written:]
+        while rest:
+            rest = rest[os.write(fd, rest) :]
+
+
+# Chunk size used by non-streaming renders, so everything is one chunk
+_NO_CHUNKING = sys.maxsize
+
+
 def _get_spaces(n: int) -> str:
     """Get n spaces, using cache when possible."""
     if n < len(_SPACE_CACHE):
@@ -40,10 +74,13 @@ def _get_spaces(n: int) -> str:
 
 
 class ContextNode:
-    __slots__ = ("context", "parent_context_node")
+    __slots__ = ("context", "parent_context_node", "memo")
 
     context: ContextObjT
     parent_context_node: t.Optional[ContextNode]
+    # Results of lookups that passed through this scope, including misses,
+    # created when first needed. See _resolve_outer.
+    memo: t.Optional[t.Dict[str, t.Any]]
 
     def __init__(
         self,
@@ -52,67 +89,432 @@ class ContextNode:
     ) -> None:
         self.context = context
         self.parent_context_node = parent_context_node
+        self.memo = None
 
     def get(self, key: str) -> t.Any:
-        if key == ".":
-            return self.context
+        return make_resolver(key)(self)
 
-        # Use iterator to avoid copying keys
-        chain_iter = iter(key.split("."))
-        curr_ctx = self.context
-        parent_node = self.parent_context_node
+    def open_section(self, key: str) -> t.List[ContextNode]:
+        return list(self.iter_section(key))
 
-        first_key = next(chain_iter)
+    def iter_section(self, key: str) -> t.Iterator[ContextNode]:
+        """Lazily yield the context of each item of a section."""
+        new_context = self.get(key)
 
-        # TODO I think this is where changes need to be made if we want to
-        # support indexing and lambdas.
-        outer_context = None
+        # If lookup is "falsy", no need to open the section or copy
+        # new context
+        if not new_context:
+            return
 
-        while curr_ctx is not None:
-            if isinstance(curr_ctx, dict) and first_key in curr_ctx:
-                outer_context = curr_ctx[first_key]
+        # In the case of the list, need a new context for each item
+        if isinstance(new_context, _SECTION_LIST_TYPES):
+            for item in new_context:
+                yield ContextNode(item, self)
+        else:
+            yield ContextNode(new_context, self)
+
+
+class Columns(t.Sequence[t.Dict[str, t.Any]]):
+    """
+    Tabular data held as columns of equal length: lists, `array.array`s,
+    NumPy arrays or any other sequences. A section over `Columns` renders
+    once per row. Each row's dict is built in C right before the row
+    renders and dropped after it, so the table never exists as a list of
+    row dicts, and rows still get the fast lookups of dicts.
+
+    NumPy arrays are converted to lists once with `tolist`, as their
+    values would otherwise be NumPy scalars, which are slow to stringify.
+    With `stringify`, numeric NumPy and `array.array` columns are instead
+    converted to strings in one batch, vectorised for NumPy. Their values
+    then render with `str` whatever the render's `stringify` is, and are
+    always truthy.
+    """
+
+    __slots__ = ("columns", "num_rows")
+
+    columns: t.Dict[str, t.Sequence[t.Any]]
+    num_rows: int
+
+    def __init__(
+        self, columns: t.Mapping[str, t.Sequence[t.Any]], stringify: bool = False
+    ) -> None:
+        self.columns = {}
+        self.num_rows = 0
+
+        for i, (name, column) in enumerate(columns.items()):
+            if stringify:
+                column = _stringify_column(column)
+            if hasattr(column, "dtype"):
+                column = column.tolist()  # type: ignore[attr-defined]
+
+            if i == 0:
+                self.num_rows = len(column)
+            elif len(column) != self.num_rows:
+                raise ValueError(
+                    f'Column "{name}" has {len(column)} rows, expected {self.num_rows}.'
+                )
+
+            self.columns[name] = column
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @t.overload
+    def __getitem__(self, index: int) -> t.Dict[str, t.Any]: ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> Columns: ...
+
+    def __getitem__(
+        self, index: t.Union[int, slice]
+    ) -> t.Union[t.Dict[str, t.Any], Columns]:
+        if isinstance(index, slice):
+            return Columns(
+                {name: column[index] for name, column in self.columns.items()}
+            )
+
+        if index < 0:
+            index += self.num_rows
+        if not 0 <= index < self.num_rows:
+            raise IndexError("Columns row index out of range.")
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def __iter__(self) -> t.Iterator[t.Dict[str, t.Any]]:
+        return map(
+            dict,
+            map(
+                zip, itertools.repeat(tuple(self.columns)), zip(*self.columns.values())
+            ),
+        )
+
+
+def _stringify_column(column: t.Sequence[t.Any]) -> t.Sequence[t.Any]:
+    """Convert a numeric `array.array` or NumPy array to strings."""
+    dtype = getattr(column, "dtype", None)
+    if dtype is not None:
+        # Integer, unsigned and floating point NumPy arrays
+        if getattr(dtype, "kind", None) in ("i", "u", "f"):
+            return column.astype(str)  # type: ignore[attr-defined]
+        return column
+
+    if isinstance(column, array.array) and column.typecode not in ("u", "w"):
+        return list(map(str, column))
+
+    return column
+
+
+# Values that sections render once per item
+_SECTION_LIST_TYPES = (list, Columns)
+
+
+ResolverT = t.Callable[[ContextNode], t.Any]
+
+# Result of an accessor for a scope that doesn't hold the name. None can't be
+# used, as it is a valid value that stops the search.
+_MISSING = object()
+
+# Looks up a name in a scope of one type, taking the object, the name and the
+# name parsed as a list index (None for the first segment of a name, which is
+# never used as an index), and returning the value or _MISSING.
+AccessorT = t.Callable[[t.Any, str, t.Optional[int]], t.Any]
+
+# Types whose attributes are never looked up, as they can only be data
+_PLAIN_TYPES = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+
+def _get_item(obj: t.Any, key: str, int_key: t.Optional[int]) -> t.Any:
+    return obj[key] if key in obj else _MISSING
+
+
+def _get_index(obj: t.Any, key: str, int_key: t.Optional[int]) -> t.Any:
+    if int_key is None:
+        return _MISSING
+    try:
+        return obj[int_key]
+    except IndexError:
+        return _MISSING
+
+
+def _get_attribute(obj: t.Any, key: str, int_key: t.Optional[int]) -> t.Any:
+    # Private attributes aren't data
+    if key[:1] == "_":
+        return _MISSING
+    return getattr(obj, key, _MISSING)
+
+
+def _get_nothing(obj: t.Any, key: str, int_key: t.Optional[int]) -> t.Any:
+    return _MISSING
+
+
+def _make_accessor(cls: type) -> AccessorT:
+    if issubclass(cls, abc.Mapping):
+        return _get_item
+    if issubclass(cls, _PLAIN_TYPES):
+        return _get_nothing
+    # Named tuples are records, looked up by field name
+    if issubclass(cls, tuple) and hasattr(cls, "_fields"):
+        return _get_attribute
+    if issubclass(cls, abc.Sequence):
+        return _get_index
+    return _get_attribute
+
+
+# Accessors by the concrete type of the scope, so the checks in
+# _make_accessor run once per type
+_accessors: t.Dict[type, AccessorT] = {}
+
+
+def _get_value(obj: t.Any, key: str, int_key: t.Optional[int] = None) -> t.Any:
+    """
+    Look up a name in a scope that isn't a dict: an item of a mapping, an
+    index of a sequence or an attribute of any other object.
+    """
+    cls = type(obj)
+    accessor = _accessors.get(cls)
+    if accessor is None:
+        accessor = _accessors[cls] = _make_accessor(cls)
+    return accessor(obj, key, int_key)
+
+
+def _resolve_implicit(context_node: ContextNode) -> t.Any:
+    return context_node.context
+
+
+def _resolve_outer(context_node: ContextNode, key: str) -> t.Any:
+    """
+    Look up `key` in the scopes enclosing `context_node`. The result, even
+    a miss, is memoized on every enclosing scope passed on the way, so later
+    lookups from anywhere below those scopes stop there instead of walking
+    to the root. Scopes are created per render, and so are their memos. A
+    new scope shadowing the name is checked before any memo above it, so
+    shadowing never invalidates a memo.
+    """
+    passed_nodes: t.List[ContextNode] = []
+    curr_node = context_node.parent_context_node
+    res = None
+
+    while curr_node is not None:
+        curr_ctx = curr_node.context
+        if isinstance(curr_ctx, dict):
+            if key in curr_ctx:
+                res = curr_ctx[key]
+                break
+        else:
+            value = _get_value(curr_ctx, key)
+            if value is not _MISSING:
+                res = value
                 break
+
+        memo = curr_node.memo
+        if memo is not None and key in memo:
+            res = memo[key]
+            break
+
+        passed_nodes.append(curr_node)
+        curr_node = curr_node.parent_context_node
+
+    for passed_node in passed_nodes:
+        memo = passed_node.memo
+        if memo is None:
+            passed_node.memo = {key: res}
+        else:
+            memo[key] = res
+
+    return res
+
+
+# First segment of a dotted name, then the remaining segments each paired
+# with their list index, if they parse as one.
+KeyPathT = t.Tuple[str, t.Tuple[t.Tuple[str, t.Optional[int]], ...]]
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_key(key: str) -> KeyPathT:
+    first_key, *rest_keys = key.split(".")
+
+    rest_path: t.List[t.Tuple[str, t.Optional[int]]] = []
+    for rest_key in rest_keys:
+        try:
+            rest_path.append((rest_key, int(rest_key)))
+        except ValueError:
+            rest_path.append((rest_key, None))
+
+    return first_key, tuple(rest_path)
+
+
+@functools.lru_cache(maxsize=1024)
+def make_resolver(key: str) -> ResolverT:
+    """
+    Build the lookup function for a tag name. All string work (splitting
+    dotted names, parsing list indices) happens here, once per name, so a
+    lookup at render time is a single call.
+    """
+    if key == ".":
+        return _resolve_implicit
+
+    first_key, rest_path = parse_key(key)
+
+    if not rest_path:
+
+        def resolve_single(context_node: ContextNode) -> t.Any:
+            curr_ctx = context_node.context
+            if isinstance(curr_ctx, dict):
+                if first_key in curr_ctx:
+                    return curr_ctx[first_key]
             else:
-                if parent_node is None:
-                    curr_ctx = None
-                else:
-                    curr_ctx = parent_node.context
-                    parent_node = parent_node.parent_context_node
+                value = _get_value(curr_ctx, first_key)
+                if value is not _MISSING:
+                    return value
+            return _resolve_outer(context_node, first_key)
+
+        return resolve_single
+
+    def resolve_path(context_node: ContextNode) -> t.Any:
+        # TODO I think this is where changes need to be made if we want to
+        # support lambdas.
+        curr_ctx = context_node.context
+        if isinstance(curr_ctx, dict):
+            if first_key in curr_ctx:
+                outer_context = curr_ctx[first_key]
+            else:
+                outer_context = _resolve_outer(context_node, first_key)
+        else:
+            outer_context = _get_value(curr_ctx, first_key)
+            if outer_context is _MISSING:
+                outer_context = _resolve_outer(context_node, first_key)
 
         if outer_context is None:
             return None
 
-        # Loop through the rest
-        for key in chain_iter:
-            if isinstance(outer_context, list):
-                try:
-                    int_key = int(key)
-                    outer_context = outer_context[int_key]
-                except Exception:
-                    return None
-
-            elif isinstance(outer_context, dict) and key in outer_context:
-                outer_context = outer_context[key]
-            else:
+        return _follow_path(outer_context, rest_path)
+
+    return resolve_path
+
+
+def _follow_path(
+    outer_context: t.Any, rest_path: t.Tuple[t.Tuple[str, t.Optional[int]], ...]
+) -> t.Any:
+    """Look up the segments after the first of a dotted name."""
+    for rest_key, int_key in rest_path:
+        if isinstance(outer_context, list):
+            if int_key is None:
+                return None
+            try:
+                outer_context = outer_context[int_key]
+            except IndexError:
                 return None
 
-        return outer_context
+        elif isinstance(outer_context, dict):
+            if rest_key not in outer_context:
+                return None
+            outer_context = outer_context[rest_key]
+        else:
+            outer_context = _get_value(outer_context, rest_key, int_key)
+            if outer_context is _MISSING:
+                return None
 
-    def open_section(self, key: str) -> t.List[ContextNode]:
-        new_context = self.get(key)
+    return outer_context
 
-        # If lookup is "falsy", no need to open the section or copy
-        # new context
-        if not new_context:
-            return []
 
-        # In the case of the list, need a new context for each item
-        if isinstance(new_context, list):
-            # Pre-allocate list for better performance
-            res_list = [ContextNode(item, self) for item in new_context]
-            return res_list
+@functools.lru_cache(maxsize=1024)
+def make_bound_resolver(key: str, scope: int) -> ResolverT:
+    """
+    Build the lookup function for a name a schema places `scope` scopes out
+    from where it is looked up. It goes straight to that scope, guarded by
+    checks that the scopes passed over don't hold the name and that the
+    scope does; data that doesn't match the schema falls back to the
+    dynamic lookup of make_resolver(key).
+    """
+    dynamic_resolver = make_resolver(key)
+    first_key, rest_path = parse_key(key)
+
+    def resolve_bound(context_node: ContextNode) -> t.Any:
+        curr_node: t.Optional[ContextNode] = context_node
+        for _ in range(scope):
+            if curr_node is None:
+                return dynamic_resolver(context_node)
+
+            # An inner scope holding the name shadows the bound one
+            curr_ctx = curr_node.context
+            if type(curr_ctx) is dict:
+                if first_key in curr_ctx:
+                    return dynamic_resolver(context_node)
+            elif _get_value(curr_ctx, first_key) is not _MISSING:
+                return dynamic_resolver(context_node)
+
+            curr_node = curr_node.parent_context_node
+
+        if curr_node is not None:
+            curr_ctx = curr_node.context
+            if type(curr_ctx) is dict:
+                value = curr_ctx[first_key] if first_key in curr_ctx else _MISSING
+            else:
+                value = _get_value(curr_ctx, first_key)
+
+            if value is not _MISSING:
+                if not rest_path or value is None:
+                    return value
+                return _follow_path(value, rest_path)
 
-        return [ContextNode(new_context, self)]
+        return dynamic_resolver(context_node)
+
+    return resolve_bound
+
+
+async def _await_value(value: t.Any, awaited: t.Dict[t.Any, t.Any]) -> t.Any:
+    """
+    Await value if needed. Results are cached per awaitable, since a
+    coroutine can only be awaited once but may be reached many times.
+    """
+    if not inspect.isawaitable(value):
+        return value
+
+    if value in awaited:
+        return awaited[value]
+
+    result = await value
+    awaited[value] = result
+    return result
+
+
+async def _resolve_async(
+    key: str, context_node: ContextNode, awaited: t.Dict[t.Any, t.Any]
+) -> t.Any:
+    """
+    Same lookup as make_resolver(key), but awaits any awaitable reached on
+    the way. Scopes on the context chain are always already awaited.
+    """
+    if key == ".":
+        return context_node.context
+
+    first_key, rest_path = parse_key(key)
+
+    outer_context = None
+    curr_node: t.Optional[ContextNode] = context_node
+    while curr_node is not None:
+        curr_ctx = curr_node.context
+        if isinstance(curr_ctx, dict):
+            if first_key in curr_ctx:
+                outer_context = await _await_value(curr_ctx[first_key], awaited)
+                break
+        else:
+            value = _get_value(curr_ctx, first_key)
+            if value is not _MISSING:
+                outer_context = await _await_value(value, awaited)
+                break
+        curr_node = curr_node.parent_context_node
+
+    if outer_context is None:
+        return None
+
+    for rest_key, int_key in rest_path:
+        outer_context = _follow_path(outer_context, ((rest_key, int_key),))
+        if outer_context is None:
+            return None
+
+        outer_context = await _await_value(outer_context, awaited)
+
+    return outer_context
 
 
 class TagType(enum.Enum):
@@ -130,13 +532,28 @@ class TagType(enum.Enum):
     VARIABLE_RAW = 7
 
 
+_LOOKUP_TAG_TYPES = (
+    TagType.SECTION,
+    TagType.INVERTED_SECTION,
+    TagType.VARIABLE,
+    TagType.VARIABLE_RAW,
+)
+
+
 class MustacheTreeNode:
-    __slots__ = ("tag_type", "data", "children", "offset")
+    __slots__ = ("tag_type", "data", "children", "offset", "resolver", "scope")
 
     tag_type: TagType
+    # The name for tags, the text for literals and the template source for
+    # the root, which indented copies of partials are parsed from.
     data: str
     children: t.Optional[t.List[MustacheTreeNode]]
     offset: int
+    # Precompiled name lookup, only set on nodes that look up a name.
+    resolver: t.Optional[ResolverT]
+    # How many scopes out the name is statically known to resolve, or -1 if
+    # it is looked up dynamically. See bind_schema.
+    scope: int
 
     def __init__(
         self,
@@ -147,6 +564,7 @@ class MustacheTreeNode:
         self.tag_type = tag_type
         self.data = data
         self.offset = offset
+        self.scope = -1
 
         # ROOT = -1
         # LITERAL = 0
@@ -165,6 +583,11 @@ class MustacheTreeNode:
         else:
             self.children = None
 
+        if tag_type in _LOOKUP_TAG_TYPES:
+            self.resolver = make_resolver(data)
+        else:
+            self.resolver = None
+
     def recursive_display(self) -> str:
         res_str = self.__repr__() + "\n"
 
@@ -182,140 +605,1206 @@ class MustacheTreeNode:
 
         self.children.append(node)
 
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        # Resolvers are closures and can't be pickled, so rebuild them
+        # through __init__ and the schema binding instead.
+        return (
+            self.__class__,
+            (self.tag_type, self.data, self.offset),
+            (self.children, self.scope),
+        )
+
+    def __setstate__(
+        self, state: t.Tuple[t.Optional[t.List[MustacheTreeNode]], int]
+    ) -> None:
+        self.children, scope = state
+        if scope != -1:
+            _bind_node(self, scope)
+
     def __repr__(self) -> str:
-        if self.data:
+        if self.data and self.tag_type is not TagType.ROOT:
             return f"<{self.__class__.__name__}: {self.tag_type}, {self.data!r}>"
         return f"<{self.__class__.__name__}: {self.tag_type}>"
 
 
+class LazyPartialsDict(t.Mapping[str, MustacheTreeNode]):
+    """
+    Partial trees parsed from their sources the first time they are used.
+    Parsing is thread-safe, and each partial is parsed at most once.
+    """
+
+    __slots__ = ("sources", "_trees", "_lock")
+
+    sources: t.Dict[str, str]
+    _trees: t.Dict[str, MustacheTreeNode]
+    _lock: threading.Lock
+
+    def __init__(self, sources: t.Mapping[str, str]) -> None:
+        self.sources = dict(sources)
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        return (self.__class__, (self.sources,))
+
+    def get(self, name: str, default: t.Any = None) -> t.Any:
+        tree = self._trees.get(name)
+        if tree is not None:
+            return tree
+        if name not in self.sources:
+            return default
+        return self._parse(name)
+
+    def __getitem__(self, name: str) -> MustacheTreeNode:
+        tree = self._trees.get(name)
+        if tree is not None:
+            return tree
+        if name not in self.sources:
+            raise KeyError(name)
+        return self._parse(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.sources
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self.sources)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def _parse(self, name: str) -> MustacheTreeNode:
+        with self._lock:
+            tree = self._trees.get(name)
+            if tree is None:
+                tree = create_mustache_tree(self.sources[name])
+                self._trees[name] = tree
+            return tree
+
+
+# A frame of the render traversal: the remaining nodes, their context and,
+# for sections over a list, the remaining items, the section body and the
+# context outside the section.
+_FrameT = t.Tuple[
+    t.Iterator["MustacheTreeNode"],
+    ContextNode,
+    t.Optional[t.Iterator[t.Any]],
+    t.Optional[t.List["MustacheTreeNode"]],
+    t.Optional[ContextNode],
+]
+
+# Marks the end of the items of a section
+_NO_ITEM = object()
+
+
+class TemplateInfo(t.NamedTuple):
+    """What a template and the partials it can reach refer to."""
+
+    # Names looked up, by the path of section names enclosing them. A name
+    # can resolve in any scope along its path.
+    names: t.Dict[t.Tuple[str, ...], t.FrozenSet[str]]
+    sections: t.FrozenSet[str]
+    inverted_sections: t.FrozenSet[str]
+    # Every partial the template can reach, with the partials it includes
+    partial_graph: t.Dict[str, t.Tuple[str, ...]]
+    # Partials that can include themselves
+    recursive_partials: t.FrozenSet[str]
+    # Partials included somewhere that have no source
+    missing_partials: t.FrozenSet[str]
+    # Nodes in the template and partial trees, each tree counted once
+    node_count: int
+    # Deepest nesting of sections, following partials
+    max_depth: int
+    # Fraction of the text and variable nodes that are static text
+    static_share: float
+
+
 class MustacheRenderer:
     mustache_tree: MustacheTreeNode
-    partials_dict: t.Dict[str, MustacheTreeNode]
-    __slots__ = ("mustache_tree", "partials_dict")
+    partials_dict: t.Mapping[str, MustacheTreeNode]
+    _source_hash: t.Optional[bytes]
+    # Template and partial sources the hash is computed from on first use
+    _sources: t.Optional[t.Tuple[str, t.Optional[t.Mapping[str, str]]]]
+    # Copies of partial trees indented for standalone partial tags, by name
+    # and indentation width
+    _indented_partials: t.Dict[t.Tuple[str, int], t.Optional[MustacheTreeNode]]
+    # UTF-8 encodings of literals, filled in by the first bytes render that
+    # reaches each one
+    _encoded_literals: t.Dict[str, bytes]
+    __slots__ = (
+        "mustache_tree",
+        "partials_dict",
+        "_source_hash",
+        "_sources",
+        "_indented_partials",
+        "_encoded_literals",
+    )
 
     def __init__(
         self,
         mustache_tree: MustacheTreeNode,
-        partials_dict: t.Optional[t.Dict[str, MustacheTreeNode]] = None,
+        partials_dict: t.Optional[t.Mapping[str, MustacheTreeNode]] = None,
+        source_hash: t.Optional[bytes] = None,
     ) -> None:
         assert mustache_tree.tag_type is TagType.ROOT
         self.mustache_tree = mustache_tree
+        self._source_hash = source_hash
+        self._sources = None
+        self._indented_partials = {}
+        self._encoded_literals = {}
 
         if partials_dict is not None:
-            for partial_tree in partials_dict.values():
-                assert partial_tree.tag_type is TagType.ROOT
+            # Lazy partials are only parsed when used
+            if not isinstance(partials_dict, LazyPartialsDict):
+                for partial_tree in partials_dict.values():
+                    assert partial_tree.tag_type is TagType.ROOT
 
             self.partials_dict = partials_dict
         else:
             self.partials_dict = {}
 
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        # Subclasses holding compiled state rebuild it through __init__
+        return (
+            self.__class__,
+            (self.mustache_tree, self.partials_dict, self.source_hash),
+        )
+
+    @property
+    def source_hash(self) -> t.Optional[bytes]:
+        """Hash of the template and partials sources, if known."""
+        if self._source_hash is None and self._sources is not None:
+            self._source_hash = compute_source_hash(*self._sources)
+        return self._source_hash
+
+    def _get_partial(self, name: str, offset: int) -> t.Optional[MustacheTreeNode]:
+        """
+        The tree of a partial, with every line indented by `offset` spaces.
+        Indented copies are parsed once and cached, so the render loop
+        never has to track indentation.
+        """
+        if not offset:
+            return self.partials_dict.get(name)
+
+        key = (name, offset)
+        indented_partials = self._indented_partials
+        if key in indented_partials:
+            return indented_partials[key]
+
+        partial_tree = self.partials_dict.get(name)
+        if partial_tree is not None:
+            indent = _get_spaces(offset)
+            if partial_tree.data:
+                partial_tree = create_mustache_tree(
+                    _indent_source(partial_tree.data, indent)
+                )
+            else:
+                # Trees built by hand have no source to parse
+                partial_tree = _indent_tree(partial_tree, indent)
+
+        # Racing threads may both parse, which is harmless
+        indented_partials[key] = partial_tree
+        return partial_tree
+
+    def analyze(self) -> TemplateInfo:
+        """
+        Find the names, sections and partials the template can reach,
+        without rendering it. Partials not parsed yet are parsed, raising
+        any template errors. Partials that include each other are followed
+        through one inclusion among them, which shows the names each further
+        level looks up, so the work stays polynomial in the number of
+        partials.
+        """
+        names: t.Dict[t.Tuple[str, ...], t.Set[str]] = {}
+        sections: t.Set[str] = set()
+        inverted_sections: t.Set[str] = set()
+        # Dicts keep the included names unique and in order
+        partial_graph: t.Dict[str, t.Dict[str, None]] = {}
+        missing_partials: t.Set[str] = set()
+        trees = {id(self.mustache_tree): self.mustache_tree}
+        max_depth = 0
+        # Partials each partial can include, directly or not
+        reachable_partials = _reachable_partials(
+            _partial_graph(self.mustache_tree, self.partials_dict)
+        )
+        # Partials expanded so far, by the section path they were included at
+        # and the recursion steps leading to them
+        expanded_partials: t.Set[t.Tuple[str, t.Tuple[str, ...], int]] = set()
+        expanded_names: t.Set[str] = set()
+
+        # Items are (node, enclosing section names, partials being included,
+        # inclusions in a row of partials that include each other)
+        work_stack: t.List[
+            t.Tuple[MustacheTreeNode, t.Tuple[str, ...], t.Tuple[str, ...], int]
+        ] = [(self.mustache_tree, (), (), 0)]
+        # Partials only reached past the recursion followed, expanded once
+        # where first reached if nothing else expands them
+        deferred_partials: t.Deque[
+            t.Tuple[
+                str,
+                t.Tuple[MustacheTreeNode, t.Tuple[str, ...], t.Tuple[str, ...], int],
+            ]
+        ] = deque()
+
+        while work_stack or deferred_partials:
+            if not work_stack:
+                name, work_item = deferred_partials.popleft()
+                if name not in expanded_names:
+                    expanded_names.add(name)
+                    work_stack.append(work_item)
+                continue
+
+            curr_node, section_path, partial_path, recursion_steps = work_stack.pop()
+            tag_type = curr_node.tag_type
+
+            if tag_type is TagType.PARTIAL:
+                name = curr_node.data
+                if partial_path:
+                    partial_graph[partial_path[-1]][name] = None
+
+                partial_tree = self.partials_dict.get(name)
+                if partial_tree is None:
+                    missing_partials.add(name)
+                    continue
+
+                partial_graph.setdefault(name, {})
+                trees[id(partial_tree)] = partial_tree
+
+                # Count the partials including each other in a row, which
+                # are followed through one inclusion among them. Every
+                # partial is still expanded at least once.
+                if partial_path and partial_path[-1] in reachable_partials[name]:
+                    recursion_steps += 1
+                else:
+                    recursion_steps = 0
+
+                # A partial finds the same names wherever it's included from
+                # the same sections, so it's expanded once per section path
+                expanded_key = (name, section_path, recursion_steps)
+                if expanded_key in expanded_partials:
+                    continue
+
+                work_item = (
+                    partial_tree,
+                    section_path,
+                    partial_path + (name,),
+                    recursion_steps,
+                )
+                if recursion_steps < 2:
+                    expanded_partials.add(expanded_key)
+                    expanded_names.add(name)
+                    work_stack.append(work_item)
+                elif name not in expanded_names:
+                    deferred_partials.append((name, work_item))
+                continue
+
+            if tag_type in _LOOKUP_TAG_TYPES:
+                names.setdefault(section_path, set()).add(curr_node.data)
+
+            if tag_type is TagType.SECTION:
+                sections.add(curr_node.data)
+                section_path += (curr_node.data,)
+                max_depth = max(max_depth, len(section_path))
+            elif tag_type is TagType.INVERTED_SECTION:
+                inverted_sections.add(curr_node.data)
+
+            if curr_node.children:
+                work_stack.extend(
+                    (child, section_path, partial_path, recursion_steps)
+                    for child in reversed(curr_node.children)
+                )
+
+        node_count = 0
+        num_literals = 0
+        num_variables = 0
+        node_stack = list(trees.values())
+        while node_stack:
+            curr_node = node_stack.pop()
+            node_count += 1
+            tag_type = curr_node.tag_type
+            if tag_type is TagType.LITERAL:
+                num_literals += 1
+            elif tag_type is TagType.VARIABLE or tag_type is TagType.VARIABLE_RAW:
+                num_variables += 1
+            elif curr_node.children:
+                node_stack.extend(curr_node.children)
+
+        recursive_partials = [
+            name for name, reachable in reachable_partials.items() if name in reachable
+        ]
+
+        return TemplateInfo(
+            {path: frozenset(path_names) for path, path_names in names.items()},
+            frozenset(sections),
+            frozenset(inverted_sections),
+            {name: tuple(children) for name, children in partial_graph.items()},
+            frozenset(recursive_partials),
+            frozenset(missing_partials),
+            node_count,
+            max_depth,
+            num_literals / (num_literals + num_variables)
+            if num_literals or num_variables
+            else 1.0,
+        )
+
+    def validate(self) -> None:
+        """
+        Parse every partial now, raising any template errors here rather
+        than when a render first reaches the partial.
+        """
+        for _ in self.partials_dict.values():
+            pass
+
+    def dumps(self) -> bytes:
+        """
+        Serialize the parsed template and partials into a compact binary
+        format, to be loaded back with `loads` much faster than parsing the
+        sources again.
+        """
+        header = _SERIALIZATION_HEADER.pack(
+            _SERIALIZATION_MAGIC,
+            _SERIALIZATION_VERSION,
+            marshal.version,
+            self.source_hash or _NO_SOURCE_HASH,
+        )
+        payload = (
+            _flatten_tree(self.mustache_tree),
+            {
+                name: _flatten_tree(partial_tree)
+                for name, partial_tree in self.partials_dict.items()
+            },
+        )
+        return header + marshal.dumps(payload)
+
+    @classmethod
+    def loads(
+        cls: t.Type[te.Self],
+        serialized: bytes,
+        template_str: t.Optional[str] = None,
+        partials: t.Optional[t.Dict[str, str]] = None,
+    ) -> te.Self:
+        """
+        Load a renderer written by `dumps`. If `template_str` is given, the
+        serialized renderer must have been compiled from exactly that
+        template and `partials`, so stale caches are rejected. Raises
+        `SerializationError` if the data is stale, corrupt or was written by
+        an incompatible version.
+        """
+        header_size = _SERIALIZATION_HEADER.size
+        try:
+            magic, version, marshal_version, source_hash = (
+                _SERIALIZATION_HEADER.unpack_from(serialized)
+            )
+        except struct.error as e:
+            raise SerializationError("Serialized renderer is truncated.") from e
+
+        if magic != _SERIALIZATION_MAGIC:
+            raise SerializationError("Data is not a serialized renderer.")
+
+        if version != _SERIALIZATION_VERSION or marshal_version != marshal.version:
+            raise SerializationError(
+                f"Serialized renderer has format version {version}, "
+                f"expected {_SERIALIZATION_VERSION}."
+            )
+
+        if template_str is not None and source_hash != compute_source_hash(
+            template_str, partials
+        ):
+            raise SerializationError(
+                "Serialized renderer is stale, the template source has changed."
+            )
+
+        try:
+            flat_tree, flat_partials = marshal.loads(serialized[header_size:])
+            return cls(
+                _unflatten_tree(flat_tree),
+                {
+                    name: _unflatten_tree(flat_partial)
+                    for name, flat_partial in flat_partials.items()
+                },
+                None if source_hash == _NO_SOURCE_HASH else source_hash,
+            )
+        except (ValueError, TypeError, EOFError, IndexError, MystaceError) as e:
+            raise SerializationError("Serialized renderer is corrupt.") from e
+
     def render(
         self,
         data: ContextObjT,
         stringify: t.Callable[[t.Any], str] = str,
         html_escape_fn: t.Callable[[str], str] = html_escape,
     ) -> str:
+        return next(
+            self._render_chunks((data,), stringify, html_escape_fn, _NO_CHUNKING)
+        )
+
+    def render_iter(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> t.Iterator[str]:
+        """
+        Render lazily, yielding chunks of at least `chunk_size` characters
+        (except possibly the last one). Joining the chunks gives the same
+        output as `render`, but the whole output never has to be in memory.
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+
+        return (
+            chunk
+            for chunk in self._render_chunks(
+                (data,), stringify, html_escape_fn, chunk_size
+            )
+            if chunk
+        )
+
+    def render_to(
+        self,
+        write_fn: t.Callable[[str], t.Any],
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """
+        Render into a sink such as `file.write` or a socket writer, calling
+        `write_fn` with chunks of at least `chunk_size` characters.
+        """
+        for chunk in self.render_iter(data, stringify, html_escape_fn, chunk_size):
+            write_fn(chunk)
+
+    def render_bytes(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> bytes:
+        """
+        Render to UTF-8. Literals are encoded once per renderer and only
+        values are encoded per render, so the output is never built as a
+        string first, which takes up to four bytes per character.
+        """
+        # bytes.join holds a buffer struct per part, so join chunk by chunk
+        # to keep that overhead bounded
+        return b"".join(
+            [
+                b"".join(buffers)
+                for buffers in self._render_byte_chunks(
+                    data, stringify, html_escape_fn, DEFAULT_CHUNK_SIZE
+                )
+            ]
+        )
+
+    def render_to_fd(
+        self,
+        fd: int,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """
+        Render as UTF-8 straight into a file descriptor, such as a file or
+        socket's `fileno()`, writing every `chunk_size` bytes of output as it
+        is rendered. Returns the number of bytes written.
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+
+        num_bytes = 0
+        for buffers in self._render_byte_chunks(
+            data, stringify, html_escape_fn, chunk_size
+        ):
+            # One copy and system call per chunk beats handing the (mostly
+            # tiny) buffers to os.writev
+            chunk = b"".join(buffers)
+            if chunk:
+                _write_all(fd, chunk)
+                num_bytes += len(chunk)
+
+        return num_bytes
+
+    def render_session(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> RenderSession:
+        """
+        Render into a `RenderSession`, which renders again only the parts of
+        the output that depend on the data that changes between updates.
+        """
+        # The session module builds on this one, so can't be imported first
+        from .session import RenderSession
+
+        return RenderSession(self, data, stringify, html_escape_fn)
+
+    def render_many(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        dedupe: bool = False,
+        dedupe_key: t.Optional[t.Callable[[ContextObjT], t.Hashable]] = None,
+        lazy: bool = False,
+    ) -> t.Union[t.List[str], t.Iterator[str]]:
+        """
+        Render the template once per context, sharing per-render setup
+        across all of them. Returns a list of outputs in order, or an
+        iterator producing them on demand if `lazy` is set.
+
+        With `dedupe`, equal contexts are only rendered once. Contexts are
+        compared structurally by default (dicts, lists and tuples by their
+        contents, str, int, bool and None by type and value, anything else
+        by identity); pass `dedupe_key` to compare by a key instead.
+        """
+        outputs = (
+            self._render_outputs_deduped(
+                datas, stringify, html_escape_fn, dedupe_key or _dedupe_key
+            )
+            if dedupe or dedupe_key is not None
+            else self._render_outputs(datas, stringify, html_escape_fn)
+        )
+
+        if lazy:
+            return outputs
+        return list(outputs)
+
+    def _render_outputs(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+    ) -> t.Iterator[str]:
+        """Yield the full output of each context in turn."""
+        return self._render_chunks(datas, stringify, html_escape_fn, _NO_CHUNKING)
+
+    def _render_outputs_deduped(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+        dedupe_key: t.Callable[[ContextObjT], t.Hashable],
+    ) -> t.Iterator[str]:
+        seen_outputs: t.Dict[t.Hashable, str] = {}
+
+        # The output generator pulls its next context from pending only
+        # after it has been resumed, so one shared generator can be fed
+        # just the contexts that were not seen before.
+        pending: t.List[ContextObjT] = []
+
+        def feed_pending() -> t.Iterator[ContextObjT]:
+            while True:
+                yield pending.pop()
+
+        outputs = self._render_outputs(feed_pending(), stringify, html_escape_fn)
+
+        for data in datas:
+            try:
+                key = dedupe_key(data)
+                output = seen_outputs.get(key)
+            except TypeError:
+                # Unhashable key, so always render
+                key = _NO_CONTEXT
+                output = None
+
+            if output is None:
+                pending.append(data)
+                output = next(outputs)
+                if key is not _NO_CONTEXT:
+                    seen_outputs[key] = output
+
+            yield output
+
+    async def render_async(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        prefetch: bool = False,
+    ) -> str:
+        """
+        Render with awaitable context values. An awaitable is only awaited
+        when a lookup actually reaches it, and its result is reused for the
+        rest of the render.
+
+        With `prefetch`, awaitables at the top level of `data` whose names
+        the template (or its partials) reference are first awaited
+        concurrently with `asyncio.gather`.
+        """
+        awaited: t.Dict[t.Any, t.Any] = {}
+        data = await _await_value(data, awaited)
+
+        if prefetch and isinstance(data, dict):
+            import asyncio
+
+            referenced_names = self._referenced_names()
+            pending = [
+                value
+                for key, value in data.items()
+                if key in referenced_names and inspect.isawaitable(value)
+            ]
+            results = await asyncio.gather(*pending)
+            awaited.update(zip(pending, results))
+
         res_list: t.List[str] = []
         res_list_append = res_list.append  # Cache method lookup
-        starting_context = ContextNode(data)
-        last_was_newline = True  # Track if we're at the start of a line
 
         assert self.mustache_tree.children is not None
 
-        # Never need to read the root because it has no data
-        work_deque: t.Deque[t.Tuple[MustacheTreeNode, ContextNode, int]] = deque(
-            (node, starting_context, self.mustache_tree.offset)
-            for node in self.mustache_tree.children
-        )
-        work_deque_popleft = work_deque.popleft  # Cache method lookup
-        work_deque_appendleft = work_deque.appendleft  # Cache method lookup
-        while work_deque:
-            curr_node, curr_context, curr_offset = work_deque_popleft()
-            if curr_node.tag_type is TagType.LITERAL:
-                res_list_append(curr_node.data)
-                last_was_newline = curr_node.data.endswith("\n")
-
-                # Add offset for partials after newline, but only if there's
-                # more content coming at the same offset level
-                if last_was_newline and curr_offset > 0:
-                    # Check if the next node also has the same offset
-                    if work_deque and work_deque[0][2] == curr_offset:
-                        res_list_append(_get_spaces(curr_offset))
-
-            elif (
-                curr_node.tag_type is TagType.VARIABLE
-                or curr_node.tag_type is TagType.VARIABLE_RAW
-            ):
-                variable_content = curr_context.get(curr_node.data)
-                if variable_content is not None:
+        stack: t.List[_FrameT] = [
+            (iter(self.mustache_tree.children), ContextNode(data), None, None, None)
+        ]
+        while stack:
+            node_iter, curr_context, item_iter, section_body, outer_context = stack[-1]
+
+            for curr_node in node_iter:
+                if curr_node.tag_type is TagType.LITERAL:
+                    res_list_append(curr_node.data)
+
+                elif (
+                    curr_node.tag_type is TagType.VARIABLE
+                    or curr_node.tag_type is TagType.VARIABLE_RAW
+                ):
+                    variable_content = await _resolve_async(
+                        curr_node.data, curr_context, awaited
+                    )
+                    if variable_content is not None:
+                        str_content = stringify(variable_content)
+                        if not str_content:
+                            continue
+                        if curr_node.tag_type is TagType.VARIABLE:
+                            str_content = html_escape_fn(str_content)
+
+                        res_list_append(str_content)
+
+                elif curr_node.tag_type is TagType.SECTION:
+                    new_context = await _resolve_async(
+                        curr_node.data, curr_context, awaited
+                    )
+
+                    if not new_context:
+                        continue
+
+                    # Items are awaited as the section reaches them
+                    section_items = None
+                    if isinstance(new_context, _SECTION_LIST_TYPES):
+                        section_items = iter(new_context)
+                        new_context = await _await_value(next(section_items), awaited)
+
+                    assert curr_node.children is not None
+                    stack.append(
+                        (
+                            iter(curr_node.children),
+                            ContextNode(new_context, curr_context),
+                            section_items,
+                            curr_node.children,
+                            curr_context,
+                        )
+                    )
+                    break
+
+                elif curr_node.tag_type is TagType.INVERTED_SECTION:
+                    lookup_data = await _resolve_async(
+                        curr_node.data, curr_context, awaited
+                    )
+
+                    if not lookup_data:
+                        assert curr_node.children is not None
+                        stack.append(
+                            (iter(curr_node.children), curr_context, None, None, None)
+                        )
+                        break
+
+                elif curr_node.tag_type is TagType.PARTIAL:
+                    partial_tree = self._get_partial(curr_node.data, curr_node.offset)
+
+                    if partial_tree is None:
+                        continue
+
+                    assert partial_tree.children is not None
+                    stack.append(
+                        (iter(partial_tree.children), curr_context, None, None, None)
+                    )
+                    break
+
+            else:
+                if item_iter is not None:
+                    section_item = next(item_iter, _NO_ITEM)
+                    if section_item is not _NO_ITEM:
+                        assert section_body is not None
+                        stack[-1] = (
+                            iter(section_body),
+                            ContextNode(
+                                await _await_value(section_item, awaited),
+                                outer_context,
+                            ),
+                            item_iter,
+                            section_body,
+                            outer_context,
+                        )
+                        continue
+
+                stack.pop()
+
+        return "".join(res_list)
+
+    def _referenced_names(self) -> t.Set[str]:
+        """
+        First segments of every name looked up by the template or any
+        partial it can reach.
+        """
+        names: t.Set[str] = set()
+        seen_partials: t.Set[str] = set()
+        work_stack = [self.mustache_tree]
+
+        while work_stack:
+            curr_node = work_stack.pop()
+
+            if curr_node.resolver is not None and curr_node.data != ".":
+                names.add(parse_key(curr_node.data)[0])
+
+            if curr_node.tag_type is TagType.PARTIAL:
+                partial_tree = self.partials_dict.get(curr_node.data)
+                if partial_tree is not None and curr_node.data not in seen_partials:
+                    seen_partials.add(curr_node.data)
+                    work_stack.append(partial_tree)
+
+            if curr_node.children:
+                work_stack.extend(curr_node.children)
+
+        return names
+
+    def _render_chunks(
+        self,
+        datas: t.Iterable[ContextObjT],
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+        chunk_size: int,
+    ) -> t.Iterator[str]:
+        """
+        Render each context in turn. The rest of the output of a context is
+        always yielded once it is finished (even if empty), and chunks of at
+        least `chunk_size` characters are yielded along the way. Setup is
+        shared across all of the contexts.
+        """
+        res_list: t.List[str] = []
+        res_list_append = res_list.append  # Cache method lookup
+        res_list_clear = res_list.clear  # Cache method lookup
+
+        # Escaped values are left raw until the built-in escaper runs over a
+        # batch of them at once, by chunk or by `_ESCAPE_BATCH_SIZE` values
+        batch_escape = html_escape_fn is html_escape
+        escape_positions: t.List[int] = []
+        escape_positions_append = escape_positions.append  # Cache method lookup
+        escape_positions_clear = escape_positions.clear  # Cache method lookup
+
+        assert self.mustache_tree.children is not None
+        root_children = self.mustache_tree.children
+        get_partial = self._get_partial  # Cache method lookup
+
+        # One frame per open section item, inverted section or partial, so
+        # memory is bounded by the nesting depth of the template rather than
+        # the length of section lists.
+        stack: t.List[_FrameT] = []
+        stack_append = stack.append  # Cache method lookup
+        stack_pop = stack.pop  # Cache method lookup
+
+        for data in datas:
+            res_len = 0  # Characters in res_list since the last chunk
+            stack_append((iter(root_children), ContextNode(data), None, None, None))
+
+            while stack:
+                node_iter, curr_context, item_iter, section_body, outer_context = stack[
+                    -1
+                ]
+
+                for curr_node in node_iter:
+                    if curr_node.tag_type is TagType.LITERAL:
+                        literal_data = curr_node.data
+                        res_list_append(literal_data)
+                        res_len += len(literal_data)
+
+                        if res_len >= chunk_size:
+                            if escape_positions:
+                                html_escape_parts(res_list, escape_positions)
+                                escape_positions_clear()
+                            yield "".join(res_list)
+                            res_list_clear()
+                            res_len = 0
+
+                    elif (
+                        curr_node.tag_type is TagType.VARIABLE
+                        or curr_node.tag_type is TagType.VARIABLE_RAW
+                    ):
+                        assert curr_node.resolver is not None
+                        variable_content = curr_node.resolver(curr_context)
+                        if variable_content is not None:
+                            str_content = stringify(variable_content)
+                            # Skip ahead if we get the empty string
+                            if not str_content:
+                                continue
+                            if curr_node.tag_type is TagType.VARIABLE:
+                                if batch_escape:
+                                    if len(escape_positions) == _ESCAPE_BATCH_SIZE:
+                                        html_escape_parts(res_list, escape_positions)
+                                        escape_positions_clear()
+                                    escape_positions_append(len(res_list))
+                                else:
+                                    str_content = html_escape_fn(str_content)
+
+                            res_list_append(str_content)
+                            res_len += len(str_content)
+
+                            if res_len >= chunk_size:
+                                if escape_positions:
+                                    html_escape_parts(res_list, escape_positions)
+                                    escape_positions_clear()
+                                yield "".join(res_list)
+                                res_list_clear()
+                                res_len = 0
+
+                    elif curr_node.tag_type is TagType.SECTION:
+                        assert curr_node.resolver is not None
+                        new_context = curr_node.resolver(curr_context)
+
+                        # If lookup is "falsy", no need to open the section
+                        if not new_context:
+                            continue
+
+                        # Lists are iterated one item at a time, as the
+                        # previous item's body is finished
+                        section_items = None
+                        if isinstance(new_context, _SECTION_LIST_TYPES):
+                            section_items = iter(new_context)
+                            new_context = next(section_items)
+
+                        assert curr_node.children is not None
+                        stack_append(
+                            (
+                                iter(curr_node.children),
+                                ContextNode(new_context, curr_context),
+                                section_items,
+                                curr_node.children,
+                                curr_context,
+                            )
+                        )
+                        break
+
+                    elif curr_node.tag_type is TagType.INVERTED_SECTION:
+                        # No need to add to the context stack, inverted sections
+                        # by definition aren't in the namespace and can't add anything.
+                        assert curr_node.resolver is not None
+                        if not curr_node.resolver(curr_context):
+                            assert curr_node.children is not None
+                            stack_append(
+                                (
+                                    iter(curr_node.children),
+                                    curr_context,
+                                    None,
+                                    None,
+                                    None,
+                                )
+                            )
+                            break
+
+                    elif curr_node.tag_type is TagType.PARTIAL:
+                        partial_tree = get_partial(curr_node.data, curr_node.offset)
+
+                        if partial_tree is None:
+                            continue
+
+                        assert partial_tree.children is not None
+                        stack_append(
+                            (
+                                iter(partial_tree.children),
+                                curr_context,
+                                None,
+                                None,
+                                None,
+                            )
+                        )
+                        break
+
+                else:
+                    # The frame is finished, move on to the next section item
+                    if item_iter is not None:
+                        section_item = next(item_iter, _NO_ITEM)
+                        if section_item is not _NO_ITEM:
+                            assert section_body is not None
+                            stack[-1] = (
+                                iter(section_body),
+                                ContextNode(section_item, outer_context),
+                                item_iter,
+                                section_body,
+                                outer_context,
+                            )
+                            continue
+
+                    stack_pop()
+
+            if escape_positions:
+                html_escape_parts(res_list, escape_positions)
+                escape_positions_clear()
+            yield "".join(res_list)
+            res_list_clear()
+
+    def _render_byte_chunks(
+        self,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str],
+        html_escape_fn: t.Callable[[str], str],
+        chunk_size: int,
+    ) -> t.Iterator[t.List[bytes]]:
+        """
+        Render to UTF-8, yielding lists of buffers of at least `chunk_size`
+        bytes, and always the rest once finished. The same list is reused
+        for every chunk, so it must be consumed before resuming.
+        """
+        res_list: t.List[bytes] = []
+        res_list_append = res_list.append  # Cache method lookup
+        res_list_clear = res_list.clear  # Cache method lookup
+        res_len = 0  # Bytes in res_list since the last chunk
+
+        encoded_literals = self._encoded_literals
+        get_encoded_literal = encoded_literals.get  # Cache method lookup
+        get_partial = self._get_partial  # Cache method lookup
+
+        assert self.mustache_tree.children is not None
+        stack: t.List[_FrameT] = [
+            (iter(self.mustache_tree.children), ContextNode(data), None, None, None)
+        ]
+        stack_append = stack.append  # Cache method lookup
+        stack_pop = stack.pop  # Cache method lookup
+
+        while stack:
+            node_iter, curr_context, item_iter, section_body, outer_context = stack[-1]
+
+            for curr_node in node_iter:
+                if curr_node.tag_type is TagType.LITERAL:
+                    encoded = get_encoded_literal(curr_node.data)
+                    if encoded is None:
+                        # Racing threads may both encode, which is harmless
+                        encoded = curr_node.data.encode()
+                        encoded_literals[curr_node.data] = encoded
+
+                elif (
+                    curr_node.tag_type is TagType.VARIABLE
+                    or curr_node.tag_type is TagType.VARIABLE_RAW
+                ):
+                    assert curr_node.resolver is not None
+                    variable_content = curr_node.resolver(curr_context)
+                    if variable_content is None:
+                        continue
+
                     str_content = stringify(variable_content)
                     # Skip ahead if we get the empty string
                     if not str_content:
                         continue
                     if curr_node.tag_type is TagType.VARIABLE:
                         str_content = html_escape_fn(str_content)
+                    encoded = str_content.encode()
 
-                    res_list_append(str_content)
-            elif curr_node.tag_type is TagType.SECTION:
-                new_context_stacks = curr_context.open_section(curr_node.data)
-
-                assert curr_node.children is not None
+                elif curr_node.tag_type is TagType.SECTION:
+                    assert curr_node.resolver is not None
+                    new_context = curr_node.resolver(curr_context)
 
-                for new_context_stack in reversed(new_context_stacks):
-                    for child_node in reversed(curr_node.children):
-                        # No need to make a copy of the context per-child, it's immutable
-                        work_deque_appendleft((child_node, new_context_stack, 0))
+                    # If lookup is "falsy", no need to open the section
+                    if not new_context:
+                        continue
 
-            elif curr_node.tag_type is TagType.INVERTED_SECTION:
-                # No need to add to the context stack, inverted sections
-                # by definition aren't in the namespace and can't add anything.
-                lookup_data = curr_context.get(curr_node.data)
+                    section_items = None
+                    if isinstance(new_context, _SECTION_LIST_TYPES):
+                        section_items = iter(new_context)
+                        new_context = next(section_items)
+
+                    assert curr_node.children is not None
+                    stack_append(
+                        (
+                            iter(curr_node.children),
+                            ContextNode(new_context, curr_context),
+                            section_items,
+                            curr_node.children,
+                            curr_context,
+                        )
+                    )
+                    break
+
+                elif curr_node.tag_type is TagType.INVERTED_SECTION:
+                    assert curr_node.resolver is not None
+                    if not curr_node.resolver(curr_context):
+                        assert curr_node.children is not None
+                        stack_append(
+                            (iter(curr_node.children), curr_context, None, None, None)
+                        )
+                        break
+                    continue
 
-                assert curr_node.children is not None
+                elif curr_node.tag_type is TagType.PARTIAL:
+                    partial_tree = get_partial(curr_node.data, curr_node.offset)
 
-                if not bool(lookup_data):
-                    for child_node in reversed(curr_node.children):
-                        work_deque_appendleft((child_node, curr_context, 0))
+                    if partial_tree is None:
+                        continue
 
-            elif curr_node.tag_type is TagType.PARTIAL:
-                partial_tree = self.partials_dict.get(curr_node.data)
+                    assert partial_tree.children is not None
+                    stack_append(
+                        (iter(partial_tree.children), curr_context, None, None, None)
+                    )
+                    break
 
-                if partial_tree is None:
+                else:
                     continue
 
-                assert partial_tree.children is not None
+                res_list_append(encoded)
+                res_len += len(encoded)
 
-                # For standalone partials, add indentation at the beginning
-                # Only add if we're at the start of a line (last output was newline)
-                if curr_node.offset > 0 and last_was_newline:
-                    res_list_append(_get_spaces(curr_node.offset))
-                    last_was_newline = False
+                if res_len >= chunk_size:
+                    yield res_list
+                    res_list_clear()
+                    res_len = 0
 
-                # Propagate the combined offset through the partial content
-                for child_node in reversed(partial_tree.children):
-                    work_deque_appendleft(
-                        (child_node, curr_context, curr_offset + curr_node.offset)
-                    )
+            else:
+                # The frame is finished, move on to the next section item
+                if item_iter is not None:
+                    section_item = next(item_iter, _NO_ITEM)
+                    if section_item is not _NO_ITEM:
+                        assert section_body is not None
+                        stack[-1] = (
+                            iter(section_body),
+                            ContextNode(section_item, outer_context),
+                            item_iter,
+                            section_body,
+                            outer_context,
+                        )
+                        continue
 
-        return "".join(res_list)
+                stack_pop()
+
+        yield res_list
 
     @classmethod
     def from_template(
         cls: t.Type[te.Self],
         template_str: str,
         partials: t.Optional[t.Dict[str, str]] = None,
+        inline_partials: bool = False,
+        schema: t.Optional[SchemaT] = None,
     ) -> te.Self:
-        partials_tree_dict = None
+        """
+        Parse a template. Partials are parsed the first time a render
+        reaches them, so unused partials cost nothing; call `validate` to
+        check them all up front.
+
+        With `inline_partials`, every partial the template reaches is parsed
+        now and spliced into the tree with its indentation already applied,
+        so renders skip the partial lookups. Recursive partials stay dynamic.
+
+        With a `schema` describing the render data, names in the template
+        are bound at compile time to the scope they resolve in, see
+        `bind_schema`.
+        """
+        template_tree = create_mustache_tree(template_str)
+        partials_tree_dict: t.Optional[t.Mapping[str, MustacheTreeNode]] = None
+        dynamic_trees: t.Collection[MustacheTreeNode] = ()
 
         if partials is not None:
-            partials_tree_dict = {
-                key: create_mustache_tree(partial_data)
-                for key, partial_data in partials.items()
-            }
+            if inline_partials:
+                partials_tree_dict = _PartialInliner(partials).inline(template_tree)
+                # Inlined partials can share nodes with the recursive
+                # partials still rendered dynamically
+                dynamic_trees = partials_tree_dict.values()
+            else:
+                partials_tree_dict = LazyPartialsDict(partials)
+
+        if schema is not None:
+            bind_schema(template_tree, schema, dynamic_trees)
+
+        renderer = cls(template_tree, partials_tree_dict)
+        # Hashing every partial is deferred until the hash is needed
+        renderer._sources = (template_str, partials)
+        return renderer
 
-        template_tree = create_mustache_tree(template_str)
 
-        return cls(template_tree, partials_tree_dict)
+def compute_source_hash(
+    template_str: str, partials: t.Optional[t.Mapping[str, str]] = None
+) -> bytes:
+    """Hash identifying a template together with its partials."""
+    source_hash = hashlib.sha256()
+
+    sources = [template_str]
+    if partials:
+        for name in sorted(partials):
+            sources.extend((name, partials[name]))
+
+    # Length prefixes keep the encoding unambiguous
+    for source in sources:
+        encoded = source.encode("utf-8", "surrogatepass")
+        source_hash.update(len(encoded).to_bytes(8, "little"))
+        source_hash.update(encoded)
+
+    return source_hash.digest()
+
+
+# Flattened tree nodes in preorder: (tag type value, data, offset, number of
+# children or -1 for nodes that can't have children, scope). Flat tuples keep
+# deep trees clear of recursion limits in marshal.
+_FlatNodeT = t.Tuple[int, str, int, int, int]
+
+
+def _flatten_tree(root: MustacheTreeNode) -> t.Tuple[_FlatNodeT, ...]:
+    flat_nodes: t.List[_FlatNodeT] = []
+    work_stack = [root]
+
+    while work_stack:
+        curr_node = work_stack.pop()
+        children = curr_node.children
+        flat_nodes.append(
+            (
+                curr_node.tag_type.value,
+                curr_node.data,
+                curr_node.offset,
+                -1 if children is None else len(children),
+                curr_node.scope,
+            )
+        )
+        if children:
+            work_stack.extend(reversed(children))
+
+    return tuple(flat_nodes)
+
+
+def _unflatten_tree(flat_nodes: t.Sequence[_FlatNodeT]) -> MustacheTreeNode:
+    root: t.Optional[MustacheTreeNode] = None
+    # (node, number of children still to attach)
+    work_stack: t.List[t.List[t.Any]] = []
+
+    for tag_value, data, offset, num_children, scope in flat_nodes:
+        node = MustacheTreeNode(TagType(tag_value), data, offset)
+        # Only container nodes have a child count, which is -1 for the rest
+        if (num_children < 0) is (node.children is not None):
+            raise ValueError("Malformed tree.")
+        if scope != -1:
+            _bind_node(node, scope)
+
+        if work_stack:
+            parent_entry = work_stack[-1]
+            parent_entry[0].add_child(node)
+            parent_entry[1] -= 1
+            if parent_entry[1] == 0:
+                work_stack.pop()
+        elif root is None:
+            root = node
+        else:
+            raise ValueError("Trailing nodes after the root.")
+
+        if num_children > 0:
+            work_stack.append([node, num_children])
+
+    if root is None or work_stack or root.tag_type is not TagType.ROOT:
+        raise ValueError("Malformed tree.")
+
+    return root
 
 
 def handle_final_line_clear(
@@ -428,14 +1917,20 @@ def process_raw_token_list(
 
 
 def create_mustache_tree(thing: str) -> MustacheTreeNode:
-    root = MustacheTreeNode(TagType.ROOT, "", 0)
+    raw_token_list = mustache_tokenizer(thing)
+    token_list = process_raw_token_list(raw_token_list)
+    return _build_mustache_tree(thing, token_list)
+
+
+def _build_mustache_tree(
+    thing: str, token_list: t.Iterable[TokenTuple]
+) -> MustacheTreeNode:
+    """Build the tree of a template from its processed tokens."""
+    root = MustacheTreeNode(TagType.ROOT, thing, 0)
     work_stack: t.Deque[MustacheTreeNode] = deque([root])
     work_stack_append = work_stack.append  # Cache method lookup
     work_stack_pop = work_stack.pop  # Cache method lookup
 
-    raw_token_list = mustache_tokenizer(thing)
-    token_list = process_raw_token_list(raw_token_list)
-
     for token_type, token_data, token_offset in token_list:
         if token_type is TokenType.LITERAL:
             work_stack[-1].add_child(
@@ -474,6 +1969,19 @@ def create_mustache_tree(thing: str) -> MustacheTreeNode:
             pass
 
         elif token_type is TokenType.PARTIAL:
+            siblings = work_stack[-1].children
+            assert siblings is not None
+
+            # Only standalone partials are indented. Text before the tag on
+            # the same line means it isn't standalone.
+            if (
+                token_offset
+                and siblings
+                and siblings[-1].tag_type is TagType.LITERAL
+                and not siblings[-1].data.endswith("\n")
+            ):
+                token_offset = 0
+
             work_stack[-1].add_child(
                 MustacheTreeNode(TagType.PARTIAL, token_data, token_offset)
             )
@@ -483,9 +1991,699 @@ def create_mustache_tree(thing: str) -> MustacheTreeNode:
     if work_stack[-1].tag_type is not TagType.ROOT:
         raise MissingClosingTagError(f"Missing closing tag for {work_stack[-1].data}")
 
+    coalesce_literals(root)
+
     return root
 
 
+def coalesce_literals(node: MustacheTreeNode) -> None:
+    """
+    Optimisation pass merging runs of adjacent literal children into a single
+    literal, recursively. The tokenizer ends a literal at every newline, and
+    comments and delimiter changes leave no nodes behind, so static text
+    otherwise ends up spread over many nodes. A section body without dynamic
+    content folds into a single literal.
+
+    The merged node keeps the offset of the first literal of the run. Partials
+    are indented in their source before they're parsed, so merged literals
+    already hold their indentation.
+    """
+    work_stack = [node]
+
+    while work_stack:
+        curr_node = work_stack.pop()
+        children = curr_node.children
+
+        if not children:
+            continue
+
+        new_children: t.List[MustacheTreeNode] = []
+        literal_run: t.List[MustacheTreeNode] = []
+
+        for child in children:
+            if child.tag_type is TagType.LITERAL:
+                literal_run.append(child)
+                continue
+
+            _flush_literal_run(literal_run, new_children)
+            new_children.append(child)
+
+            if child.children:
+                work_stack.append(child)
+
+        _flush_literal_run(literal_run, new_children)
+
+        # Modify in place so the node can still be shared
+        children[:] = new_children
+
+
+def _flush_literal_run(
+    literal_run: t.List[MustacheTreeNode], new_children: t.List[MustacheTreeNode]
+) -> None:
+    if not literal_run:
+        return
+
+    if len(literal_run) == 1:
+        new_children.append(literal_run[0])
+    else:
+        new_children.append(
+            MustacheTreeNode(
+                TagType.LITERAL,
+                "".join(literal.data for literal in literal_run),
+                literal_run[0].offset,
+            )
+        )
+
+    literal_run.clear()
+
+
+class _PartialInliner:
+    """
+    Optimisation pass splicing partials into the trees that include them.
+    As in the spec, indentation is applied to the partial source before it
+    is parsed, so inlined partials render exactly like dynamic ones.
+    Partials that can include themselves are left as dynamic partial tags.
+    """
+
+    __slots__ = ("sources", "recursive_names", "expansions")
+
+    sources: t.Mapping[str, str]
+    recursive_names: t.Set[str]
+    # Inlined children of each partial, by name and indentation width
+    expansions: t.Dict[t.Tuple[str, int], t.List[MustacheTreeNode]]
+
+    def __init__(self, sources: t.Mapping[str, str]) -> None:
+        self.sources = sources
+        self.recursive_names = set()
+        self.expansions = {}
+
+    def inline(self, template_tree: MustacheTreeNode) -> t.Dict[str, MustacheTreeNode]:
+        """
+        Inline partials into `template_tree` in place, returning the trees
+        of the partials it can reach. Only recursive partials are still
+        used at render time, and those have their own partials inlined.
+        """
+        partial_trees = LazyPartialsDict(self.sources)
+        partial_graph = _partial_graph(template_tree, partial_trees)
+        self.recursive_names = _recursive_partials(partial_graph)
+
+        self.inline_tree(template_tree)
+
+        partials_tree_dict: t.Dict[str, MustacheTreeNode] = {}
+        for name in partial_graph:
+            partial_tree = partial_trees[name]
+            if name in self.recursive_names:
+                self.inline_tree(partial_tree)
+            # Indented copies of recursive partials are parsed from source,
+            # so the partials they include must stay available
+            partials_tree_dict[name] = partial_tree
+
+        return partials_tree_dict
+
+    def inline_tree(self, tree: MustacheTreeNode) -> None:
+        work_stack = [tree]
+
+        while work_stack:
+            children = work_stack.pop().children
+            assert children is not None
+
+            new_children: t.List[MustacheTreeNode] = []
+            for child in children:
+                if child.tag_type is not TagType.PARTIAL:
+                    new_children.append(child)
+                    if child.children:
+                        work_stack.append(child)
+                elif child.data in self.recursive_names:
+                    new_children.append(child)
+                elif child.data in self.sources:
+                    new_children.extend(self.expand(child.data, child.offset))
+
+            children[:] = new_children
+
+        coalesce_literals(tree)
+
+    def expand(self, name: str, offset: int) -> t.List[MustacheTreeNode]:
+        key = (name, offset)
+        expansion = self.expansions.get(key)
+
+        if expansion is None:
+            source = self.sources[name]
+            if offset > 0:
+                source = _indent_source(source, _get_spaces(offset))
+
+            partial_tree = create_mustache_tree(source)
+            self.inline_tree(partial_tree)
+            assert partial_tree.children is not None
+            expansion = self.expansions[key] = partial_tree.children
+
+        return expansion
+
+
+# Description of the shape of render data: a dict of names to schemas, a
+# one-item list for lists, a TypedDict, a dataclass, a typing annotation
+# such as t.List[Row], a leaf type such as str, or a JSON-schema-like dict.
+SchemaT = t.Any
+
+_LEAF_SCHEMA_TYPES = (str, int, float, bool, bytes, type(None))
+_JSON_SCHEMA_TYPES = frozenset(
+    ("object", "array", "string", "number", "integer", "boolean", "null")
+)
+
+
+def _json_schema_type(schema: t.Dict[str, t.Any]) -> t.Optional[str]:
+    json_type = schema.get("type")
+    if isinstance(json_type, str) and json_type in _JSON_SCHEMA_TYPES:
+        return json_type
+    return None
+
+
+def _unwrap_optional(schema: SchemaT) -> SchemaT:
+    """The schema `X` of `t.Optional[X]`, since None values open no scope."""
+    if t.get_origin(schema) is t.Union:
+        args = [arg for arg in t.get_args(schema) if arg is not type(None)]
+        # Other unions could have any shape
+        return args[0] if len(args) == 1 else None
+    return schema
+
+
+def _schema_keys(schema: SchemaT) -> t.Optional[t.Dict[str, SchemaT]]:
+    """
+    Names a scope described by `schema` holds, with their schemas. Scopes
+    that can't hold names give {}, and scopes with unknown names give None.
+    """
+    schema = _unwrap_optional(schema)
+
+    if isinstance(schema, dict):
+        json_type = _json_schema_type(schema)
+        if json_type is None:
+            return schema
+        if json_type != "object":
+            return {}
+        properties = schema.get("properties")
+        return properties if isinstance(properties, dict) else None
+
+    if isinstance(schema, list) or t.get_origin(schema) is list:
+        return {}
+
+    if te.is_typeddict(schema):
+        return t.get_type_hints(schema)
+
+    if isinstance(schema, type) and dataclasses.is_dataclass(schema):
+        # Field types are schemas for the values, looked into in turn by
+        # the lookups that go through them
+        hints = t.get_type_hints(schema)
+        return {
+            field.name: hints.get(field.name) for field in dataclasses.fields(schema)
+        }
+
+    if isinstance(schema, type) and issubclass(schema, _LEAF_SCHEMA_TYPES):
+        return {}
+
+    return None
+
+
+def _list_item_schema(schema: SchemaT) -> t.Tuple[bool, SchemaT]:
+    """Whether `schema` describes lists, and if so the schema of the items."""
+    schema = _unwrap_optional(schema)
+
+    if isinstance(schema, list):
+        return True, schema[0] if len(schema) == 1 else None
+
+    if isinstance(schema, dict):
+        return _json_schema_type(schema) == "array", schema.get("items")
+
+    if t.get_origin(schema) is list:
+        args = t.get_args(schema)
+        return True, args[0] if args else None
+
+    return False, None
+
+
+def _lookup_schema(
+    scope_schemas: t.Tuple[SchemaT, ...], key: str
+) -> t.Tuple[int, SchemaT]:
+    """
+    How many scopes out from the innermost of `scope_schemas` a name
+    resolves, or -1 if that isn't known, and the schema of its value.
+    """
+    if key == ".":
+        return 0, scope_schemas[-1]
+
+    first_key, rest_path = parse_key(key)
+
+    for scope, scope_schema in enumerate(reversed(scope_schemas)):
+        keys = _schema_keys(scope_schema)
+        if keys is None:
+            break
+        if first_key in keys:
+            value_schema = keys[first_key]
+            for rest_key, int_key in rest_path:
+                is_list, item_schema = _list_item_schema(value_schema)
+                if is_list:
+                    value_schema = item_schema if int_key is not None else None
+                else:
+                    rest_keys = _schema_keys(value_schema)
+                    value_schema = (
+                        None if rest_keys is None else rest_keys.get(rest_key)
+                    )
+            return scope, value_schema
+
+    return -1, None
+
+
+def _bind_node(node: MustacheTreeNode, scope: int) -> None:
+    node.scope = scope
+    # Names in the innermost scope are already found first by the dynamic
+    # lookup
+    if scope > 0:
+        node.resolver = make_bound_resolver(node.data, scope)
+
+
+def bind_schema(
+    mustache_tree: MustacheTreeNode,
+    schema: SchemaT,
+    dynamic_trees: t.Iterable[MustacheTreeNode] = (),
+) -> None:
+    """
+    Bind each name in the tree to the scope it resolves in according to
+    `schema`, which describes the data passed to render. Bound names are
+    looked up in that scope directly, skipping the scopes in between, so
+    the schema must list every name a scope's data can hold. Names the
+    schema doesn't place, and data that doesn't match it at render time,
+    fall back to the dynamic lookup.
+
+    Nodes reachable from `dynamic_trees` are rendered at varying depths and
+    are left unbound, as are nodes that are reached from several places
+    that disagree on the scope.
+    """
+    dynamic_ids: t.Set[int] = set()
+    node_stack = list(dynamic_trees)
+    while node_stack:
+        curr_node = node_stack.pop()
+        dynamic_ids.add(id(curr_node))
+        if curr_node.children:
+            node_stack.extend(curr_node.children)
+
+    bindings: t.Dict[int, t.Tuple[MustacheTreeNode, int]] = {}
+    assert mustache_tree.children is not None
+    # Items are (node, schemas of the enclosing scopes, innermost last)
+    work_stack: t.List[t.Tuple[MustacheTreeNode, t.Tuple[SchemaT, ...]]] = [
+        (child, (schema,)) for child in mustache_tree.children
+    ]
+
+    while work_stack:
+        curr_node, scope_schemas = work_stack.pop()
+        tag_type = curr_node.tag_type
+        if tag_type not in _LOOKUP_TAG_TYPES:
+            continue
+
+        scope, value_schema = _lookup_schema(scope_schemas, curr_node.data)
+
+        node_id = id(curr_node)
+        if node_id not in dynamic_ids:
+            prev_binding = bindings.get(node_id)
+            if prev_binding is not None and prev_binding[1] != scope:
+                scope = -1
+            bindings[node_id] = (curr_node, scope)
+
+        if tag_type is TagType.SECTION:
+            # Each item (or the value itself) opens one scope
+            is_list, item_schema = _list_item_schema(value_schema)
+            scope_schemas += (item_schema if is_list else value_schema,)
+
+        if curr_node.children:
+            work_stack.extend((child, scope_schemas) for child in curr_node.children)
+
+    for curr_node, scope in bindings.values():
+        if scope != -1 and curr_node.data != ".":
+            _bind_node(curr_node, scope)
+
+
+def _indent_source(source: str, indent: str) -> str:
+    """Indent every line of a partial source."""
+    if not source:
+        return source
+
+    res = indent + source.replace("\n", "\n" + indent)
+    # No line follows a final newline
+    if source.endswith("\n"):
+        res = res[: -len(indent)]
+    return res
+
+
+def _ends_line(nodes: t.List[MustacheTreeNode]) -> bool:
+    """Whether `nodes` end with a newline."""
+    if not nodes:
+        return False
+    last_node = nodes[-1]
+    return last_node.tag_type is TagType.LITERAL and last_node.data.endswith("\n")
+
+
+def _indent_tree(root: MustacheTreeNode, indent: str) -> MustacheTreeNode:
+    """
+    Copy of a partial tree with every line indented, for trees with no
+    source to indent. A section whose body ends a line indents the start of
+    its body, so every item's line is indented, and partials starting a line
+    are indented as standalone ones.
+    """
+    new_root = MustacheTreeNode(TagType.ROOT, "", root.offset)
+    assert root.children is not None
+    # Items are (nodes to copy, the copied node to add them to)
+    work_stack: t.List[t.Tuple[t.Iterator[MustacheTreeNode], MustacheTreeNode]] = [
+        (iter(root.children), new_root)
+    ]
+    # Whether the next output starts a line
+    at_line_start = True
+
+    while work_stack:
+        nodes, new_parent = work_stack[-1]
+        node = next(nodes, None)
+        if node is None:
+            work_stack.pop()
+            continue
+
+        tag_type = node.tag_type
+        new_node = MustacheTreeNode(tag_type, node.data, node.offset)
+        new_node.resolver = node.resolver
+        new_node.scope = node.scope
+
+        if tag_type is TagType.LITERAL:
+            if node.data:
+                text = node.data.replace("\n", "\n" + indent)
+                if at_line_start:
+                    text = indent + text
+                at_line_start = text.endswith("\n" + indent)
+                if at_line_start:
+                    text = text[: -len(indent)]
+                new_node.data = text
+
+        elif tag_type is TagType.PARTIAL:
+            if at_line_start:
+                new_node.offset += len(indent)
+
+        elif at_line_start and not (node.children and _ends_line(node.children)):
+            new_parent.add_child(MustacheTreeNode(TagType.LITERAL, indent, 0))
+            at_line_start = False
+
+        new_parent.add_child(new_node)
+        if node.children:
+            work_stack.append((iter(node.children), new_node))
+
+    return new_root
+
+
+def _partial_graph(
+    template_tree: MustacheTreeNode, partial_trees: t.Mapping[str, MustacheTreeNode]
+) -> t.Dict[str, t.List[str]]:
+    """Partials reachable from the template, with the partials each includes."""
+    partial_graph: t.Dict[str, t.List[str]] = {}
+    work_stack: t.List[t.Tuple[t.Optional[str], MustacheTreeNode]] = [
+        (None, template_tree)
+    ]
+
+    while work_stack:
+        parent_name, tree = work_stack.pop()
+        node_stack = [tree]
+
+        while node_stack:
+            curr_node = node_stack.pop()
+
+            if curr_node.tag_type is TagType.PARTIAL:
+                name = curr_node.data
+                partial_tree = partial_trees.get(name)
+                if partial_tree is None:
+                    continue
+
+                if parent_name is not None:
+                    partial_graph[parent_name].append(name)
+                if name not in partial_graph:
+                    partial_graph[name] = []
+                    work_stack.append((name, partial_tree))
+
+            elif curr_node.children:
+                node_stack.extend(curr_node.children)
+
+    return partial_graph
+
+
+def _reachable_partials(
+    partial_graph: t.Dict[str, t.List[str]],
+) -> t.Dict[str, t.Set[str]]:
+    """Partials each partial can include, directly or through others."""
+    reachable_partials: t.Dict[str, t.Set[str]] = {}
+
+    for name in partial_graph:
+        reachable: t.Set[str] = set()
+        work_stack = list(partial_graph[name])
+
+        while work_stack:
+            curr_name = work_stack.pop()
+            if curr_name not in reachable:
+                reachable.add(curr_name)
+                work_stack.extend(partial_graph[curr_name])
+
+        reachable_partials[name] = reachable
+
+    return reachable_partials
+
+
+def _recursive_partials(partial_graph: t.Dict[str, t.List[str]]) -> t.Set[str]:
+    """Names of the partials that can include themselves."""
+    recursive_names: t.Set[str] = set()
+
+    for name in partial_graph:
+        seen_names: t.Set[str] = set()
+        work_stack = list(partial_graph[name])
+
+        while work_stack:
+            curr_name = work_stack.pop()
+            if curr_name == name:
+                recursive_names.add(name)
+                break
+            if curr_name not in seen_names:
+                seen_names.add(curr_name)
+                work_stack.extend(partial_graph[curr_name])
+
+    return recursive_names
+
+
+# Dedupe key of contexts that can't be deduplicated
+_NO_CONTEXT = object()
+
+# Types whose values always stringify the same way when they are equal
+_DEDUPE_VALUE_TYPES = (str, int, bool, type(None))
+
+
+class _Identity:
+    """Hashable wrapper comparing by identity, keeping the object alive."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: t.Any) -> None:
+        self.value = value
+
+    def __hash__(self) -> int:
+        return id(self.value)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Identity) and other.value is self.value
+
+
+def _dedupe_key(value: t.Any) -> t.Hashable:
+    """
+    Hashable key that is equal for two contexts only if they are certain to
+    render the same. Types are part of the key since e.g. 1 == True but
+    they stringify differently, and dict order matters for the same reason.
+    """
+    value_type = type(value)
+
+    if value_type in _DEDUPE_VALUE_TYPES:
+        return (value_type, value)
+    if value_type is dict:
+        return (
+            dict,
+            tuple((_dedupe_key(key), _dedupe_key(val)) for key, val in value.items()),
+        )
+    if value_type is list or value_type is tuple:
+        return (value_type, tuple(_dedupe_key(item) for item in value))
+    return _Identity(value)
+
+
+# Header of serialized renderers: magic, format version, marshal version and
+# the hash of the template sources.
+_SERIALIZATION_HEADER = struct.Struct("<4sHH32s")
+_SERIALIZATION_MAGIC = b"MYST"
+_SERIALIZATION_VERSION = 3
+_NO_SOURCE_HASH = bytes(32)
+
+
+class CacheInfo(t.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class RendererCache:
+    """
+    Bounded, thread-safe LRU of compiled renderers keyed on the template
+    text and the contents of the partials dict. A maxsize of 0 disables
+    caching.
+    """
+
+    __slots__ = ("_cache", "_lock", "_maxsize", "_hits", "_misses")
+
+    _cache: OrderedDict[t.Hashable, MustacheRenderer]
+    _lock: threading.Lock
+    _maxsize: int
+    _hits: int
+    _misses: int
+
+    def __init__(self, maxsize: int = 128) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative.")
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative.")
+
+        with self._lock:
+            self._maxsize = maxsize
+            while len(self._cache) > maxsize:
+                self._cache.popitem(last=False)
+
+    def get(
+        self, template: str, partials: t.Optional[t.Dict[str, str]] = None
+    ) -> MustacheRenderer:
+        # frozenset hashing is O(len(partials)), and strings cache their hash
+        key = (template, frozenset(partials.items()) if partials else None)
+
+        with self._lock:
+            renderer = self._cache.get(key)
+            if renderer is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return renderer
+            self._misses += 1
+
+        # Compile outside the lock so a slow template doesn't block other
+        # threads. Racing threads may both compile, which is harmless.
+        renderer = MustacheRenderer.from_template(template, partials)
+
+        with self._lock:
+            if self._maxsize > 0:
+                self._cache[key] = renderer
+                self._cache.move_to_end(key)
+                if len(self._cache) > self._maxsize:
+                    self._cache.popitem(last=False)
+
+        return renderer
+
+    def clear(self) -> None:
+        """Remove all cached renderers and reset the counters."""
+        with self._lock:
+            self._cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._cache))
+
+
+# Cache used by render_from_template
+renderer_cache = RendererCache()
+
+# Types whose equal values always stringify the same way. Floats are left
+# out, as 0.0 == -0.0.
+_MEMO_VALUE_TYPES = frozenset((str, int, bool))
+
+
+class EscapeMemo:
+    """
+    Bounded memo of `stringify` and `html_escape_fn` results, shared across
+    renders. Pass its `stringify` and `html_escape` to any render method in
+    place of the plain functions:
+
+        memo = EscapeMemo()
+        renderer.render(data, memo.stringify, memo.html_escape)
+
+    Escaped text is memoized by the stringified value, and custom
+    `stringify` results by value for strings, ints and bools. The default
+    `str` isn't memoized, as it is as fast as a lookup. Each memo keeps the
+    `maxsize` most recently used entries; a maxsize of 0 turns memoization
+    off and hands back the plain functions.
+    """
+
+    __slots__ = ("maxsize", "stringify", "html_escape", "_caches")
+
+    maxsize: int
+    stringify: t.Callable[[t.Any], str]
+    html_escape: t.Callable[[str], str]
+    # The lru_cache wrappers in use, for their statistics
+    _caches: t.List[t.Any]
+
+    def __init__(
+        self,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+        maxsize: int = 4096,
+    ) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative.")
+
+        self.maxsize = maxsize
+        self.stringify = stringify
+        self.html_escape = html_escape_fn
+        self._caches = []
+
+        if maxsize == 0:
+            return
+
+        # lru_cache hits run no Python code, unlike a dict lookup in a
+        # wrapper function
+        cached_escape = functools.lru_cache(maxsize)(html_escape_fn)
+        self.html_escape = cached_escape
+        self._caches.append(cached_escape)
+
+        if stringify is not str:
+            cached_stringify = functools.lru_cache(maxsize, typed=True)(stringify)
+            self._caches.append(cached_stringify)
+
+            def stringify_value(value: t.Any) -> str:
+                if type(value) in _MEMO_VALUE_TYPES:
+                    return cached_stringify(value)
+                return stringify(value)
+
+            self.stringify = stringify_value
+
+    def clear(self) -> None:
+        """Drop all memoized results and reset the counters."""
+        for cache in self._caches:
+            cache.cache_clear()
+
+    def info(self) -> CacheInfo:
+        """Hits, misses and entries, summed over the escape and stringify memos."""
+        hits = misses = currsize = 0
+        for cache in self._caches:
+            cache_info = cache.cache_info()
+            hits += cache_info.hits
+            misses += cache_info.misses
+            currsize += cache_info.currsize
+        return CacheInfo(hits, misses, self.maxsize, currsize)
+
+
 def render_from_template(
     template: str,
     data: ContextObjT = None,
@@ -493,6 +2691,6 @@ def render_from_template(
     stringify: t.Callable[[t.Any], str] = str,
     html_escape_fn: t.Callable[[str], str] = html_escape,
 ) -> str:
-    return MustacheRenderer.from_template(template, partials).render(
+    return renderer_cache.get(template, partials).render(
         data, stringify, html_escape_fn
     )
@@ -0,0 +1,152 @@
+"""
+Parallel batch rendering on top of `MustacheRenderer`.
+
+The renderer (with its parsed partials) is shipped to each worker once when
+the pool starts. Contexts are then sent in chunks, and outputs come back in
+the original order.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import typing as t
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+import typing_extensions as te
+from more_itertools import chunked
+
+from .mustache_tree import ContextObjT, MustacheRenderer
+from .util import html_escape
+
+ExecutorKindT = t.Literal["process", "interpreter"]
+
+# Per-worker state, set once by _init_worker
+_worker_renderer: t.Optional[MustacheRenderer] = None
+_worker_stringify: t.Callable[[t.Any], str] = str
+_worker_html_escape_fn: t.Callable[[str], str] = html_escape
+
+
+def _init_worker(
+    renderer: MustacheRenderer,
+    stringify: t.Callable[[t.Any], str],
+    html_escape_fn: t.Callable[[str], str],
+) -> None:
+    global _worker_renderer, _worker_stringify, _worker_html_escape_fn
+    _worker_renderer = renderer
+    _worker_stringify = stringify
+    _worker_html_escape_fn = html_escape_fn
+
+
+def _render_chunk(datas: t.List[ContextObjT]) -> t.List[str]:
+    assert _worker_renderer is not None
+    return t.cast(
+        t.List[str],
+        _worker_renderer.render_many(datas, _worker_stringify, _worker_html_escape_fn),
+    )
+
+
+class ParallelRenderer:
+    """
+    A pool of worker processes (or, on Python 3.14+, subinterpreters) that
+    each hold a copy of one renderer. `stringify` and `html_escape_fn` are
+    shipped to the workers too, so they must be picklable (e.g. module-level
+    functions).
+
+    Typical usage: ::
+
+        with ParallelRenderer(renderer, max_workers=8) as pool:
+            for output in pool.render_many(contexts):
+                ...
+    """
+
+    __slots__ = ("_executor", "_max_in_flight", "chunk_size")
+
+    _executor: Executor
+    _max_in_flight: int
+    chunk_size: int
+
+    def __init__(
+        self,
+        renderer: MustacheRenderer,
+        max_workers: t.Optional[int] = None,
+        chunk_size: int = 256,
+        executor: ExecutorKindT = "process",
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> None:
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+
+        initargs = (renderer, stringify, html_escape_fn)
+
+        if executor == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers, initializer=_init_worker, initargs=initargs
+            )
+        elif executor == "interpreter":
+            if sys.version_info >= (3, 14):
+                from concurrent.futures import InterpreterPoolExecutor
+
+                self._executor = InterpreterPoolExecutor(
+                    max_workers, initializer=_init_worker, initargs=initargs
+                )
+            else:
+                raise ValueError("The interpreter executor requires Python 3.14+.")
+        else:
+            raise ValueError(f"Unknown executor kind {executor!r}.")
+
+        # Keep a couple of chunks queued per worker so none of them idle
+        # while results are consumed, without reading all contexts up front.
+        self._max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+
+    def render_many(
+        self,
+        datas: t.Iterable[ContextObjT],
+        chunk_size: t.Optional[int] = None,
+    ) -> t.Iterator[str]:
+        """
+        Lazily render every context, yielding outputs in input order. Only
+        a bounded number of chunks are in flight at any time, so `datas` can
+        be a long-running generator.
+        """
+        in_flight: t.Deque[Future[t.List[str]]] = deque()
+
+        for datas_chunk in chunked(datas, chunk_size or self.chunk_size):
+            in_flight.append(self._executor.submit(_render_chunk, datas_chunk))
+
+            if len(in_flight) >= self._max_in_flight:
+                yield from in_flight.popleft().result()
+
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        self.close()
+
+
+def render_parallel(
+    renderer: MustacheRenderer,
+    datas: t.Iterable[ContextObjT],
+    max_workers: t.Optional[int] = None,
+    chunk_size: int = 256,
+    executor: ExecutorKindT = "process",
+    stringify: t.Callable[[t.Any], str] = str,
+    html_escape_fn: t.Callable[[str], str] = html_escape,
+) -> t.List[str]:
+    """
+    Render every context in parallel with a temporary `ParallelRenderer`.
+    Use `ParallelRenderer` directly to reuse the workers across batches.
+    """
+    with ParallelRenderer(
+        renderer, max_workers, chunk_size, executor, stringify, html_escape_fn
+    ) as pool:
+        return list(pool.render_many(datas))
@@ -0,0 +1,356 @@
+"""
+Render sessions that re-render only what changed data affects.
+
+A `RenderSession` renders a template once, keeping its output split into a
+segment per tag rendered, each with the context paths its lookup depends on.
+When some paths of the data change, only the segments depending on them are
+rendered again, and their new output is spliced into the output around them.
+"""
+
+from __future__ import annotations
+
+import functools
+import typing as t
+
+from .mustache_tree import (
+    _MISSING,
+    _SECTION_LIST_TYPES,
+    ContextObjT,
+    MustacheRenderer,
+    MustacheTreeNode,
+    TagType,
+    _follow_path,
+    _get_value,
+    parse_key,
+)
+from .util import html_escape
+
+# Where a value is in the data, as the keys (and list indices) from the root
+PathT = t.Tuple[str, ...]
+# Scopes a tag is rendered in, innermost first, with their paths
+_ChainT = t.Tuple[t.Tuple[t.Any, PathT], ...]
+
+
+class _Segment:
+    """
+    The output of a section, inverted section or variable tag where it was
+    rendered, or of the whole template.
+    """
+
+    __slots__ = (
+        "node",
+        "scopes",
+        "parent",
+        "index",
+        "depth",
+        "text",
+        "parts",
+        "children",
+        "paths",
+    )
+
+    node: MustacheTreeNode
+    # Paths of the scopes the tag is rendered in, innermost first. Scopes are
+    # looked up again by path when the tag is, as they may have been replaced.
+    scopes: t.Tuple[PathT, ...]
+    parent: t.Optional[_Segment]
+    # Position of the text in the parts of the parent
+    index: int
+    depth: int
+    text: str
+    # Literals and texts of the segments in the body of a section
+    parts: t.List[str]
+    children: t.List[_Segment]
+    # Paths the lookup of the tag went through
+    paths: t.List[PathT]
+
+    def __init__(
+        self,
+        node: MustacheTreeNode,
+        scopes: t.Tuple[PathT, ...],
+        parent: t.Optional[_Segment],
+        index: int,
+        depth: int,
+    ) -> None:
+        self.node = node
+        self.scopes = scopes
+        self.parent = parent
+        self.index = index
+        self.depth = depth
+        self.text = ""
+        self.parts = []
+        self.children = []
+        self.paths = []
+
+
+class _PathNode:
+    """Segments depending on a path, and the nodes of the paths below it."""
+
+    __slots__ = ("segments", "children")
+
+    segments: t.Set[_Segment]
+    children: t.Dict[str, _PathNode]
+
+    def __init__(self) -> None:
+        self.segments = set()
+        self.children = {}
+
+
+class RenderSession:
+    """
+    The output of rendering a template, kept up to date as its data changes.
+
+    `update` takes the paths of the data that changed, such as `"stats.cpu"`
+    or `"rows.3"`, and renders again only the tags whose lookups went through
+    them, so an update costs about as much as the output that changed rather
+    than the whole template. A changed path covers everything below it, and
+    a list that grows or shrinks is changed by its own path. Data can be
+    changed in place or passed anew to `update`, with only the changed paths
+    differing.
+    """
+
+    __slots__ = ("renderer", "data", "stringify", "html_escape_fn", "_root", "_paths")
+
+    renderer: MustacheRenderer
+    data: ContextObjT
+    stringify: t.Callable[[t.Any], str]
+    html_escape_fn: t.Callable[[str], str]
+    _root: _Segment
+    # Segments by the paths they depend on
+    _paths: _PathNode
+
+    def __init__(
+        self,
+        renderer: MustacheRenderer,
+        data: ContextObjT,
+        stringify: t.Callable[[t.Any], str] = str,
+        html_escape_fn: t.Callable[[str], str] = html_escape,
+    ) -> None:
+        self.renderer = renderer
+        self.data = data
+        self.stringify = stringify
+        self.html_escape_fn = html_escape_fn
+        self._paths = _PathNode()
+
+        root_node = renderer.mustache_tree
+        assert root_node.children is not None
+        self._root = _Segment(root_node, (), None, 0, 0)
+        self._fill(self._root, root_node.children, ((data, ()),))
+        self._root.text = "".join(self._root.parts)
+
+    @property
+    def output(self) -> str:
+        return self._root.text
+
+    def update(
+        self,
+        changed: t.Iterable[t.Union[str, t.Sequence[t.Any]]],
+        data: t.Optional[ContextObjT] = None,
+    ) -> str:
+        """
+        Render again what depends on the `changed` paths, given as dotted
+        names or sequences of keys, with `"."` for the whole data. Returns
+        the new output.
+        """
+        if data is not None:
+            self.data = data
+
+        found: t.Set[_Segment] = set()
+        for path in changed:
+            self._collect(_parse_path(path), found)
+
+        # Ancestors of the segments rendered again, to join once each
+        stale: t.Dict[_Segment, None] = {}
+        for segment in found:
+            # Segments inside one rendered again are rendered with it
+            parent = segment.parent
+            while parent is not None and parent not in found:
+                parent = parent.parent
+            if parent is not None:
+                continue
+
+            old_text = segment.text
+            self._redo(segment)
+            if segment.text == old_text:
+                continue
+
+            parent = segment.parent
+            assert parent is not None
+            parent.parts[segment.index] = segment.text
+            while parent is not None and parent not in stale:
+                stale[parent] = None
+                parent = parent.parent
+
+        # Deepest first, so every segment is joined after the ones inside it
+        for segment in sorted(stale, key=lambda segment: -segment.depth):
+            segment.text = "".join(segment.parts)
+            parent = segment.parent
+            if parent is not None:
+                parent.parts[segment.index] = segment.text
+
+        return self._root.text
+
+    def _fill(
+        self, segment: _Segment, nodes: t.List[MustacheTreeNode], chain: _ChainT
+    ) -> None:
+        """Render `nodes` into the parts of `segment`."""
+        parts = segment.parts
+        parts_append = parts.append  # Cache method lookup
+        children_append = segment.children.append  # Cache method lookup
+        scopes = tuple(path for _, path in chain)
+        depth = segment.depth + 1
+
+        for node in nodes:
+            if node.tag_type is TagType.LITERAL:
+                parts_append(node.data)
+
+            elif node.tag_type is TagType.PARTIAL:
+                partial_tree = self.renderer._get_partial(node.data, node.offset)
+                if partial_tree is not None:
+                    assert partial_tree.children is not None
+                    self._fill(segment, partial_tree.children, chain)
+
+            else:
+                child = _Segment(node, scopes, segment, len(parts), depth)
+                self._render(child, chain)
+                parts_append(child.text)
+                children_append(child)
+
+    def _render(self, segment: _Segment, chain: _ChainT) -> None:
+        node = segment.node
+        value, path, segment.paths = _lookup(chain, node.data)
+        self._register(segment)
+
+        if node.tag_type is TagType.VARIABLE or node.tag_type is TagType.VARIABLE_RAW:
+            text = "" if value is None else self.stringify(value)
+            if text and node.tag_type is TagType.VARIABLE:
+                text = self.html_escape_fn(text)
+            segment.text = text
+            return
+
+        assert node.children is not None
+        if node.tag_type is TagType.SECTION:
+            if value:
+                assert path is not None
+                if isinstance(value, _SECTION_LIST_TYPES):
+                    for index, item in enumerate(value):
+                        item_chain = ((item, path + (str(index),)),) + chain
+                        self._fill(segment, node.children, item_chain)
+                else:
+                    self._fill(segment, node.children, ((value, path),) + chain)
+
+        elif not value:
+            self._fill(segment, node.children, chain)
+
+        segment.text = "".join(segment.parts)
+
+    def _redo(self, segment: _Segment) -> None:
+        """Render a segment again, in scopes looked up from the current data."""
+        self._unregister(segment)
+        segment.parts = []
+        segment.children = []
+
+        chain = tuple((self._scope_at(path), path) for path in segment.scopes)
+        self._render(segment, chain)
+
+    def _scope_at(self, path: PathT) -> t.Any:
+        scope = self.data
+        for key in path:
+            if scope is None:
+                break
+            scope = _follow_path(scope, ((key, int(key) if key.isdigit() else None),))
+        return scope
+
+    def _register(self, segment: _Segment) -> None:
+        for path in segment.paths:
+            path_node = self._paths
+            for key in path:
+                next_node = path_node.children.get(key)
+                if next_node is None:
+                    next_node = path_node.children[key] = _PathNode()
+                path_node = next_node
+            path_node.segments.add(segment)
+
+    def _unregister(self, segment: _Segment) -> None:
+        """Drop a segment and every segment inside it from the path index."""
+        work_stack = [segment]
+        while work_stack:
+            curr_segment = work_stack.pop()
+            work_stack.extend(curr_segment.children)
+
+            for path in curr_segment.paths:
+                path_node: t.Optional[_PathNode] = self._paths
+                for key in path:
+                    assert path_node is not None
+                    path_node = path_node.children.get(key)
+                if path_node is not None:
+                    path_node.segments.discard(curr_segment)
+
+    def _collect(self, path: PathT, found: t.Set[_Segment]) -> None:
+        """Add the segments a change at `path` affects to `found`."""
+        path_node = self._paths
+        for key in path:
+            # A change inside a value changes how a variable shows it, but
+            # not whether a section shows
+            for segment in path_node.segments:
+                tag_type = segment.node.tag_type
+                if tag_type is TagType.VARIABLE or tag_type is TagType.VARIABLE_RAW:
+                    found.add(segment)
+
+            next_node = path_node.children.get(key)
+            if next_node is None:
+                return
+            path_node = next_node
+
+        work_stack = [path_node]
+        while work_stack:
+            path_node = work_stack.pop()
+            found.update(path_node.segments)
+            work_stack.extend(path_node.children.values())
+
+
+@functools.lru_cache(maxsize=1024)
+def _name_path(key: str) -> PathT:
+    return tuple(key.split("."))
+
+
+def _lookup(
+    chain: _ChainT, key: str
+) -> t.Tuple[t.Any, t.Optional[PathT], t.List[PathT]]:
+    """
+    Look up a tag name the way the renderers do. Returns the value, its path
+    (None if the name isn't found) and the paths the lookup depends on: the
+    value's own, and the name in every scope passed over, since adding it to
+    one of them would shadow the value.
+    """
+    if key == ".":
+        scope, scope_path = chain[0]
+        return scope, scope_path, [scope_path]
+
+    first_key, rest_path = parse_key(key)
+    name_path = _name_path(key)
+    paths: t.List[PathT] = []
+
+    for scope, scope_path in chain:
+        if isinstance(scope, dict):
+            value = scope[first_key] if first_key in scope else _MISSING
+        else:
+            value = _get_value(scope, first_key)
+
+        if value is _MISSING:
+            paths.append(scope_path + name_path[:1])
+            continue
+
+        path = scope_path + name_path
+        paths.append(path)
+        if rest_path and value is not None:
+            value = _follow_path(value, rest_path)
+        return value, path, paths
+
+    return None, None, paths
+
+
+def _parse_path(path: t.Union[str, t.Sequence[t.Any]]) -> PathT:
+    if isinstance(path, str):
+        return () if path == "." else _name_path(path)
+    return tuple(str(key) for key in path)
@@ -0,0 +1,74 @@
+import pickle
+import typing as t
+
+import pytest
+
+from mystace import BytecodeMustacheRenderer, MustacheRenderer
+from mystace.bytecode import (
+    OP_INVERTED,
+    OP_LOOP,
+    OP_SECTION,
+    OP_TEXT,
+    OP_VARIABLE,
+    compile_program,
+)
+from mystace.mustache_tree import create_mustache_tree
+
+
+@pytest.mark.parametrize(
+    "template,data",
+    [
+        ("Hello {{name}}!", {"name": "<World>"}),
+        ("{{#items}}[{{.}}]{{/items}}", {"items": [1, 2, 3]}),
+        ("{{#items}}[{{.}}]{{/items}}", {"items": []}),
+        ("{{#a}}{{b.c}}{{/a}}{{^a}}none{{/a}}", {"a": {"b": {"c": "x"}}}),
+        ("{{^missing}}none{{/missing}}", {}),
+        ("{{{raw}}} {{&raw}} {{raw}}", {"raw": "&"}),
+        ("{{#a}}{{#b}}{{c}}{{/b}}|{{/a}}", {"a": [{"b": [1, 2]}, {}], "c": "x"}),
+    ],
+)
+def test_matches_tree_engine(template: str, data: dict) -> None:
+    expected = MustacheRenderer.from_template(template).render(data)
+    assert BytecodeMustacheRenderer.from_template(template).render(data) == expected
+
+
+def test_compile_program() -> None:
+    tree = create_mustache_tree("a{{#s}}b{{x}}{{/s}}{{^s}}c{{/s}}")
+    ops, args = compile_program(tree)
+
+    assert ops[:5] == [OP_TEXT, OP_SECTION, OP_TEXT, OP_VARIABLE, OP_LOOP]
+    assert ops[5:] == [OP_INVERTED, OP_TEXT]
+    # Sections jump past their end, loops jump back to the start of the body
+    assert args[1][1] == 5
+    assert args[4] == 2
+    assert args[5][1] == 7
+
+
+def test_partials() -> None:
+    partials = {"node": "{{v}}\n{{#kids}}\n  {{>node}}\n{{/kids}}\n"}
+    data = {
+        "v": 1,
+        "kids": [{"v": 2, "kids": [{"v": 3, "kids": []}]}, {"v": 4, "kids": []}],
+    }
+
+    renderer = BytecodeMustacheRenderer.from_template("{{>node}}{{>missing}}", partials)
+    assert renderer.render(data) == "1\n  2\n    3\n  4\n"
+    assert pickle.loads(pickle.dumps(renderer)).render(data) == renderer.render(data)
+
+
+def test_render_iter() -> None:
+    template = "{{#items}}<{{.}}>\n{{/items}}{{>p}}"
+    partials = {"p": "{{#items}}  {{.}}\n{{/items}}"}
+    data = {"items": list(range(500))}
+    renderer = BytecodeMustacheRenderer.from_template(template, partials)
+    expected = MustacheRenderer.from_template(template, partials).render(data)
+
+    chunks = list(renderer.render_iter(data, chunk_size=100))
+    assert "".join(chunks) == expected
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+
+    written: t.List[str] = []
+    renderer.render_to(written.append, data)
+    assert "".join(written) == expected
+    assert renderer.render_many([data, {}]) == [expected, ""]
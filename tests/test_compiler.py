@@ -0,0 +1,126 @@
+import random
+import typing as t
+
+import pytest
+
+from mystace import CompiledMustacheRenderer, MustacheRenderer, MystaceError
+
+
+@pytest.mark.parametrize(
+    "template,data",
+    [
+        ("Hello {{name}}!", {"name": "<World>"}),
+        ("{{#items}}[{{.}}]{{/items}}", {"items": [1, 2, 3]}),
+        ("{{#a}}{{b.c}}{{/a}}{{^a}}none{{/a}}", {"a": {"b": {"c": "x"}}}),
+        ("{{^missing}}none{{/missing}}", {}),
+        ("{{{raw}}} {{&raw}} {{raw}}", {"raw": "&"}),
+        ("{{count.1}}", {"count": [5, 4, 3]}),
+    ],
+)
+def test_matches_tree_engine(template: str, data: dict) -> None:
+    expected = MustacheRenderer.from_template(template).render(data)
+    assert CompiledMustacheRenderer.from_template(template).render(data) == expected
+
+
+def test_deeply_nested_sections() -> None:
+    n = 30
+    template = "".join(f"{{{{#s{i}}}}}a{{{{x}}}}" for i in range(n)) + "".join(
+        f"{{{{/s{i}}}}}" for i in reversed(range(n))
+    )
+    data = {"x": "<", "s0": [{f"s{i}": True for i in range(1, n)}] * 2}
+
+    expected = MustacheRenderer.from_template(template).render(data)
+    assert CompiledMustacheRenderer.from_template(template).render(data) == expected
+
+
+def test_recursive_partial_indentation() -> None:
+    partials = {"node": "{{v}}\n{{#kids}}\n  {{>node}}\n{{/kids}}\n"}
+    data = {
+        "v": 1,
+        "kids": [{"v": 2, "kids": [{"v": 3, "kids": []}]}, {"v": 4, "kids": []}],
+    }
+
+    renderer = CompiledMustacheRenderer.from_template("{{>node}}", partials)
+    assert renderer.render(data) == "1\n  2\n    3\n  4\n"
+
+
+def test_section_indentation_in_partial() -> None:
+    partials = {"p": "{{#s}}a\n{{/s}}b\n"}
+
+    renderer = CompiledMustacheRenderer.from_template("  {{>p}}\n", partials)
+    assert renderer.render({"s": [1, 2]}) == "  a\n  a\n  b\n"
+
+
+def test_repeated_partial_indentation() -> None:
+    renderer = CompiledMustacheRenderer.from_template(
+        "  {{>p}}\n  {{>p}}\n", {"p": "x"}
+    )
+    assert renderer.render({}) == "  x  x"
+    assert "".join(renderer.render_iter({})) == "  x  x"
+
+
+@pytest.mark.parametrize("inline_partials", [False, True])
+def test_random_templates_match_tree_engine(inline_partials: bool) -> None:
+    rng = random.Random(0)
+    snippets = [
+        "{{a}}",
+        "{{{b}}}",
+        "{{#s}}",
+        "{{/s}}",
+        "{{^t}}",
+        "{{/t}}",
+        "{{>p}}",
+        "{{>q}}",
+        "  {{>p}}\n",
+        " {{>q}}\n",
+        "\n",
+        "\n",
+        "  ",
+        "x",
+    ]
+    partials = {"p": "[{{a}}]\n  {{>q}}\n", "q": "{{#t}}q\n{{/t}}{{b}}"}
+    datas = [
+        {"a": "<a>", "b": "&", "s": [{"a": 1}, {"t": True}], "t": False},
+        {"a": "z", "s": True, "t": [1, 2]},
+    ]
+
+    for _ in range(300):
+        template = "".join(rng.choices(snippets, k=rng.randint(1, 12)))
+        try:
+            tree_renderer = MustacheRenderer.from_template(template, partials)
+        except MystaceError:
+            continue
+
+        renderer = CompiledMustacheRenderer.from_template(
+            template, partials, inline_partials=inline_partials
+        )
+        for data in datas:
+            assert renderer.render(data) == tree_renderer.render(data), template
+
+
+def test_custom_functions() -> None:
+    renderer = CompiledMustacheRenderer.from_template("{{a}} {{{b}}}")
+
+    res = renderer.render(
+        {"a": True, "b": "<"},
+        stringify=lambda val: str(val).lower(),
+        html_escape_fn=lambda s: s.upper(),
+    )
+    assert res == "TRUE <"
+
+
+def test_render_iter() -> None:
+    template = "{{#items}}<{{.}}>\n{{/items}}{{>p}}"
+    partials = {"p": "{{#items}}  {{.}}\n{{/items}}"}
+    data = {"items": list(range(500))}
+    renderer = CompiledMustacheRenderer.from_template(template, partials)
+    expected = renderer.render(data)
+
+    chunks = list(renderer.render_iter(data, chunk_size=100))
+    assert "".join(chunks) == expected
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+
+    written: t.List[str] = []
+    renderer.render_to(written.append, data)
+    assert "".join(written) == expected
@@ -0,0 +1,159 @@
+import random
+import typing as t
+
+import pytest
+
+from mystace import (
+    EditableTemplate,
+    MissingClosingTagError,
+    MustacheRenderer,
+    MystaceError,
+    StrayClosingTagError,
+    create_mustache_tree,
+    incremental,
+)
+
+PARTIALS = {"p": "[{{a}}]\n  {{#s}}i{{/s}}\n"}
+DATAS = [
+    {"a": "<A>", "b": "&", "s": [{"a": 1}, {"a": 2, "t": True}], "t": False},
+    {"a": "z", "s": False, "t": [1, 2]},
+]
+SECTION = "{{#s}}\n" + "line {{a}}\n" * 8 + "  {{#t}}\n  {{>p}}\n  {{/t}}\n{{/s}}\n"
+
+
+def render_all(tree: t.Any) -> t.List[str]:
+    partials = {name: create_mustache_tree(src) for name, src in PARTIALS.items()}
+    renderer = MustacheRenderer(tree, partials)
+    return [renderer.render(data) for data in DATAS]
+
+
+def assert_parsed(template: EditableTemplate) -> None:
+    assert template.tree.data == template.source
+    assert render_all(template.tree) == render_all(
+        create_mustache_tree(template.source)
+    )
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Small blocks so short templates still get split and nested
+    monkeypatch.setattr(incremental, "_BLOCK_LINES", 3)
+
+
+def test_edits() -> None:
+    template = EditableTemplate(SECTION * 3)
+    assert_parsed(template)
+
+    def edit(offset: int, deleted: int, inserted: str) -> None:
+        template.edit(offset, deleted, inserted)
+        assert_parsed(template)
+
+    edit(0, 0, "head {{b}}\n")
+    edit(template.source.index("line", len(SECTION)), 4, "x")
+    middle = template.source.index("line", len(template.source) // 2)
+    edit(middle, 0, "{{! comment\nover lines }}\n")
+    edit(middle, 0, "{{#t}}\n{{a}}\n{{/t}}\n")
+    edit(template.source.index("line"), len("line {{a}}\n"), "")
+    edit(0, len("head {{b}}\n"), "")
+    edit(len(template.source), 0, "end {{{b}}}")
+    edit(len(template.source) - 7, 7, "")
+
+
+def test_edits_are_local() -> None:
+    template = EditableTemplate(SECTION * 20)
+    assert template.tree.children is not None
+    first_node = template.tree.children[0]
+    last_node = template.tree.children[-1]
+    middle_node = template.tree.children[10]
+    line_nodes = middle_node.children
+
+    # Inside the body of a section, the section node is kept
+    offset = template.source.index("line", sum(len(SECTION) for _ in range(10)))
+    template.edit(offset, 4, "row")
+    assert template.tree.children[10] is middle_node
+    assert middle_node.children is line_nodes
+    assert template.tree.children[0] is first_node
+    assert template.tree.children[-1] is last_node
+    assert_parsed(template)
+
+
+def test_unbalanced_edits() -> None:
+    template = EditableTemplate(SECTION * 4)
+
+    # Typing a section in steps goes through invalid templates
+    offset = template.source.index("line", len(SECTION))
+    with pytest.raises(StrayClosingTagError):
+        template.edit(offset, 0, "{{#new}}")
+    assert_parsed(template)
+    with pytest.raises(MissingClosingTagError):
+        template.edit(len(template.source), 0, "{{#new}}")
+    assert_parsed(template)
+
+    # Closing a section and opening it again splits the enclosing one
+    template.edit(offset, 0, "{{/s}}{{#s}}")
+    assert_parsed(template)
+    # Edits to the lines of section tags re-parse the whole section
+    template.edit(0, 6, "{{^s}}")
+    assert_parsed(template)
+    template.edit(2, 1, "#")
+    assert_parsed(template)
+    template.edit(len(template.source) - 1, 1, "")
+    assert_parsed(template)
+
+    with pytest.raises(ValueError):
+        template.edit(len(template.source), 1, "")
+
+
+def test_delimiters() -> None:
+    template = EditableTemplate("{{=<% %>=}}\n<%a%>\n" + SECTION)
+    template.edit(len(template.source), 0, "{{a}}")
+    assert_parsed(template)
+
+    # Without delimiter changes, edits are local again
+    template.edit(0, 12, "")
+    assert template.tree.children is not None
+    node = template.tree.children[-1]
+    template.edit(0, 0, "x")
+    assert template.tree.children[-1] is node
+    assert_parsed(template)
+
+
+def test_random_edits() -> None:
+    rng = random.Random(0)
+    snippets = [
+        "{{a}}",
+        "{{#s}}",
+        "{{/s}}",
+        "{{^t}}",
+        "{{/t}}",
+        "{{>p}}",
+        "{{! c }}",
+        "{{!\n}}",
+        "\n",
+        "\n",
+        "  ",
+        "x",
+        "{{",
+        "}}",
+    ]
+
+    for _ in range(20):
+        template = EditableTemplate(SECTION * 3)
+        for _ in range(30):
+            source = template.source
+            offset = rng.randint(0, len(source))
+            deleted = rng.randint(0, min(10, len(source) - offset))
+            inserted = "".join(rng.choices(snippets, k=rng.randint(0, 3)))
+            new_source = source[:offset] + inserted + source[offset + deleted :]
+
+            try:
+                create_mustache_tree(new_source)
+            except MystaceError as e:
+                with pytest.raises(type(e)):
+                    template.edit(offset, deleted, inserted)
+                assert template.source == source
+            else:
+                template.edit(offset, deleted, inserted)
+                assert template.source == new_source
+
+            assert_parsed(template)
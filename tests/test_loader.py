@@ -0,0 +1,184 @@
+import os
+import pathlib
+import threading
+import typing as t
+
+import pytest
+
+from mystace import (
+    CompiledMustacheRenderer,
+    Environment,
+    FileSystemLoader,
+    TemplateNotFoundError,
+)
+
+
+def write(path: pathlib.Path, text: str, mtime_ns: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    # Set the mtime explicitly so coarse filesystem clocks don't matter
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def template_dir(tmp_path: pathlib.Path) -> pathlib.Path:
+    write(tmp_path / "page.mustache", "{{>header}}|{{body}}", 1)
+    write(tmp_path / "other.mustache", "{{>header}}", 1)
+    write(tmp_path / "header.mustache", "<h1>{{>title}}</h1>", 1)
+    write(tmp_path / "title.mustache", "{{title}}", 1)
+    return tmp_path
+
+
+def test_environment_render(template_dir: pathlib.Path) -> None:
+    env = Environment(FileSystemLoader(template_dir))
+    data = {"title": "Hi", "body": "<b>"}
+
+    assert env.render("page", data) == "<h1>Hi</h1>|&lt;b&gt;"
+    assert env.get_template("page") is env.get_template("page")
+
+    # Partial trees are parsed once and shared between templates
+    page_partials = env.get_template("page").partials_dict
+    other_partials = env.get_template("other").partials_dict
+    assert page_partials["header"] is other_partials["header"]
+    assert page_partials["title"] is other_partials["title"]
+
+    with pytest.raises(TemplateNotFoundError):
+        env.get_template("missing")
+    with pytest.raises(TemplateNotFoundError):
+        env.get_template("../page")
+
+
+def test_environment_search_path(tmp_path: pathlib.Path) -> None:
+    write(tmp_path / "a" / "page.mustache", "a {{>part}}", 1)
+    write(tmp_path / "b" / "page.mustache", "b", 1)
+    write(tmp_path / "b" / "emails" / "part.mustache", "part", 1)
+    write(tmp_path / "b" / "part.mustache", "{{>emails/part}}", 1)
+
+    env = Environment(
+        FileSystemLoader([tmp_path / "a", str(tmp_path / "b")]),
+        renderer_cls=CompiledMustacheRenderer,
+    )
+    renderer = env.get_template("page")
+    assert isinstance(renderer, CompiledMustacheRenderer)
+    assert renderer.render({}) == "a part"
+
+
+def test_environment_reload(template_dir: pathlib.Path) -> None:
+    env = Environment(FileSystemLoader(template_dir), auto_reload_interval=0)
+    data = {"title": "Hi", "body": "x"}
+    assert env.render("page", data) == "<h1>Hi</h1>|x"
+
+    write(template_dir / "title.mustache", "{{title}}!", 2)
+    assert env.render("page", data) == "<h1>Hi!</h1>|x"
+
+    # Missing partials render empty until they are created
+    write(template_dir / "header.mustache", "{{>new}}", 2)
+    assert env.render("page", data) == "|x"
+    write(template_dir / "new.mustache", "new", 2)
+    assert env.render("page", data) == "new|x"
+
+    (template_dir / "page.mustache").unlink()
+    with pytest.raises(TemplateNotFoundError):
+        env.get_template("page")
+
+
+def test_environment_no_reload(template_dir: pathlib.Path) -> None:
+    env = Environment(FileSystemLoader(template_dir), auto_reload_interval=None)
+    assert env.render("other", {"title": "Hi"}) == "<h1>Hi</h1>"
+
+    write(template_dir / "title.mustache", "changed", 2)
+    assert env.render("other", {"title": "Hi"}) == "<h1>Hi</h1>"
+
+    env.clear()
+    assert env.render("other", {"title": "Hi"}) == "<h1>changed</h1>"
+
+
+def test_environment_eviction(template_dir: pathlib.Path) -> None:
+    env = Environment(FileSystemLoader(template_dir), max_cost=10)
+    data = {"title": "Hi", "body": "x"}
+
+    assert env.render("page", data) == "<h1>Hi</h1>|x"
+    assert env.info().currsize <= 10
+    assert env.render("other", data) == "<h1>Hi</h1>"
+    assert env.info().currsize <= 10
+
+    env.max_cost = 0
+    assert env.info().currsize == 0
+    assert env.render("page", data) == "<h1>Hi</h1>|x"
+    assert env.info().misses == 3
+
+    with pytest.raises(ValueError):
+        env.max_cost = -1
+
+
+def test_environment_keeps_oversized_entry(template_dir: pathlib.Path) -> None:
+    read_paths: t.List[str] = []
+
+    class CountingLoader(FileSystemLoader):
+        def get_source(self, path: str) -> str:
+            read_paths.append(path)
+            return super().get_source(path)
+
+    env = Environment(CountingLoader(template_dir), max_cost=1)
+    assert env.render("title", {"title": "Hi"}) == "Hi"
+    assert env.render("title", {"title": "Hi"}) == "Hi"
+
+    # The template is larger than max_cost on its own, but is only read once
+    assert len(read_paths) == 1
+    assert env.info().currsize > 1
+
+
+def test_environment_hit_skips_partials(template_dir: pathlib.Path) -> None:
+    looked_up: t.List[str] = []
+
+    class CountingEnvironment(Environment):
+        def _get_entry(self, name: str) -> t.Any:
+            looked_up.append(name)
+            return super()._get_entry(name)
+
+    env = CountingEnvironment(FileSystemLoader(template_dir))
+    renderer = env.get_template("page")
+    assert looked_up == ["page", "header", "title"]
+
+    # Partials are only checked again once the reload interval has passed
+    looked_up.clear()
+    assert env.get_template("page") is renderer
+    assert looked_up == ["page"]
+    assert env.info().hits == 1
+
+
+def test_environment_loads_outside_lock(template_dir: pathlib.Path) -> None:
+    loading = threading.Event()
+    release = threading.Event()
+
+    class SlowLoader(FileSystemLoader):
+        def get_source(self, path: str) -> str:
+            if path.endswith("page.mustache"):
+                loading.set()
+                release.wait(30)
+            return super().get_source(path)
+
+    env = Environment(SlowLoader(template_dir))
+    data = {"title": "Hi", "body": "x"}
+    outputs: t.Dict[str, str] = {}
+
+    def render(name: str) -> None:
+        outputs[name] = env.render(name, data)
+
+    page_thread = threading.Thread(target=render, args=("page",))
+    other_thread = threading.Thread(target=render, args=("other",))
+    page_thread.start()
+    try:
+        assert loading.wait(5)
+        # Other templates can be loaded while "page" is being read
+        other_thread.start()
+        other_thread.join(5)
+        assert outputs == {"other": "<h1>Hi</h1>"}
+    finally:
+        release.set()
+        page_thread.join()
+        if other_thread.ident is not None:
+            other_thread.join()
+
+    assert outputs["page"] == "<h1>Hi</h1>|x"
+    assert env.get_template("page") is env.get_template("page")
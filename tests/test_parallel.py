@@ -0,0 +1,92 @@
+import pickle
+import sys
+import typing as t
+
+import pytest
+
+from mystace import (
+    BytecodeMustacheRenderer,
+    CompiledMustacheRenderer,
+    MustacheRenderer,
+    ParallelRenderer,
+    render_parallel,
+)
+
+
+def upper_stringify(val: object) -> str:
+    return str(val).upper()
+
+
+def test_pickle_renderer() -> None:
+    renderer = CompiledMustacheRenderer.from_template(
+        "{{#a}}{{b.c}}{{>p}}{{/a}}", {"p": "[{{x}}]"}
+    )
+    data = {"a": [{"b": {"c": 1}, "x": "<"}]}
+
+    unpickled = pickle.loads(pickle.dumps(renderer))
+    assert type(unpickled) is CompiledMustacheRenderer
+    assert unpickled.render(data) == renderer.render(data)
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_pickle_schema_binding(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(
+        "{{#rows}}{{title}}{{id}}{{/rows}}",
+        schema={"title": str, "rows": [{"id": int}]},
+    )
+    data = {"title": "t", "rows": [{"id": 1}, {"id": 2}]}
+
+    unpickled = pickle.loads(pickle.dumps(renderer))
+    assert unpickled.render(data) == renderer.render(data) == "t1t2"
+
+    # Workers keep the bindings rather than falling back to dynamic lookups
+    assert unpickled.mustache_tree.children is not None
+    section = unpickled.mustache_tree.children[0]
+    assert section.children is not None
+    assert [node.scope for node in section.children] == [1, 0]
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_render_parallel(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(
+        "{{#items}}{{.}},{{/items}}{{>p}}", {"p": "{{name}}"}
+    )
+    datas = [{"items": list(range(i % 5)), "name": f"n{i}"} for i in range(1_000)]
+
+    outputs = render_parallel(renderer, datas, max_workers=2, chunk_size=64)
+    assert outputs == renderer.render_many(datas)
+
+
+def test_parallel_renderer_reuse() -> None:
+    renderer = MustacheRenderer.from_template("{{name}}")
+
+    with ParallelRenderer(
+        renderer, max_workers=2, chunk_size=10, stringify=upper_stringify
+    ) as pool:
+        first = list(pool.render_many({"name": f"a{i}"} for i in range(100)))
+        second = list(pool.render_many([{"name": "b"}], chunk_size=1))
+
+    assert first == [f"A{i}" for i in range(100)]
+    assert second == ["B"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 14), reason="Requires Python 3.14+")
+def test_render_parallel_interpreters() -> None:
+    renderer = MustacheRenderer.from_template("{{name}}")
+    datas = [{"name": i} for i in range(100)]
+
+    outputs = render_parallel(renderer, datas, max_workers=2, executor="interpreter")
+    assert outputs == [str(i) for i in range(100)]
+
+
+def test_invalid_arguments() -> None:
+    renderer = MustacheRenderer.from_template("{{name}}")
+
+    with pytest.raises(ValueError):
+        ParallelRenderer(renderer, chunk_size=0)
+
+    with pytest.raises(ValueError):
+        ParallelRenderer(renderer, executor="threads")  # type: ignore
@@ -1,14 +1,43 @@
+import array
+import asyncio
 import collections
+import dataclasses
+import marshal
+import os
+import pathlib
+import pickle
+import threading
+import tracemalloc
+import types
 import typing as t
 
 import pytest
+import typing_extensions as te
 
 from mystace import (
+    BytecodeMustacheRenderer,
+    CacheInfo,
+    Columns,
+    CompiledMustacheRenderer,
+    EscapeMemo,
     MissingClosingTagError,
+    MustacheRenderer,
     MystaceError,
+    RendererCache,
+    SerializationError,
     StrayClosingTagError,
+    create_mustache_tree,
     render_from_template,
+    renderer_cache,
 )
+from mystace.mustache_tree import (
+    _SERIALIZATION_HEADER,
+    ContextNode,
+    MustacheTreeNode,
+    TagType,
+    make_resolver,
+)
+from mystace.util import html_escape
 
 # TODO get test cases from here https://gitlab.com/ergoithz/ustache/-/blob/master/tests.py?ref_type=heads
 # and here https://github.com/michaelrccurtis/moosetash/blob/main/tests/test_context.py
@@ -331,8 +360,6 @@ def test_indexed() -> None:
     assert result == expected
 
 
-# TODO: Nested partial indentation with sections needs refinement
-@pytest.mark.xfail
 def test_iterator_scope_indentation() -> None:
     args = {
         "data": {
@@ -352,7 +379,6 @@ def test_iterator_scope_indentation() -> None:
 
 
 # https://github.com/noahmorrison/chevron/pull/73
-@pytest.mark.xfail
 def test_namedtuple_data() -> None:
     NT = collections.namedtuple("NT", ["foo", "bar"])
     args = {"template": "{{foo}} {{bar}}", "data": NT("hello", "world")}
@@ -363,7 +389,6 @@ def test_namedtuple_data() -> None:
     assert result == expected
 
 
-@pytest.mark.xfail
 def test_get_key_not_in_dunder_dict_returns_attribute() -> None:
     class C:
         foo = "bar"
@@ -586,3 +611,869 @@ def test_missing_section():
         template, data, missing_data=lambda: " you have no repos :("
     )
     assert out == expected
+
+
+def test_renderer_cache() -> None:
+    cache = RendererCache(maxsize=2)
+    partials = {"p": "{{x}}"}
+
+    first = cache.get("{{>p}}", partials)
+    assert cache.get("{{>p}}", {"p": "{{x}}"}) is first
+    assert cache.info() == CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
+
+    # Different partial content is a different entry
+    assert cache.get("{{>p}}", {"p": "{{y}}"}) is not first
+
+    # Least recently used entry is evicted
+    cache.get("a")
+    assert cache.info().currsize == 2
+    assert cache.get("{{>p}}", partials) is not first
+
+    cache.maxsize = 1
+    assert cache.info().currsize == 1
+
+    cache.clear()
+    assert cache.info() == CacheInfo(hits=0, misses=0, maxsize=1, currsize=0)
+
+
+def test_renderer_cache_disabled() -> None:
+    cache = RendererCache(maxsize=0)
+
+    assert cache.get("{{x}}").render({"x": 1}) == "1"
+    assert cache.info() == CacheInfo(hits=0, misses=1, maxsize=0, currsize=0)
+
+    with pytest.raises(ValueError):
+        RendererCache(maxsize=-1)
+
+
+def test_render_from_template_uses_cache() -> None:
+    renderer_cache.clear()
+
+    render_from_template("{{x}}", {"x": 1})
+    assert render_from_template("{{x}}", {"x": 2}) == "2"
+    assert renderer_cache.info().hits == 1
+
+
+def test_resolvers() -> None:
+    root = ContextNode({"a": {"b": [10, 20]}, "x": "root"})
+    inner = ContextNode({"y": None}, root)
+
+    assert make_resolver(".")(inner) == {"y": None}
+    assert make_resolver("x")(inner) == "root"
+    assert make_resolver("y")(inner) is None
+    assert make_resolver("a.b.1")(inner) == 20
+    assert make_resolver("a.b.5")(inner) is None
+    assert make_resolver("a.b.c")(inner) is None
+    assert make_resolver("missing.b")(inner) is None
+
+    # Resolvers are shared between nodes with the same name
+    node = create_mustache_tree("{{a.b}}{{#a.b}}{{/a.b}}")
+    assert node.children is not None
+    assert node.children[0].resolver is node.children[1].resolver
+
+
+def test_coalesce_literals() -> None:
+    static_lines = "".join(f"line {i}\n" for i in range(2_000))
+    template = static_lines + "{{! comment }}{{=<% %>=}}tail<%#s%>a\nb\n<%/s%>"
+
+    tree = create_mustache_tree(template)
+    assert tree.children is not None
+    assert [child.tag_type for child in tree.children] == [
+        TagType.LITERAL,
+        TagType.SECTION,
+    ]
+    assert tree.children[0].data == static_lines + "tail"
+
+    section_children = tree.children[1].children
+    assert section_children is not None
+    assert len(section_children) == 1
+    assert section_children[0].data == "a\nb\n"
+
+
+def test_coalesced_literal_partial_indentation() -> None:
+    template = "  {{>p}}\n"
+    partials = {"p": "a\n{{! comment }}b\nc\n"}
+
+    result = render_from_template(template, {}, partials)
+    assert result == "  a\n  b\n  c\n"
+
+
+def test_render_iter() -> None:
+    template = "{{#items}}<{{.}}>\n{{/items}}"
+    data = {"items": list(range(100))}
+    renderer = MustacheRenderer.from_template(template)
+    expected = renderer.render(data)
+
+    chunks = list(renderer.render_iter(data, chunk_size=50))
+    assert "".join(chunks) == expected
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 50 for chunk in chunks[:-1])
+
+    written: t.List[str] = []
+    renderer.render_to(written.append, data, chunk_size=50)
+    assert written == chunks
+
+    with pytest.raises(ValueError):
+        renderer.render_iter(data, chunk_size=0)
+
+
+def test_render_async() -> None:
+    awaited_names: t.List[str] = []
+
+    async def fetch(name: str, value: t.Any) -> t.Any:
+        awaited_names.append(name)
+        return value
+
+    template = (
+        "{{user.name}}{{#flags.beta}}beta{{/flags.beta}}"
+        "{{^flags.beta}}{{#recs}}[{{title}}]{{/recs}}{{/flags.beta}}{{user.name}}"
+    )
+    renderer = MustacheRenderer.from_template(template)
+
+    def make_data() -> t.Dict[str, t.Any]:
+        return {
+            "user": fetch("user", {"name": "Ann"}),
+            "flags": fetch("flags", {"beta": False}),
+            "recs": fetch("recs", [fetch("first", {"title": "A"}), {"title": "B"}]),
+            "unused": fetch("unused", 1),
+        }
+
+    data = make_data()
+    assert asyncio.run(renderer.render_async(data)) == "Ann[A][B]Ann"
+    # Each awaitable is awaited once, and only if it is reached
+    assert awaited_names == ["user", "flags", "recs", "first"]
+    data["unused"].close()
+
+    awaited_names.clear()
+    data = make_data()
+    result = asyncio.run(renderer.render_async(data, prefetch=True))
+    assert result == "Ann[A][B]Ann"
+    assert sorted(awaited_names) == ["first", "flags", "recs", "user"]
+    data["unused"].close()
+
+
+def test_render_async_awaitable_data() -> None:
+    async def get_data() -> t.Dict[str, t.Any]:
+        return {"a": [1, 2]}
+
+    renderer = MustacheRenderer.from_template("{{#a}}{{.}}{{/a}}")
+    assert asyncio.run(renderer.render_async(get_data())) == "12"
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_render_many(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template("{{#items}}{{.}},{{/items}}{{name}}")
+    datas = [
+        {"items": [1, 2], "name": "a"},
+        {"items": [], "name": "b"},
+        {"name": True},
+        {"name": 1},
+        {"items": [1, 2], "name": "a"},
+    ]
+    expected = [renderer.render(data) for data in datas]
+
+    assert renderer.render_many(datas) == expected
+    assert list(renderer.render_many(iter(datas), lazy=True)) == expected
+    assert renderer.render_many(datas, dedupe=True) == expected
+    assert renderer.render_many([], dedupe=True) == []
+
+
+def test_render_many_dedupe() -> None:
+    rendered: t.List[t.Any] = []
+
+    def stringify(val: t.Any) -> str:
+        rendered.append(val)
+        return str(val)
+
+    renderer = MustacheRenderer.from_template("{{a}}")
+    datas = [{"a": 1}, {"a": True}, {"a": 1}, {"a": [1]}, {"a": [1]}, {"a": {1}}]
+
+    outputs = renderer.render_many(datas, stringify, dedupe=True)
+    assert outputs == ["1", "True", "1", "[1]", "[1]", "{1}"]
+    assert rendered == [1, True, [1], {1}]
+
+    rendered.clear()
+    outputs = renderer.render_many(
+        datas, stringify, dedupe_key=lambda data: type(data["a"]).__name__
+    )
+    assert outputs == ["1", "True", "1", "[1]", "[1]", "{1}"]
+    assert rendered == [1, True, [1], {1}]
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_dumps_loads(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    template = "{{#a}}{{b.c}}{{/a}}{{^a}}none{{/a}} {{{raw}}}\n  {{>p}}\n"
+    partials = {"p": "{{#list}}{{.}}\n{{/list}}"}
+    data = {"a": {"b": {"c": "<x>"}}, "raw": "&", "list": [1, 2]}
+    renderer = renderer_cls.from_template(template, partials)
+
+    serialized = renderer.dumps()
+    loaded = renderer_cls.loads(serialized, template, partials)
+    assert type(loaded) is renderer_cls
+    assert loaded.render(data) == renderer.render(data)
+    assert loaded.source_hash == renderer.source_hash
+    assert loaded.dumps() == serialized
+
+    # Loading without a source skips the staleness check
+    assert renderer_cls.loads(serialized).render(data) == renderer.render(data)
+
+
+def test_loads_rejects_bad_data() -> None:
+    template = "Hello {{name}}"
+    serialized = MustacheRenderer.from_template(template).dumps()
+
+    with pytest.raises(SerializationError, match="stale"):
+        MustacheRenderer.loads(serialized, "Hello {{ name }}!")
+    with pytest.raises(SerializationError, match="stale"):
+        MustacheRenderer.loads(serialized, template, {"p": ""})
+    with pytest.raises(SerializationError, match="truncated"):
+        MustacheRenderer.loads(serialized[:10])
+    with pytest.raises(SerializationError, match="not a serialized"):
+        MustacheRenderer.loads(b"X" + serialized[1:])
+    with pytest.raises(SerializationError, match="version"):
+        MustacheRenderer.loads(serialized[:4] + b"\xff" + serialized[5:])
+    with pytest.raises(SerializationError, match="corrupt"):
+        MustacheRenderer.loads(serialized[:-3])
+    assert isinstance(SerializationError(), MystaceError)
+
+    # A literal node that claims a child
+    header_size = _SERIALIZATION_HEADER.size
+    flat_tree, flat_partials = marshal.loads(serialized[header_size:])
+    root, literal, *rest = flat_tree
+    flat_tree = (root, literal[:3] + (1,) + literal[4:], *rest)
+    with pytest.raises(SerializationError, match="corrupt"):
+        MustacheRenderer.loads(
+            serialized[:header_size] + marshal.dumps((flat_tree, flat_partials))
+        )
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_lazy_partials(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    partials = {"used": "[{{>nested}}]", "nested": "{{x}}", "broken": "{{#a}}"}
+
+    # Unused partials aren't parsed, so the broken one doesn't raise here
+    renderer = renderer_cls.from_template("{{>used}}{{>missing}}", partials)
+    assert renderer.render({"x": 1}) == "[1]"
+    assert "broken" in renderer.partials_dict
+    assert len(renderer.partials_dict) == 3
+
+    with pytest.raises(MissingClosingTagError):
+        renderer.validate()
+    with pytest.raises(MissingClosingTagError):
+        renderer_cls.from_template("{{>broken}}", partials).render({})
+
+    loaded = pickle.loads(pickle.dumps(renderer))
+    assert loaded.render({"x": 2}) == "[2]"
+    assert loaded.source_hash == renderer.source_hash
+
+
+def test_lazy_partials_thread_safe() -> None:
+    partials = {f"p{i}": f"{{{{x}}}}{i}" for i in range(50)}
+    template = "".join(f"{{{{>p{i}}}}}" for i in range(50))
+    renderer = MustacheRenderer.from_template(template, partials)
+    expected = "".join(f"x{i}" for i in range(50))
+
+    barrier = threading.Barrier(8)
+    results: t.List[str] = []
+
+    def render() -> None:
+        barrier.wait()
+        results.append(renderer.render({"x": "x"}))
+
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [expected] * 8
+    trees = [renderer.partials_dict[f"p{i}"] for i in range(50)]
+    assert trees == [renderer.partials_dict[f"p{i}"] for i in range(50)]
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_inline_partials(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    partials = {
+        "layout": "<html>\n  {{>nav}}\n  <p>{{body}}</p>\n</html>\n",
+        "nav": "<ul>\n{{#links}}\n  {{>link}}\n{{/links}}\n</ul>\n",
+        "link": "<li>{{.}}</li>\n",
+        "tail": "a\nb",
+    }
+    template = "{{>layout}}\nx {{>tail}}{{>missing}}"
+    data = {"body": "hi", "links": ["a", "b"]}
+
+    renderer = renderer_cls.from_template(template, partials, inline_partials=True)
+    assert renderer.render(data) == (
+        "<html>\n  <ul>\n    <li>a</li>\n    <li>b</li>\n  </ul>\n"
+        "  <p>hi</p>\n</html>\nx a\nb"
+    )
+    assert renderer.render(data) == (
+        CompiledMustacheRenderer.from_template(template, partials).render(data)
+    )
+    assert not any(
+        node.tag_type is TagType.PARTIAL for node in _walk(renderer.mustache_tree)
+    )
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, CompiledMustacheRenderer])
+def test_inline_partials_recursive(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    partials = {
+        "node": "{{v}}\n{{#kids}}\n  {{>node}}\n{{/kids}}\n",
+        "root": "<tree>\n  {{>node}}\n</tree>\n",
+    }
+    data = {
+        "v": 1,
+        "kids": [{"v": 2, "kids": [{"v": 3, "kids": []}]}, {"v": 4, "kids": []}],
+    }
+
+    renderer = renderer_cls.from_template("{{>root}}", partials, True)
+    assert list(renderer.partials_dict) == ["root", "node"]
+    assert renderer.render(data) == ("<tree>\n  1\n    2\n      3\n    4\n</tree>\n")
+
+
+def _walk(node: t.Any) -> t.Iterator[t.Any]:
+    yield node
+    for child in node.children or ():
+        yield from _walk(child)
+
+
+@pytest.mark.parametrize("inline_partials", [False, True])
+def test_indented_partials(inline_partials: bool) -> None:
+    partials = {
+        "node": "{{v}}\n{{#kids}}\n  {{>node}}\n{{/kids}}\n",
+        "list": "{{#s}}a\n{{/s}}b\n",
+        "inline": "1\n2\n",
+    }
+    template = "  {{>list}}\n{{>node}}\n    {{>node}}\nx {{>inline}}"
+    data = {"s": [1, 2], "v": 1, "kids": [{"v": 2, "kids": [{"v": 3, "kids": []}]}]}
+
+    renderer = MustacheRenderer.from_template(template, partials, inline_partials)
+    assert renderer.render(data) == (
+        "  a\n  a\n  b\n1\n  2\n    3\n    1\n      2\n        3\nx 1\n2\n"
+    )
+
+    # Indented copies are parsed once per indentation width
+    indented = renderer._get_partial("node", 2)
+    assert indented is renderer._get_partial("node", 2)
+    assert renderer._get_partial("missing", 2) is None
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_indented_hand_built_partials(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    # Trees built by hand have no source, so they're indented as trees
+    list_tree = MustacheTreeNode(TagType.ROOT, "", 0)
+    section = MustacheTreeNode(TagType.SECTION, "s", 0)
+    section.add_child(MustacheTreeNode(TagType.VARIABLE, ".", 0))
+    section.add_child(MustacheTreeNode(TagType.LITERAL, "\n", 0))
+    list_tree.add_child(MustacheTreeNode(TagType.LITERAL, "a\nb ", 0))
+    list_tree.add_child(MustacheTreeNode(TagType.VARIABLE, "v", 0))
+    list_tree.add_child(MustacheTreeNode(TagType.LITERAL, "\n", 0))
+    list_tree.add_child(section)
+    list_tree.add_child(MustacheTreeNode(TagType.PARTIAL, "leaf", 0))
+
+    renderer = renderer_cls(
+        create_mustache_tree("  {{>list}}\n"),
+        {"list": list_tree, "leaf": create_mustache_tree("c\nd")},
+    )
+    assert renderer.render({"v": "<v>", "s": [1, 2]}) == (
+        "  a\n  b &lt;v&gt;\n  1\n  2\n  c\n  d"
+    )
+
+
+def test_large_section_constant_memory() -> None:
+    renderer = MustacheRenderer.from_template(
+        "{{#rows}}<tr><td>{{id}}</td>{{#tags}}{{.}}{{/tags}}</tr>\n{{/rows}}"
+    )
+    data = {"rows": [{"id": i, "tags": ["a", "b"]} for i in range(10_000)]}
+
+    expected_chars = len(renderer.render(data))
+
+    tracemalloc.start()
+    try:
+        num_chars = sum(len(chunk) for chunk in renderer.render_iter(data))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert num_chars == expected_chars
+    # Traversal state doesn't grow with the number of rows
+    assert peak < 500_000
+
+
+def test_iter_section() -> None:
+    context = ContextNode({"a": [1, 2], "b": "x", "c": []})
+
+    assert [node.context for node in context.iter_section("a")] == [1, 2]
+    assert [node.context for node in context.open_section("b")] == ["x"]
+    assert list(context.iter_section("c")) == []
+
+
+def test_lookup_memo() -> None:
+    root = ContextNode({"x": "root"})
+    middle = ContextNode({"y": 1}, root)
+    leaf = ContextNode({}, middle)
+
+    assert make_resolver("x")(leaf) == "root"
+    assert make_resolver("missing.a")(leaf) is None
+    # Lookups and misses are memoized on the enclosing scopes they passed
+    assert middle.memo == {"x": "root", "missing": None}
+    assert root.memo == {"missing": None}
+    assert leaf.memo is None
+
+    # A new scope shadowing a memoized name is still seen first
+    shadow = ContextNode({"x": "shadow"}, middle)
+    assert make_resolver("x")(ContextNode({}, shadow)) == "shadow"
+    assert make_resolver("x")(leaf) == "root"
+
+    renderer = MustacheRenderer.from_template(
+        "{{#a}}{{#b}}{{x}}{{/b}}{{/a}}|{{#a}}{{x}}{{/a}}"
+    )
+    data = {"x": 0, "a": [{"b": [1, 2]}, {"x": 1, "b": [1, {"x": 2}]}]}
+    assert renderer.render(data) == "0012|01"
+
+
+class _RowSchema(te.TypedDict):
+    id: int
+    tags: t.List[str]
+
+
+class _PageSchema(te.TypedDict):
+    title: str
+    rows: t.List[_RowSchema]
+
+
+@dataclasses.dataclass
+class _RowData:
+    id: int
+    tags: t.List[str]
+
+
+@dataclasses.dataclass
+class _PageData:
+    title: str
+    rows: t.List[_RowData]
+
+
+def _node_scopes(tree: MustacheTreeNode) -> t.List[t.Tuple[str, int]]:
+    """Names looked up in the tree, in order, with their bound scope."""
+    assert tree.children is not None
+    scopes = []
+    work_stack = list(reversed(tree.children))
+    while work_stack:
+        curr_node = work_stack.pop()
+        if curr_node.tag_type is not TagType.LITERAL:
+            scopes.append((curr_node.data, curr_node.scope))
+        work_stack.extend(reversed(curr_node.children or ()))
+    return scopes
+
+
+_SCHEMA_TEMPLATE = (
+    "{{#rows}}{{title}}:{{id}}{{#tags}}[{{.}}{{id}}{{title}}{{other}}]{{/tags}}"
+    "{{^tags}}-{{/tags}}\n{{/rows}}"
+)
+
+
+@pytest.mark.parametrize(
+    "schema",
+    [
+        _PageSchema,
+        _PageData,
+        {"title": str, "rows": [{"id": int, "tags": [str]}]},
+        {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "rows": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "tags": {"type": "array", "items": {"type": "string"}},
+                        },
+                    },
+                },
+            },
+        },
+    ],
+    ids=["typeddict", "dataclass", "dict", "json_schema"],
+)
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_schema_binding(schema: t.Any, renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(_SCHEMA_TEMPLATE, schema=schema)
+    assert _node_scopes(renderer.mustache_tree) == [
+        ("rows", 0),
+        ("title", 1),
+        ("id", 0),
+        ("tags", 0),
+        (".", -1),
+        ("id", 1),
+        ("title", 2),
+        ("other", -1),
+        ("tags", 0),
+    ]
+
+    dynamic_renderer = renderer_cls.from_template(_SCHEMA_TEMPLATE)
+    matching = {
+        "title": "T",
+        "other": "o",
+        "rows": [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": []}],
+    }
+    # Data that doesn't match the schema falls back to dynamic lookups
+    mismatched = {"rows": [{"tags": ["a"], "title": "row"}, {"id": 2, "tags": "x"}]}
+    # Extra keys in the scopes passed over shadow the bound names
+    shadowed = {
+        "title": "T",
+        "rows": [
+            {"id": 1, "title": "row", "tags": ["a", {"id": "tag", "title": "t"}]},
+            {"id": 2, "tags": [{"title": "t"}]},
+        ],
+    }
+
+    for data in (matching, mismatched, shadowed, {}):
+        assert renderer.render(data) == dynamic_renderer.render(data)
+
+    loaded = renderer_cls.loads(renderer.dumps())
+    assert _node_scopes(loaded.mustache_tree) == _node_scopes(renderer.mustache_tree)
+    assert loaded.render(matching) == renderer.render(matching)
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_schema_binding_dataclass_data(
+    renderer_cls: t.Type[MustacheRenderer],
+) -> None:
+    renderer = renderer_cls.from_template(_SCHEMA_TEMPLATE, schema=_PageData)
+    dynamic_renderer = renderer_cls.from_template(_SCHEMA_TEMPLATE)
+    data = _PageData("T", [_RowData(1, ["a", "b"]), _RowData(2, [])])
+
+    expected = "T:1[a1T][b1T]\nT:2-\n"
+    assert renderer.render(data) == dynamic_renderer.render(data) == expected
+
+
+def test_schema_binding_partials() -> None:
+    # "row" is inlined into the template, where "title" is bound one scope
+    # out, and into the recursive "node", which is rendered at varying
+    # depths, so its names must stay dynamic
+    partials = {
+        "row": "{{title}}\n",
+        "node": "{{>row}}{{#kids}}{{>node}}{{/kids}}",
+    }
+    schema = {"title": str, "kids": [{"kids": [{"title": str, "kids": list}]}]}
+    data = {
+        "title": "a",
+        "kids": [{"kids": [{"title": "b", "kids": [{"title": "c", "kids": []}]}]}],
+    }
+    template = "{{#kids}}{{>row}}{{/kids}}{{>node}}"
+
+    renderer = MustacheRenderer.from_template(
+        template, partials, inline_partials=True, schema=schema
+    )
+    expected = MustacheRenderer.from_template(template, partials).render(data)
+
+    assert ("title", -1) in _node_scopes(renderer.mustache_tree)
+    assert renderer.render(data) == expected == "a\na\na\nb\nc\n"
+
+
+def test_analyze() -> None:
+    renderer = MustacheRenderer.from_template(
+        "{{title}}\n{{#rows}}{{id}}{{>row}}{{/rows}}{{^rows}}none{{/rows}}"
+        "{{>tree}}{{>gone}}",
+        {
+            "row": "{{#tags}}{{.}}{{/tags}}{{&a.b}}",
+            "tree": "{{name}}{{#kids}}{{>tree}}{{/kids}}{{>other}}",
+            "other": "{{>tree}}",
+            "unused": "{{unused}}",
+        },
+    )
+    info = renderer.analyze()
+
+    assert info.names == {
+        (): {"title", "rows", "name", "kids"},
+        ("rows",): {"id", "tags", "a.b"},
+        ("rows", "tags"): {"."},
+        ("kids",): {"name", "kids"},
+    }
+    assert info.sections == {"rows", "tags", "kids"}
+    assert info.inverted_sections == {"rows"}
+    assert info.partial_graph == {
+        "row": (),
+        "tree": ("tree", "other"),
+        "other": ("tree",),
+    }
+    assert info.recursive_partials == {"tree", "other"}
+    assert info.missing_partials == {"gone"}
+    assert info.max_depth == 2
+    # Template, row, tree and other, without the unused partial
+    assert info.node_count == 10 + 4 + 5 + 2
+    assert info.static_share == 2 / 7
+
+    empty_info = MustacheRenderer.from_template("").analyze()
+    assert empty_info.names == {}
+    assert empty_info.node_count == 1
+    assert empty_info.static_share == 1.0
+
+
+def test_analyze_mutually_recursive_partials() -> None:
+    # Every partial includes every other one, in a section of its own, so
+    # following every chain of inclusions takes exponential time
+    num_partials = 20
+    partials = {
+        f"p{i}": "".join(
+            f"{{{{#s{i}}}}}{{{{v{i}}}}}{{{{>p{j}}}}}{{{{/s{i}}}}}"
+            for j in range(num_partials)
+        )
+        for i in range(num_partials)
+    }
+    info = MustacheRenderer.from_template("{{>p0}}", partials).analyze()
+
+    assert info.recursive_partials == set(partials)
+    assert info.names[("s0",)] == {"v0"} | {f"s{i}" for i in range(num_partials)}
+    for i in range(num_partials):
+        assert info.names[("s0", f"s{i}")] == {f"v{i}"}
+
+    # Partials only reached deeper than one inclusion are still expanded
+    cycle_info = MustacheRenderer.from_template(
+        "{{>a}}",
+        {"a": "{{#x}}{{>b}}{{/x}}", "b": "{{#y}}{{>c}}{{/y}}", "c": "{{z}}{{>a}}"},
+    ).analyze()
+    assert cycle_info.names == {(): {"x"}, ("x",): {"y"}, ("x", "y"): {"z"}}
+    assert cycle_info.partial_graph == {"a": ("b",), "b": ("c",), "c": ("a",)}
+
+
+@dataclasses.dataclass
+class _Tag:
+    label: str
+
+
+@dataclasses.dataclass
+class _Item:
+    name: str
+    tags: t.List[_Tag]
+    point: t.Tuple[int, int]
+    _secret: str = "hidden"
+
+    @property
+    def upper_name(self) -> str:
+        return self.name.upper()
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_object_lookups(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(
+        "{{#items}}{{name}}/{{upper_name}}/{{point.1}}/{{point.x}}/{{_secret}}"
+        "{{#tags}}[{{label}}{{title}}]{{/tags}}{{/items}}|{{meta.owner}}"
+        "{{#words}}({{title}}{{count}}){{/words}}"
+    )
+    data = {
+        "items": [
+            _Item("a", [_Tag("x"), _Tag("y")], (1, 2)),
+            _Item("b", [], (3, 4)),
+        ],
+        "meta": types.MappingProxyType({"owner": "me"}),
+        # Strings are plain values, str.title and str.count aren't looked up
+        "words": ["w"],
+        "title": "T",
+    }
+    assert renderer.render(data) == "a/A/2//[xT][yT]b/B/4//|me(T)"
+    assert renderer.render(types.MappingProxyType({"title": "t"})) == "|"
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_columns(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(
+        "{{#rows}}{{id}}:{{name}}:{{unit}}{{#flag}}!{{/flag}},{{/rows}}"
+        "{{^empty}}none{{/empty}}|{{rows.1.name}}"
+    )
+    rows = Columns(
+        {
+            "id": array.array("i", [1, 2, 3]),
+            "name": ["a", "<b>", "c"],
+            "flag": [True, False, True],
+        }
+    )
+    data = {"rows": rows, "unit": "kg", "empty": Columns({"id": []})}
+    assert renderer.render(data) == "1:a:kg!,2:&lt;b&gt;:kg,3:c:kg!,none|&lt;b&gt;"
+
+    # Rows render like the equivalent list of dicts
+    row_dicts = [
+        {"id": i, "name": n, "flag": f} for i, n, f in zip(*rows.columns.values())
+    ]
+    assert renderer.render(data) == renderer.render({**data, "rows": row_dicts})
+
+
+def test_columns_container() -> None:
+    columns = Columns({"x": array.array("d", [0.5, 1.0]), "y": ["a", "b"]})
+    assert len(columns) == 2
+    assert columns[-1] == {"x": 1.0, "y": "b"}
+    assert list(columns) == [{"x": 0.5, "y": "a"}, {"x": 1.0, "y": "b"}]
+    assert len(columns[1:]) == 1
+    with pytest.raises(IndexError):
+        columns[2]
+
+    stringified = Columns({"x": array.array("i", [0, 7]), "y": ["a", "b"]}, True)
+    assert stringified.columns == {"x": ["0", "7"], "y": ["a", "b"]}
+    assert not Columns({})
+
+    with pytest.raises(ValueError):
+        Columns({"x": [1, 2], "y": [1]})
+
+
+def test_columns_numpy() -> None:
+    np = pytest.importorskip("numpy")
+
+    columns = Columns({"x": np.arange(3), "y": np.array([0.5, 1.5, 2.5])})
+    assert columns.columns == {"x": [0, 1, 2], "y": [0.5, 1.5, 2.5]}
+    assert type(columns.columns["x"][0]) is int
+
+    stringified = Columns({"x": np.arange(3), "y": np.array([0.5, 1.5, 2.5])}, True)
+    assert stringified.columns == {"x": ["0", "1", "2"], "y": ["0.5", "1.5", "2.5"]}
+
+    renderer = MustacheRenderer.from_template("{{#rows}}{{x}}={{y}} {{/rows}}")
+    assert renderer.render({"rows": columns}) == "0=0.5 1=1.5 2=2.5 "
+
+
+def test_columns_constant_memory() -> None:
+    renderer = MustacheRenderer.from_template("{{#rows}}{{id}},{{price}}\n{{/rows}}")
+    n = 20_000
+    columns: t.Dict[str, t.Sequence[t.Any]] = {
+        "id": array.array("q", range(n)),
+        "price": array.array("d", (i / 4 for i in range(n))),
+    }
+
+    tracemalloc.start()
+    try:
+        num_chars = sum(
+            len(chunk) for chunk in renderer.render_iter({"rows": Columns(columns)})
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert num_chars > n
+    # Rows are built one at a time, a list of row dicts would take ~5MB
+    assert peak < 1_500_000
+
+
+def test_escape_memo() -> None:
+    renderer = MustacheRenderer.from_template("{{#items}}{{.}}|{{{.}}};{{/items}}")
+    data = {"items": ["<a>", "b&c", "<a>", 1, True]}
+    expected = renderer.render(data)
+
+    memo = EscapeMemo()
+    assert memo.stringify is str
+    assert renderer.render(data, memo.stringify, memo.html_escape) == expected
+    assert renderer.render(data, memo.stringify, memo.html_escape) == expected
+    # Four distinct strings to escape, all hits on the second render
+    assert memo.info() == CacheInfo(hits=6, misses=4, maxsize=4096, currsize=4)
+
+    memo.clear()
+    assert memo.info() == CacheInfo(hits=0, misses=0, maxsize=4096, currsize=0)
+
+    off = EscapeMemo(maxsize=0)
+    assert off.html_escape is html_escape
+    assert renderer.render(data, off.stringify, off.html_escape) == expected
+    assert off.info() == CacheInfo(hits=0, misses=0, maxsize=0, currsize=0)
+
+    with pytest.raises(ValueError):
+        EscapeMemo(maxsize=-1)
+
+
+def test_escape_memo_custom_stringify() -> None:
+    calls: t.List[t.Any] = []
+
+    def stringify(value: t.Any) -> str:
+        calls.append(value)
+        return repr(value)
+
+    memo = EscapeMemo(stringify, maxsize=2)
+    renderer = MustacheRenderer.from_template("{{#items}}{{.}} {{/items}}")
+    data = {"items": [1, True, 1, 0.0, -0.0, [1], "s", "s"]}
+
+    assert (
+        renderer.render(data, memo.stringify, memo.html_escape)
+        == "1 True 1 0.0 -0.0 [1] 's' 's' "
+    )
+    # 1 and True are told apart, floats and lists aren't memoized
+    assert calls == [1, True, 0.0, -0.0, [1], "s"]
+
+
+@pytest.mark.parametrize("renderer_cls", [MustacheRenderer, BytecodeMustacheRenderer])
+def test_batched_escaping(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template("{{#items}}<{{.}}|{{{.}}}>{{/items}}")
+    items = ["a", 'b&"c"', "", None, 7, "<\0>", "\0"] + [f"<{i}>" for i in range(600)]
+    data = {"items": items}
+
+    def escape_each(value: str) -> str:
+        return html_escape(value)
+
+    # The built-in escaper is batched, other escapers run per value
+    expected = renderer.render(data, str, escape_each)
+    assert renderer.render(data) == expected
+    assert expected.startswith('<a|a><b&amp;&quot;c&quot;|b&"c"><|><|>')
+    assert "<&lt;\0&gt;|<\0>><\0|\0>" in expected
+    assert "".join(renderer.render_iter(data, chunk_size=50)) == expected
+    assert renderer.render({"items": ["x"] * 600}) == "<x|x>" * 600
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_render_bytes(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(
+        "<h1>Café {{title}}</h1>{{#rows}}<p>{{name}} – {{{raw}}}</p>\n{{/rows}}"
+        "{{^rows}}none{{/rows}}{{>foot}}",
+        {"foot": "  {{>missing}}© {{year}}"},
+    )
+    data = {
+        "title": "<Ünïcode>",
+        "rows": [{"name": "a&b", "raw": "<i>"}, {"name": None, "raw": ""}],
+        "year": 2025,
+    }
+
+    expected = renderer.render(data).encode()
+    assert renderer.render_bytes(data) == expected
+    assert renderer.render_bytes(data) == expected
+    assert renderer.render_bytes({}) == "<h1>Café </h1>none  © ".encode()
+    assert renderer.render_bytes(data, repr, str.upper) == (
+        renderer.render(data, repr, str.upper).encode()
+    )
+
+
+def test_render_to_fd(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    renderer = MustacheRenderer.from_template("{{#rows}}<li>{{.}} ✓</li>\n{{/rows}}")
+    data = {"rows": list(range(1000))}
+    expected = renderer.render_bytes(data)
+
+    path = tmp_path / "out.html"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        assert renderer.render_to_fd(fd, data, chunk_size=100) == len(expected)
+        assert renderer.render_to_fd(fd, {}) == 0
+
+        # Short writes are retried until everything is written
+        write = os.write
+        monkeypatch.setattr(os, "write", lambda fd, data: write(fd, data[:7]))
+        assert renderer.render_to_fd(fd, data) == len(expected)
+    finally:
+        os.close(fd)
+
+    assert path.read_bytes() == expected * 2
+
+    with pytest.raises(ValueError):
+        renderer.render_to_fd(0, data, chunk_size=0)
@@ -0,0 +1,168 @@
+import copy
+import random
+import typing as t
+
+import pytest
+
+from mystace import (
+    BytecodeMustacheRenderer,
+    Columns,
+    CompiledMustacheRenderer,
+    MustacheRenderer,
+    RenderSession,
+)
+
+TEMPLATE = (
+    "<h1>{{title}}</h1>\n"
+    "{{#stats}}cpu {{cpu}}% mem {{mem.used}}/{{mem.total}}{{/stats}}\n"
+    "{{^rows}}no rows{{/rows}}\n"
+    "{{#rows}}\n"
+    "  <li>{{name}} {{title}}{{^ok}} !{{/ok}}{{#tags}}[{{.}}]{{/tags}}</li>\n"
+    "{{/rows}}\n"
+    "{{>footer}}\n"
+)
+PARTIALS = {"footer": "{{#stats}}{{{raw}}} {{rows.0.name}}{{/stats}}"}
+
+
+def make_data() -> t.Dict[str, t.Any]:
+    return {
+        "title": "<Dash>",
+        "raw": "<b>",
+        "stats": {"cpu": 10, "mem": {"used": 1, "total": 4}},
+        "rows": [
+            {"name": "a", "ok": True, "tags": ["x", "y"]},
+            {"name": "b", "title": "own", "ok": False, "tags": []},
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+)
+def test_updates(renderer_cls: t.Type[MustacheRenderer]) -> None:
+    renderer = renderer_cls.from_template(TEMPLATE, PARTIALS)
+    data = make_data()
+    session = renderer.render_session(data)
+    assert isinstance(session, RenderSession)
+    assert session.output == renderer.render(data)
+
+    def update(*changed: t.Any) -> None:
+        assert session.update(changed) == renderer.render(data)
+        assert session.output == renderer.render(data)
+
+    data["stats"]["cpu"] = 20
+    update("stats.cpu")
+    data["stats"]["mem"] = {"used": 2, "total": 4}
+    update("stats.mem")
+    data["title"] = "&"
+    update("title")
+    # Names added to an inner scope shadow the outer ones
+    data["rows"][0]["title"] = "shadow"
+    update(("rows", 0, "title"))
+    data["rows"][1] = {"name": "c", "ok": True, "tags": [1]}
+    update("rows.1")
+    data["rows"][1]["tags"].append(2)
+    update("rows.1.tags")
+    data["rows"].append({"name": "d"})
+    update("rows")
+    data["rows"] = []
+    data["raw"] = "<i>"
+    update("rows", "raw")
+    data["stats"] = None
+    update("stats")
+    update(".")
+    update()
+
+
+def test_new_data() -> None:
+    renderer = MustacheRenderer.from_template(TEMPLATE, PARTIALS)
+    data = make_data()
+    session = renderer.render_session(data)
+
+    new_data = make_data()
+    new_data["rows"][0] = {"name": "z", "ok": False, "tags": []}
+    assert session.update(["rows.0"], new_data) == renderer.render(new_data)
+    assert session.data is new_data
+
+    # Scopes are looked up again from the new data
+    new_data = copy.deepcopy(new_data)
+    new_data["rows"][0]["name"] = "y"
+    assert session.update(["rows.0.name"], new_data) == renderer.render(new_data)
+
+
+def test_updates_are_local() -> None:
+    renderer = MustacheRenderer.from_template(TEMPLATE, PARTIALS)
+    data = make_data()
+    data["rows"] = Columns(
+        {"name": list(range(100)), "ok": [True] * 100, "tags": [[]] * 100}
+    )
+    stringified: t.List[t.Any] = []
+
+    def stringify(value: t.Any) -> str:
+        stringified.append(value)
+        return str(value)
+
+    session = renderer.render_session(data, stringify)
+    assert session.output == renderer.render(data)
+
+    stringified.clear()
+    data["stats"]["cpu"] = 99
+    session.update(["stats.cpu"])
+    assert stringified == [99]
+    assert session.output == renderer.render(data)
+
+    # A change inside a list item doesn't render the list again
+    stringified.clear()
+    data["rows"].columns["name"][50] = "fifty"
+    session.update(["rows.50.name"])
+    assert stringified == ["fifty"]
+    assert session.output == renderer.render(data)
+
+    stringified.clear()
+    session.update(["missing", "stats.unused"])
+    assert stringified == []
+
+
+def test_random_updates() -> None:
+    rng = random.Random(0)
+    renderer = MustacheRenderer.from_template(TEMPLATE, PARTIALS)
+    values: t.List[t.Any] = [None, False, True, 0, 1, "", "<v>", [], [{}], {"cpu": 5}]
+
+    def random_value() -> t.Any:
+        if rng.random() < 0.3:
+            return {
+                "name": copy.deepcopy(rng.choice(values)),
+                "ok": copy.deepcopy(rng.choice(values)),
+                "tags": copy.deepcopy(rng.choice([[], ["t"], [1, 2]])),
+            }
+        # Copied so that no value is reachable by two paths
+        return copy.deepcopy(rng.choice(values))
+
+    for _ in range(20):
+        data = make_data()
+        session = renderer.render_session(data)
+
+        for _ in range(20):
+            changed = []
+            for _ in range(rng.randint(1, 3)):
+                rows = data["rows"]
+                if isinstance(rows, list) and rows and rng.random() < 0.5:
+                    index = rng.randrange(len(rows))
+                    if isinstance(rows[index], dict) and rng.random() < 0.5:
+                        key = rng.choice(["name", "ok", "tags", "title"])
+                        rows[index][key] = random_value()
+                        changed.append(f"rows.{index}.{key}")
+                    else:
+                        rows[index] = random_value()
+                        changed.append(f"rows.{index}")
+                else:
+                    key = rng.choice(["title", "raw", "stats", "rows"])
+                    data[key] = (
+                        [random_value() for _ in range(rng.randint(0, 3))]
+                        if key == "rows"
+                        else random_value()
+                    )
+                    changed.append(key)
+
+            assert session.update(changed) == renderer.render(data)
@@ -14,7 +14,11 @@ from typing import Any
 
 import pytest
 
-from mystace import render_from_template
+from mystace import (
+    BytecodeMustacheRenderer,
+    CompiledMustacheRenderer,
+    MustacheRenderer,
+)
 
 # Files with features not yet fully implemented
 EXPECTED_FAIL_FILES = {
@@ -49,6 +53,12 @@ def spec_test_cases(datadir: Path) -> list[tuple[str, dict[str, Any], bool]]:
     return load_spec_tests(datadir)
 
 
+@pytest.mark.parametrize("inline_partials", [False, True], ids=["dynamic", "inlined"])
+@pytest.mark.parametrize(
+    "renderer_cls",
+    [MustacheRenderer, CompiledMustacheRenderer, BytecodeMustacheRenderer],
+    ids=["tree", "compiled", "bytecode"],
+)
 @pytest.mark.parametrize(
     "test_id,test_case,should_xfail",
     [
@@ -57,17 +67,21 @@ def spec_test_cases(datadir: Path) -> list[tuple[str, dict[str, Any], bool]]:
     ],
 )
 def test_mustache_spec(
-    test_id: str, test_case: dict[str, Any], should_xfail: bool
+    test_id: str,
+    test_case: dict[str, Any],
+    should_xfail: bool,
+    renderer_cls: type[MustacheRenderer],
+    inline_partials: bool,
 ) -> None:
     """Test individual mustache spec cases."""
     if should_xfail:
         pytest.xfail(f"Feature not yet implemented: {test_id}")
 
-    result = render_from_template(
+    result = renderer_cls.from_template(
         test_case["template"],
-        test_case["data"],
-        partials=test_case.get("partials", None),
-    )
+        test_case.get("partials", None),
+        inline_partials=inline_partials,
+    ).render(test_case["data"])
 
     assert result == test_case["expected"], (
         f"\nTemplate: {test_case['template']!r}\n"
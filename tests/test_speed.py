@@ -3,6 +3,7 @@
 
 import copy
 import cProfile
+import dataclasses
 import math
 import os
 import random
@@ -17,6 +18,7 @@ from faker import Faker
 from typing_extensions import assert_never
 
 import mystace
+from mystace.util import html_escape
 
 RenderFunctionT = t.Literal[
     "mystace",
@@ -26,6 +28,8 @@ RenderFunctionT = t.Literal[
     "pystache",
     "mstache",
     "mystace-full",
+    "mystace-compiled",
+    "mystace-bytecode",
 ]
 TestCaseT = t.Tuple[str, t.Dict[str, t.Any]]
 TestCaseGeneratorT = t.Callable[[int], TestCaseT]
@@ -57,6 +61,20 @@ def generate_test_case_simple_sections(n: int) -> TestCaseT:
     return template, data
 
 
+def generate_test_case_static_literals(n: int) -> TestCaseT:
+    """Mostly static HTML with a few variables, comments and a static section."""
+    lines = [f'<li class="item">Static line {i}</li>\n' for i in range(n)]
+    template = (
+        "<header>{{title}}</header>\n"
+        + "".join(lines)
+        + "{{! footer }}\n{{#show_footer}}\n"
+        + "".join(lines)
+        + "{{/show_footer}}\n<footer>{{title}}</footer>\n"
+    )
+    data = {"title": "Static page", "show_footer": True}
+    return template, data
+
+
 def generate_test_case_nested(n: int) -> TestCaseT:
     fake = Faker()
 
@@ -331,6 +349,16 @@ def _run_benchmark(
 
         def render_function(_, obj):
             return renderer.render(obj)
+    elif render_function_name == "mystace-compiled":
+        compiled_renderer = mystace.CompiledMustacheRenderer.from_template(template)
+
+        def render_function(_, obj):
+            return compiled_renderer.render(obj)
+    elif render_function_name == "mystace-bytecode":
+        bytecode_renderer = mystace.BytecodeMustacheRenderer.from_template(template)
+
+        def render_function(_, obj):
+            return bytecode_renderer.render(obj)
     elif render_function_name == "mystace-full":
         render_function = mystace.render_from_template
     elif render_function_name == "chevron":
@@ -386,6 +414,7 @@ def _run_benchmark(
         generate_test_case_random(1),
         generate_test_case_simple_variables,
         generate_test_case_simple_sections,
+        generate_test_case_static_literals,
     ],
 )
 @pytest.mark.parametrize("render_function_name", t.get_args(RenderFunctionT))
@@ -402,3 +431,554 @@ def test_large(
     benchmark.group = test_case_generator.__name__.replace("generate_test_case_", "")
 
     _run_benchmark(render_function_name, test_case_generator, n, benchmark, request)
+
+
+@pytest.mark.parametrize("render_mode", ["render", "render_iter"])
+def test_time_to_first_chunk(render_mode: str, benchmark: t.Any) -> None:
+    """Benchmark how long it takes before the first output is available."""
+    template = "{{#rows}}<tr><td>{{id}}</td><td>{{name}}</td></tr>\n{{/rows}}"
+    data = {"rows": [{"id": i, "name": f"row {i}"} for i in range(20_000)]}
+    renderer = mystace.MustacheRenderer.from_template(template)
+
+    benchmark.group = "time_to_first_chunk"
+
+    if render_mode == "render":
+        benchmark(renderer.render, data)
+    else:
+        benchmark(lambda: next(renderer.render_iter(data)))
+
+
+@pytest.mark.parametrize(
+    "async_mode", ["gather_then_render", "render_async", "render_async_prefetch"]
+)
+def test_async_latency(async_mode: str, benchmark: t.Any) -> None:
+    """Benchmark async context values backed by services with latency."""
+    import asyncio
+
+    latency = 0.002
+
+    async def service(value: t.Any) -> t.Any:
+        await asyncio.sleep(latency)
+        return value
+
+    template = (
+        "{{profile.name}}{{#flags.recommendations}}"
+        "{{#recommendations}}<li>{{title}}</li>{{/recommendations}}"
+        "{{/flags.recommendations}}{{#settings}}{{theme}}{{/settings}}"
+    )
+    renderer = mystace.MustacheRenderer.from_template(template)
+
+    def make_data() -> t.Dict[str, t.Any]:
+        return {
+            "profile": service({"name": "Ann"}),
+            "flags": service({"recommendations": False}),
+            "recommendations": service([{"title": f"item {i}"} for i in range(50)]),
+            "settings": service({"theme": "dark"}),
+        }
+
+    async def gather_then_render() -> str:
+        data = make_data()
+        values = await asyncio.gather(*data.values())
+        return renderer.render(dict(zip(data.keys(), values)))
+
+    async def render_async(prefetch: bool) -> str:
+        data = make_data()
+        res = await renderer.render_async(data, prefetch=prefetch)
+        # Close the unused coroutine to avoid "never awaited" warnings
+        data["recommendations"].close()
+        return res
+
+    benchmark.group = "async_latency"
+
+    if async_mode == "gather_then_render":
+        benchmark(lambda: asyncio.run(gather_then_render()))
+    else:
+        prefetch = async_mode == "render_async_prefetch"
+        benchmark(lambda: asyncio.run(render_async(prefetch)))
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled"])
+@pytest.mark.parametrize("batch_mode", ["render_loop", "render_many"])
+def test_batch_overhead(engine: str, batch_mode: str, benchmark: t.Any) -> None:
+    """Benchmark per-item overhead of rendering one template over many contexts."""
+    template = "Dear {{name}},\nyour order {{order.id}} has shipped.\n"
+    datas = [{"name": f"user {i}", "order": {"id": i}} for i in range(10_000)]
+
+    renderer_cls = (
+        mystace.CompiledMustacheRenderer
+        if engine == "mystace-compiled"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template(template)
+
+    benchmark.group = f"batch_overhead-{engine}"
+
+    if batch_mode == "render_loop":
+        benchmark(lambda: [renderer.render(data) for data in datas])
+    else:
+        benchmark(renderer.render_many, datas)
+
+
+@pytest.mark.parametrize("max_workers", [0, 1, 2, 4, 8])
+def test_parallel_scaling(max_workers: int, benchmark: t.Any) -> None:
+    """
+    Benchmark batch rendering across worker processes. Zero workers is the
+    serial render_many baseline. The pool is started once outside the timed
+    section, so this measures per-batch serialisation against parallel gain.
+    """
+    template = (
+        "<h1>{{title}}</h1>\n{{#rows}}<tr><td>{{id}}</td><td>{{name}}</td></tr>\n"
+        "{{/rows}}"
+    )
+    datas = [
+        {"title": f"doc {i}", "rows": [{"id": j, "name": f"r{j}"} for j in range(20)]}
+        for i in range(5_000)
+    ]
+    renderer = mystace.MustacheRenderer.from_template(template)
+
+    benchmark.group = "parallel_scaling"
+
+    if max_workers == 0:
+        benchmark(renderer.render_many, datas)
+        return
+
+    with mystace.ParallelRenderer(renderer, max_workers=max_workers) as pool:
+        # Warm up the workers so process startup isn't timed
+        list(pool.render_many(datas[:max_workers]))
+        benchmark(lambda: list(pool.render_many(datas)))
+
+
+@pytest.mark.parametrize("load_mode", ["from_template", "loads"])
+def test_load_time(load_mode: str, benchmark: t.Any) -> None:
+    """Benchmark loading a serialized renderer against parsing the template."""
+    template, _ = generate_test_case_random(1)(1_000)
+    serialized = mystace.MustacheRenderer.from_template(template).dumps()
+
+    benchmark.group = "load_time"
+
+    if load_mode == "from_template":
+        benchmark(mystace.MustacheRenderer.from_template, template)
+    else:
+        benchmark(mystace.MustacheRenderer.loads, serialized, template)
+
+
+@pytest.mark.parametrize("num_partials", [0, 10, 100, 400])
+@pytest.mark.parametrize("construction_mode", ["lazy", "validate"])
+def test_construction_unused_partials(
+    construction_mode: str, num_partials: int, benchmark: t.Any
+) -> None:
+    """
+    Benchmark renderer construction against the number of partials the
+    template never uses. "validate" parses all of them up front.
+    """
+    partial = "<div>{{#items}}<span>{{name}}</span>{{/items}}</div>\n" * 10
+    partials = {f"partial_{i}": partial for i in range(num_partials)}
+    partials["used"] = partial
+    template = "<body>{{>used}}</body>"
+
+    benchmark.group = f"construction_unused_partials-{construction_mode}"
+
+    if construction_mode == "lazy":
+        benchmark(mystace.MustacheRenderer.from_template, template, partials)
+    else:
+        benchmark(
+            lambda: mystace.MustacheRenderer.from_template(
+                template, partials
+            ).validate()
+        )
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled"])
+@pytest.mark.parametrize("partial_mode", ["dynamic", "inlined"])
+def test_nested_partials(engine: str, partial_mode: str, benchmark: t.Any) -> None:
+    """Benchmark a page built from layout partials nested four levels deep."""
+    partials = {
+        "layout": "<html>\n  {{>header}}\n  {{>content}}\n  {{>footer}}\n</html>\n",
+        "header": "<header>\n  {{>nav}}\n</header>\n",
+        "nav": "<ul>\n{{#links}}\n  {{>link}}\n{{/links}}\n</ul>\n",
+        "link": '<li><a href="{{url}}">{{title}}</a></li>\n',
+        "content": "{{#rows}}\n<p>{{text}}</p>\n{{/rows}}\n",
+        "footer": "<footer>\n  {{>nav}}\n</footer>\n",
+    }
+    data = {
+        "links": [{"url": f"/{i}", "title": f"link {i}"} for i in range(10)],
+        "rows": [{"text": f"row {i}"} for i in range(20)],
+    }
+
+    renderer_cls = (
+        mystace.CompiledMustacheRenderer
+        if engine == "mystace-compiled"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template(
+        "{{>layout}}", partials, inline_partials=partial_mode == "inlined"
+    )
+
+    benchmark.group = f"nested_partials-{engine}"
+    benchmark(renderer.render, data)
+
+
+@pytest.mark.parametrize("indent", [0, 4, 16])
+def test_partial_indentation(indent: int, benchmark: t.Any) -> None:
+    """Benchmark a code generation style partial included at different depths."""
+    partials = {
+        "fields": "".join(
+            f"field_{i}: {{{{value_{i}}}}}\n  default: {i}\n" for i in range(500)
+        )
+    }
+    template = " " * indent + "{{>fields}}\n"
+    data = {f"value_{i}": i for i in range(500)}
+    renderer = mystace.MustacheRenderer.from_template(template, partials)
+
+    benchmark.group = "partial_indentation"
+    benchmark(renderer.render, data)
+
+
+@pytest.mark.parametrize("depth", [1, 10, 50, 200])
+def test_deep_nesting(depth: int, benchmark: t.Any) -> None:
+    """
+    Benchmark outer-scope and missing names looked up from sections nested
+    `depth` levels deep. The per-level time should stay flat as depth grows.
+    """
+    data: t.Dict[str, t.Any] = {"site": "example"}
+    curr = data
+    for i in range(depth):
+        curr["level"] = {"name": i}
+        curr = curr["level"]
+    # Stop the recursion, or the innermost lookup would find the parent level
+    curr["level"] = None
+
+    renderer = mystace.MustacheRenderer.from_template(
+        "{{>nest}}",
+        {"nest": "{{#level}}{{site}}{{missing}}{{name}}{{>nest}}{{/level}}"},
+    )
+
+    benchmark.group = "deep_nesting"
+    benchmark.extra_info["depth"] = depth
+    benchmark(renderer.render, data)
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled", "mystace-bytecode"])
+@pytest.mark.parametrize("lookup_mode", ["dynamic", "schema"])
+def test_schema_binding(engine: str, lookup_mode: str, benchmark: t.Any) -> None:
+    """Benchmark names looked up in outer scopes, with and without a schema."""
+    template = (
+        "{{#rows}}<tr>{{#cells}}<td>{{currency}}{{value}} ({{row_id}}/{{page}})"
+        "</td>{{/cells}}</tr>\n{{/rows}}"
+    )
+    schema = {
+        "page": int,
+        "currency": str,
+        "rows": [{"row_id": int, "cells": [{"value": float}]}],
+    }
+    data = {
+        "page": 1,
+        "currency": "$",
+        "rows": [
+            {"row_id": i, "cells": [{"value": j / 4} for j in range(10)]}
+            for i in range(100)
+        ],
+    }
+
+    renderer_cls = {
+        "mystace": mystace.MustacheRenderer,
+        "mystace-compiled": mystace.CompiledMustacheRenderer,
+        "mystace-bytecode": mystace.BytecodeMustacheRenderer,
+    }[engine]
+    renderer = renderer_cls.from_template(
+        template, schema=schema if lookup_mode == "schema" else None
+    )
+
+    benchmark.group = f"schema_binding-{engine}"
+    benchmark(renderer.render, data)
+
+
+@dataclasses.dataclass
+class _Order:
+    order_id: int
+    customer: str
+    total: float
+    items: t.List[str]
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled"])
+@pytest.mark.parametrize("data_mode", ["asdict", "dataclass"])
+def test_dataclass_context(engine: str, data_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark rendering straight from dataclasses against converting them
+    to dicts with `dataclasses.asdict` first.
+    """
+    template = (
+        "{{#orders}}<tr><td>{{order_id}}</td><td>{{customer}}</td>"
+        "<td>{{total}}</td><td>{{#items}}{{.}} {{/items}}</td></tr>\n{{/orders}}"
+    )
+    orders = [
+        _Order(i, f"customer {i}", i * 1.5, [f"item {j}" for j in range(3)])
+        for i in range(500)
+    ]
+
+    renderer_cls = (
+        mystace.CompiledMustacheRenderer
+        if engine == "mystace-compiled"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template(template)
+
+    def render_asdict() -> str:
+        return renderer.render({"orders": [dataclasses.asdict(o) for o in orders]})
+
+    def render_dataclass() -> str:
+        return renderer.render({"orders": orders})
+
+    assert render_asdict() == render_dataclass()
+
+    benchmark.group = f"dataclass_context-{engine}"
+    benchmark(render_asdict if data_mode == "asdict" else render_dataclass)
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled"])
+@pytest.mark.parametrize("table_mode", ["row_dicts", "columns", "columns_stringify"])
+def test_columnar_sections(engine: str, table_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark a table held as columns, rendered by building a dict per row
+    first or by iterating the columns directly. Building the rows or the
+    `Columns` is part of the timing.
+    """
+    import array
+
+    template = (
+        "{{#rows}}<tr><td>{{id}}</td><td>{{price}}</td><td>{{qty}}</td></tr>\n{{/rows}}"
+    )
+    n = 20_000
+    columns: t.Dict[str, t.Sequence[t.Any]] = {
+        "id": array.array("q", range(n)),
+        "price": array.array("d", (i / 8 for i in range(n))),
+        "qty": array.array("i", (i % 17 for i in range(n))),
+    }
+
+    renderer_cls = (
+        mystace.CompiledMustacheRenderer
+        if engine == "mystace-compiled"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template(template)
+
+    def render_row_dicts() -> str:
+        names = list(columns)
+        rows = [dict(zip(names, row)) for row in zip(*columns.values())]
+        return renderer.render({"rows": rows})
+
+    def render_columns() -> str:
+        return renderer.render({"rows": mystace.Columns(columns)})
+
+    def render_columns_stringify() -> str:
+        return renderer.render({"rows": mystace.Columns(columns, stringify=True)})
+
+    render_fn = {
+        "row_dicts": render_row_dicts,
+        "columns": render_columns,
+        "columns_stringify": render_columns_stringify,
+    }[table_mode]
+    assert render_fn() == render_row_dicts()
+
+    benchmark.group = f"columnar_sections-{engine}"
+    benchmark(render_fn)
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-compiled"])
+@pytest.mark.parametrize("memo_mode", ["off", "memo"])
+def test_escape_memo(engine: str, memo_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark escaping values drawn from a Zipf distribution over a few
+    thousand distinct labels, as on pages that keep showing the same names.
+    """
+    rng = random.Random(0)
+    labels = [f"Product <{i}> & sons, {'x' * (i % 30)}" for i in range(5000)]
+    weights = [1 / rank for rank in range(1, len(labels) + 1)]
+    data = {"rows": rng.choices(labels, weights, k=5000)}
+
+    renderer_cls = (
+        mystace.CompiledMustacheRenderer
+        if engine == "mystace-compiled"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template("{{#rows}}<li>{{.}}</li>\n{{/rows}}")
+    memo = mystace.EscapeMemo(maxsize=1024 if memo_mode == "memo" else 0)
+
+    assert renderer.render(data, memo.stringify, memo.html_escape) == renderer.render(
+        data
+    )
+
+    benchmark.group = f"escape_memo-{engine}"
+    benchmark(renderer.render, data, memo.stringify, memo.html_escape)
+    if memo_mode == "memo":
+        info = memo.info()
+        benchmark.extra_info["hit_rate"] = info.hits / (info.hits + info.misses)
+
+
+_OLD_ESCAPE_TABLE = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}
+)
+
+
+@pytest.mark.parametrize("engine", ["mystace", "mystace-bytecode"])
+@pytest.mark.parametrize("escape_mode", ["translate", "per_value", "batched"])
+def test_batched_escaping(engine: str, escape_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark the per-row cost of escaping table rows with a few short
+    fields, mostly with nothing to escape. "translate" is the previous
+    built-in escaper, "per_value" the current one called for each value.
+    """
+    num_rows = 5000
+    data = {
+        "rows": [
+            {
+                "id": i,
+                "name": f"user{i}",
+                "email": f"user{i}@example.com",
+                "note": "<b>" if i % 10 == 0 else "ok",
+            }
+            for i in range(num_rows)
+        ]
+    }
+
+    renderer_cls = (
+        mystace.BytecodeMustacheRenderer
+        if engine == "mystace-bytecode"
+        else mystace.MustacheRenderer
+    )
+    renderer = renderer_cls.from_template(
+        "{{#rows}}<tr><td>{{id}}</td><td>{{name}}</td>"
+        "<td>{{email}}</td><td>{{note}}</td></tr>\n{{/rows}}"
+    )
+
+    def translate_escape(s: str) -> str:
+        return s.translate(_OLD_ESCAPE_TABLE)
+
+    # Not the built-in escaper itself, so it's called for each value
+    def per_value_escape(s: str) -> str:
+        return html_escape(s)
+
+    escape_fn: t.Callable[[str], str]
+    if escape_mode == "translate":
+        escape_fn = translate_escape
+    elif escape_mode == "per_value":
+        escape_fn = per_value_escape
+    else:
+        escape_fn = html_escape
+
+    assert renderer.render(data, str, escape_fn) == renderer.render(data)
+
+    benchmark.group = f"batched_escaping-{engine}"
+    benchmark(renderer.render, data, str, escape_fn)
+    if benchmark.stats is not None:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info["ns_per_row"] = mean * 1e9 / num_rows
+
+
+@pytest.mark.parametrize("output_mode", ["encode", "render_bytes", "render_to_fd"])
+def test_bytes_output(output_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark producing UTF-8 for a literal-heavy page, by encoding the
+    result of `render` or rendering bytes directly.
+    """
+    renderer = mystace.MustacheRenderer.from_template(
+        '<html><head><meta charset="utf-8"><title>{{title}}</title></head><body>\n'
+        '{{#rows}}<div class="row"><span class="label">Name – Ünïcode</span>'
+        '<span class="value">{{name}}</span><a href="/users/{{id}}">profile</a>'
+        "</div>\n{{/rows}}<footer>© 2025</footer></body></html>"
+    )
+    data = {"title": "Users", "rows": [{"name": f"n{i}", "id": i} for i in range(5000)]}
+    fd = os.open(os.devnull, os.O_WRONLY)
+
+    def render_encode() -> bytes:
+        return renderer.render(data).encode()
+
+    def render_bytes() -> bytes:
+        return renderer.render_bytes(data)
+
+    def render_to_fd() -> None:
+        renderer.render_to_fd(fd, data)
+
+    render: t.Callable[[], t.Any]
+    if output_mode == "encode":
+        render = render_encode
+    elif output_mode == "render_bytes":
+        render = render_bytes
+    else:
+        render = render_to_fd
+
+    assert renderer.render_bytes(data) == renderer.render(data).encode()
+
+    benchmark.group = "bytes_output"
+    try:
+        benchmark(render)
+    finally:
+        os.close(fd)
+
+
+@pytest.mark.parametrize("size", [30_000, 300_000])
+@pytest.mark.parametrize("parse_mode", ["full", "incremental"])
+def test_edit_latency(size: int, parse_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark typing a character into a template, by parsing it again from
+    scratch or by editing it incrementally.
+    """
+    card = (
+        '<div class="card">\n  {{#user}}\n  <h2>{{name}}</h2>\n'
+        '  <p class="bio">{{bio}}</p>\n  {{> avatar}}\n'
+        "  {{^admin}}<span>regular user</span>{{/admin}}\n  {{/user}}\n"
+        '  <ul>\n  {{#items}}\n    <li><a href="{{url}}">{{title}}</a></li>\n'
+        "  {{/items}}\n  </ul>\n</div>\n"
+    )
+    source = "<html><body>\n" + card * (size // len(card)) + "</body></html>\n"
+    template = mystace.EditableTemplate(source)
+    offset = source.index("regular", len(source) // 2)
+
+    def edit() -> None:
+        if parse_mode == "full":
+            mystace.create_mustache_tree(source[:offset] + "x" + source[offset:])
+        else:
+            template.edit(offset, 0, "x")
+            template.edit(offset, 1, "")
+
+    benchmark.group = f"edit_latency-{size}"
+    benchmark(edit)
+
+
+@pytest.mark.parametrize("render_mode", ["render", "session"])
+def test_session_update(render_mode: str, benchmark: t.Any) -> None:
+    """
+    Benchmark a dashboard tick where a few values of a large page change,
+    rendering the page again or updating a render session.
+    """
+    renderer = mystace.MustacheRenderer.from_template(
+        "<html><body><h1>{{title}}</h1>\n"
+        "<p>cpu {{stats.cpu}}% mem {{stats.mem}} MB</p>\n<table>\n"
+        "{{#hosts}}<tr><td>{{name}}</td><td>{{status}}</td>"
+        "<td>{{load}}</td>{{^up}}<td>down</td>{{/up}}</tr>\n{{/hosts}}"
+        "</table></body></html>"
+    )
+    data: t.Dict[str, t.Any] = {
+        "title": "Hosts",
+        "stats": {"cpu": 0, "mem": 0},
+        "hosts": [
+            {"name": f"host{i}", "status": "ok", "load": 0.5, "up": True}
+            for i in range(2000)
+        ],
+    }
+    session = renderer.render_session(data)
+    ticks = iter(range(10**9))
+
+    def tick() -> str:
+        tick_num = next(ticks)
+        data["stats"]["cpu"] = tick_num % 100
+        data["hosts"][tick_num % 2000]["load"] = tick_num
+        if render_mode == "render":
+            return renderer.render(data)
+        return session.update(["stats.cpu", f"hosts.{tick_num % 2000}.load"])
+
+    assert tick() == renderer.render(data)
+
+    benchmark.group = "session_update"
+    benchmark(tick)